@@ -2,6 +2,7 @@
 Django settings for autoparts project.
 """
 import os
+import tempfile
 from pathlib import Path
 import dj_database_url
 from dotenv import load_dotenv
@@ -24,6 +25,10 @@ DEBUG = os.environ.get('DJANGO_DEBUG', 'False').lower() == 'true'
 
 ALLOWED_HOSTS = ['*']  # Allow all hosts during development
 
+# Route the read-heavy views (dashboard, listings, receipts, product API) to
+# their async versions; use with an ASGI server (see README, "Async deployment")
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False').lower() == 'true'
+
 # Configure CSRF trusted origins for secure form submissions
 CSRF_TRUSTED_ORIGINS = ['https://*.onrender.com', 'http://localhost:8080', 'http://127.0.0.1:8080']
 
@@ -59,6 +64,8 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Per-request timings and /health/metrics/ (see inventory/metrics.py)
+    'inventory.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,7 +78,8 @@ ROOT_URLCONF = 'autoparts.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django templates with render times recorded per template
+        'BACKEND': 'inventory.metrics.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -133,6 +141,11 @@ else:
             # Slightly increase timeout for potential disk latency on first mount
             'OPTIONS': {
                 'timeout': 20,
+                # Writers take the lock when their transaction starts, so concurrent
+                # checkouts queue on the busy timeout instead of failing with
+                # "database is locked"; WAL lets reads proceed during writes.
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
             },
         }
     }
@@ -186,8 +199,9 @@ MEDIA_ROOT = BASE_DIR / "media"
 # Whitenoise configuration for static files
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-# Update middleware to include WhiteNoise
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+# Update middleware to include WhiteNoise (an async-capable subclass for async views)
+MIDDLEWARE.insert(1, 'inventory.staticfiles.AsyncWhiteNoiseMiddleware' if ASYNC_VIEWS
+                  else 'whitenoise.middleware.WhiteNoiseMiddleware')
 
 # Cloudinary / media storage configuration (use only when env vars provided)
 if (os.environ.get('CLOUDINARY_CLOUD_NAME') and os.environ.get('CLOUDINARY_API_KEY')
@@ -208,6 +222,30 @@ else:
     # You can keep the default FileSystemStorage for media files
 
 
+# Caches
+# The `firestore` alias backs the read-through cache in inventory.firestore_repo.
+# It defaults to a file-based cache so all gunicorn workers on an instance share
+# entries and invalidations; point FIRESTORE_CACHE_BACKEND/LOCATION at a
+# database or Redis cache to share it across instances.
+FIRESTORE_CACHE_ALIAS = 'firestore'
+FIRESTORE_CACHE_TTL = int(os.environ.get('FIRESTORE_CACHE_TTL', '60'))
+# Listings larger than this many documents are not cached (bounds memory/disk)
+FIRESTORE_CACHE_MAX_DOCS = int(os.environ.get('FIRESTORE_CACHE_MAX_DOCS', '5000'))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'firestore': {
+        'BACKEND': os.environ.get('FIRESTORE_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('FIRESTORE_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'autoparts-firestore-cache')),
+        'TIMEOUT': FIRESTORE_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('FIRESTORE_CACHE_MAX_ENTRIES', '300')),
+        },
+    },
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,6 @@
+"""Development-only helpers: test doubles for the test suite and the load-test harness.
+
+Lives outside the ``inventory`` app so nothing in it ships with or is imported
+by the application. ``manage.py loadtest --fake-firestore`` loads it from a
+source checkout and refuses to run without it.
+"""
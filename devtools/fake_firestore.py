@@ -0,0 +1,407 @@
+"""In-process stand-in for the subset of google.cloud.firestore the app uses.
+
+Lets tests and load tests exercise the Firestore code paths
+(mirroring, system-of-record stock reservation, listings) without network
+access or credentials. Documents live in a dict keyed by path; every RPC-like
+call is counted in ``FakeFirestoreClient.calls``. Set ``delay`` (seconds) or
+``fail`` (an exception) on the client to simulate a slow or failing backend,
+or map document paths to exceptions in ``reject`` to make any batch writing
+those documents fail.
+
+    from devtools import fake_firestore
+
+    with fake_firestore.install() as db:
+        ...  # get_firestore_client() now returns ``db``
+"""
+import contextlib
+import copy
+import os
+import sys
+import threading
+import time
+import uuid
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+DELETE_FIELD = object()
+
+
+class Query:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+
+def _apply(target, data):
+    for key, value in data.items():
+        parts = key.split('.')
+        node = target
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        leaf = parts[-1]
+        if value is DELETE_FIELD:
+            node.pop(leaf, None)
+        elif isinstance(value, Increment):
+            node[leaf] = (node.get(leaf) or 0) + value.value
+        else:
+            node[leaf] = copy.deepcopy(value)
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        elif value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, Increment):
+            target[key] = (target.get(key) or 0) + value.value
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class Snapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = copy.deepcopy(data) if data is not None else None
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return CollectionReference(self._client, f'{self.path}/{name}')
+
+    def get(self, transaction=None, timeout=None, **kwargs):
+        self._client._tick('get')
+        return Snapshot(self, self._client._docs.get(self.path))
+
+    def set(self, data, merge=False, timeout=None, **kwargs):
+        self._client._tick('set')
+        self._client._write(self.path, data, merge)
+
+    def update(self, data, timeout=None, **kwargs):
+        self._client._tick('update')
+        self._client._update(self.path, data)
+
+    def delete(self, timeout=None, **kwargs):
+        self._client._tick('delete')
+        self._client._docs.pop(self.path, None)
+
+
+class _Query:
+    def __init__(self, client, path, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._client = client
+        self._path = path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **kw):
+        args = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                    start_after=self._start_after, fields=self._fields)
+        args.update(kw)
+        return _Query(self._client, self._path, **args)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction=None):
+        return self._copy(orders=self._orders + [(field, direction or Query.ASCENDING)])
+
+    def limit(self, n):
+        return self._copy(limit=n)
+
+    def start_after(self, values):
+        return self._copy(start_after=values)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            current = data.get(field)
+            if op == 'in':
+                if current not in value:
+                    return False
+                continue
+            if current is None:
+                return False
+            try:
+                ok = {
+                    '==': current == value, '>': current > value, '>=': current >= value,
+                    '<': current < value, '<=': current <= value, '!=': current != value,
+                }[op]
+            except TypeError:
+                return False
+            if not ok:
+                return False
+        return True
+
+    def _key(self, snap):
+        data = snap._data
+        key = []
+        for field, direction in self._orders:
+            value = snap.id if field == '__name__' else data.get(field)
+            key.append(value)
+        return key
+
+    def _results(self):
+        prefix = self._path + '/'
+        depth = self._path.count('/') + 1
+        snaps = []
+        for path, data in sorted(self._client._docs.items()):
+            if path.startswith(prefix) and path.count('/') == depth and self._matches(data):
+                snaps.append(Snapshot(DocumentReference(self._client, path), data))
+        for field, direction in reversed(self._orders):
+            snaps.sort(key=lambda s, f=field: (s.id if f == '__name__' else s._data.get(f)) is None)
+            snaps.sort(key=lambda s, f=field: _sortable(s.id if f == '__name__' else s._data.get(f)),
+                       reverse=direction == Query.DESCENDING)
+        if self._start_after is not None:
+            cursor = self._start_after
+            if isinstance(cursor, Snapshot):
+                cursor_key = self._key(cursor)
+            else:
+                cursor_key = [cursor.get(f) if f != '__name__' else cursor.get('__name__') for f, _ in self._orders]
+            directions = [d for _, d in self._orders]
+
+            def after(snap):
+                for value, cur, direction in zip(self._key(snap), cursor_key, directions):
+                    if cur is None:
+                        continue
+                    if _sortable(value) == _sortable(cur):
+                        continue
+                    greater = _sortable(value) > _sortable(cur)
+                    return greater if direction != Query.DESCENDING else not greater
+                return False
+            snaps = [s for s in snaps if after(s)]
+        if self._limit is not None:
+            snaps = snaps[:self._limit]
+        if self._fields is not None:
+            for s in snaps:
+                s._data = {k: v for k, v in s._data.items() if k in self._fields}
+        return snaps
+
+    def stream(self, transaction=None, timeout=None, **kwargs):
+        self._client._tick('query')
+        return iter(self._results())
+
+    def count(self, alias=None):
+        return AggregateQuery(self).count(alias)
+
+    def sum(self, field, alias=None):
+        return AggregateQuery(self).sum(field, alias)
+
+    def get(self, transaction=None, timeout=None, **kwargs):
+        return list(self.stream())
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class AggregateQuery:
+    """count()/sum() aggregations, evaluated without returning documents."""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append((alias or f'field_{len(self._aggregations) + 1}', None))
+        return self
+
+    def sum(self, field, alias=None):
+        self._aggregations.append((alias or f'field_{len(self._aggregations) + 1}', field))
+        return self
+
+    def get(self, transaction=None, timeout=None, **kwargs):
+        self._query._client._tick('aggregate')
+        snaps = self._query._results()
+        results = []
+        for alias, field in self._aggregations:
+            if field is None:
+                value = len(snaps)
+            else:
+                value = sum(v for v in (s._data.get(field) for s in snaps)
+                            if isinstance(v, (int, float)) and not isinstance(v, bool))
+            results.append(AggregationResult(alias, value))
+        return [results]
+
+
+def _sortable(value):
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    return (3, str(value))
+
+
+class CollectionReference(_Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, f'{self._path}/{doc_id or uuid.uuid4().hex[:20]}')
+
+    def add(self, data, timeout=None, **kwargs):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(('set', ref.path, data, merge))
+
+    def update(self, ref, data):
+        self._ops.append(('update', ref.path, data, None))
+
+    def delete(self, ref):
+        self._ops.append(('delete', ref.path, None, None))
+
+    def __len__(self):
+        return len(self._ops)
+
+    def commit(self, timeout=None, **kwargs):
+        self._client._tick('commit')
+        if len(self._ops) > 500:
+            raise ValueError('too many writes in batch')
+        for _, path, _, _ in self._ops:
+            if path in self._client.reject:
+                raise self._client.reject[path]
+        with self._client._lock:
+            for op, path, data, merge in self._ops:
+                if op == 'set':
+                    self._client._write(path, data, merge)
+                elif op == 'update':
+                    self._client._update(path, data)
+                else:
+                    self._client._docs.pop(path, None)
+        self._ops = []
+        return []
+
+
+class Transaction(WriteBatch):
+    pass
+
+
+def transactional(fn):
+    def wrapper(tx, *args, **kwargs):
+        client = tx._client
+        with client._tx_lock:
+            tx._ops = []
+            result = fn(tx, *args, **kwargs)
+            tx.commit()
+            return result
+    return wrapper
+
+
+class FakeFirestoreClient:
+    def __init__(self):
+        self._docs = {}
+        self._lock = threading.RLock()
+        self._tx_lock = threading.RLock()
+        self.calls = {}
+        self.delay = 0.0
+        self.fail = None
+        self.reject = {}
+
+    def _tick(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail is not None:
+            raise self.fail
+
+    def _write(self, path, data, merge):
+        with self._lock:
+            if merge and path in self._docs:
+                _merge(self._docs[path], data)
+            else:
+                doc = {}
+                _merge(doc, data)
+                self._docs[path] = doc
+
+    def _update(self, path, data):
+        with self._lock:
+            if path not in self._docs:
+                raise KeyError(f'No document to update: {path}')
+            _apply(self._docs[path], data)
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def document(self, path):
+        return DocumentReference(self, path)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def get_all(self, refs, transaction=None, field_paths=None, **kwargs):
+        self._tick('get_all')
+        for ref in refs:
+            yield Snapshot(ref, self._docs.get(ref.path))
+
+
+@contextlib.contextmanager
+def install(client=None, sor=False):
+    """Route the app's Firestore access to a fake client for the duration of the block."""
+    from inventory import firebase, firestore_repo
+    from inventory.firebase import reset_firestore_breaker
+    from inventory.repositories import set_repository
+    from inventory.reservations import reset_firestore_coordinator
+
+    client = client or FakeFirestoreClient()
+    env = {'FIREBASE_ENABLED': 'true', 'FIREBASE_SOR': 'true' if sor else 'false'}
+    saved_env = {key: os.environ.get(key) for key in env}
+    saved_client, saved_module = dict(firebase._cached), firestore_repo.gcfirestore
+    os.environ.update(env)
+    firebase._cached.update(client=client, error=None)
+    firestore_repo.gcfirestore = sys.modules[__name__]
+    set_repository(None)
+    reset_firestore_breaker()
+    reset_firestore_coordinator()
+    try:
+        yield client
+    finally:
+        set_repository(None)
+        reset_firestore_breaker()
+        reset_firestore_coordinator()
+        firebase._cached.clear()
+        firebase._cached.update(saved_client)
+        firestore_repo.gcfirestore = saved_module
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
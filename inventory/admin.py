@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Product, Customer, Sale, SaleItem
+from .search import search_product_ids
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -7,6 +8,13 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('sku', 'name')
     list_filter = ('created_at',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains scans when available
+        ids = search_product_ids(search_term, limit=500) if search_term else None
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=ids), False
+
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ('name', 'phone', 'email', 'created_at')
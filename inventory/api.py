@@ -1,5 +1,15 @@
 from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
 from .models import Product
+from .repositories import CATALOG_FIELDS, get_repository
+from .search import PAGE_SIZE, search_products
+
+MAX_BATCH_IDS = 200
+# Column order of catalog snapshot rows
+SNAPSHOT_FIELDS = CATALOG_FIELDS
+
 
 def get_product_price(request, product_id):
     try:
@@ -11,4 +21,72 @@ def get_product_price(request, product_id):
             'available_qty': product.quantity
         })
     except Product.DoesNotExist:
-        return JsonResponse({'error': 'Product not found'}, status=404)
\ No newline at end of file
+        return JsonResponse({'error': 'Product not found'}, status=404)
+
+
+def _parse_ids(request):
+    ids = []
+    for raw in request.GET.getlist('ids'):
+        for part in raw.split(','):
+            part = part.strip()
+            if part.isdigit():
+                ids.append(int(part))
+    return list(dict.fromkeys(ids))
+
+
+def _price_entry(pid, name, price, qty):
+    return {'id': pid, 'name': name, 'selling_price': float(price or 0), 'available_qty': int(qty or 0)}
+
+
+def get_products_batch(request):
+    """Prices and availability for many products: /api/products/batch/?ids=1,2,3"""
+    ids = _parse_ids(request)
+    if len(ids) > MAX_BATCH_IDS:
+        return JsonResponse({'error': f'At most {MAX_BATCH_IDS} ids per request'}, status=400)
+    return _batch_response(ids, get_repository().get_products(ids))
+
+
+def _batch_response(ids, found):
+    products = {pid: _price_entry(pid, p.name, p.selling_price, p.quantity) for pid, p in found.items()}
+    return JsonResponse({
+        'products': {str(pid): entry for pid, entry in products.items()},
+        'missing': [pid for pid in ids if pid not in products],
+    })
+
+
+def product_search(request):
+    """Ranked typeahead search: /api/products/search/?q=brake pad&page=1&in_stock=1"""
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'page and page_size must be integers'}, status=400)
+    in_stock = request.GET.get('in_stock', '').lower() in ('1', 'true', 'on', 'yes')
+    return JsonResponse(search_products(request.GET.get('q', ''), page, page_size, in_stock))
+
+
+# ---------- Catalog snapshot ----------
+def _snapshot_etag(request):
+    version, rows = get_repository().catalog()
+    request._catalog_snapshot = (version, rows)
+    return version
+
+
+@condition(etag_func=_snapshot_etag)
+def catalog_snapshot(request):
+    """Compact price/stock table for client-side cart pricing.
+
+    Clients revalidate with If-None-Match and get 304 Not Modified while the
+    catalog is unchanged, so the POS page prices a cart with no per-row calls.
+    """
+    version, rows = getattr(request, '_catalog_snapshot', None) or get_repository().catalog()
+    if callable(rows):
+        rows = rows()
+    return _snapshot_response(version, rows)
+
+
+def _snapshot_response(version, rows):
+    response = JsonResponse({'version': version, 'fields': SNAPSHOT_FIELDS, 'products': rows})
+    # Cache, but always revalidate: the ETag makes that a cheap 304
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
 
 
+def _repair_search_triggers(sender, using='default', **kwargs):
+    from django.db import connections
+    from .search import repair_search_triggers
+    repair_search_triggers(connections[using])
+
+
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
@@ -8,6 +14,12 @@ class InventoryConfig(AppConfig):
     def ready(self):
         # Register system checks
         from . import checks  # noqa: F401
+        # Time every database statement for the request metrics
+        from . import metrics
+        metrics.install()
+        # SQLite loses the search triggers whenever a migration rebuilds the product table
+        from django.db.models.signals import post_migrate
+        post_migrate.connect(_repair_search_triggers, sender=self)
         # Register signals (e.g., Firebase logging)
         try:
             from . import signals  # noqa: F401
@@ -0,0 +1,120 @@
+"""Async versions of the read-heavy views, routed when ASYNC_VIEWS is on.
+
+Under an ASGI server (see README, "Async deployment") a request waiting on
+Firestore no longer holds a worker: remote repository calls run on the thread
+pool through ``repositories.acall`` while the event loop serves other
+requests, and reads that do not depend on each other are awaited together.
+Database access stays on each request's sync thread, as Django requires.
+Forms and the other write views remain synchronous.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, quote_etag
+
+from .api import MAX_BATCH_IDS, _batch_response, _parse_ids, _price_entry, _snapshot_response
+from .listings import listing_filters
+from .models import Sale
+from .receipts import receipt_etag, render_receipt, store_receipt, stored_receipt
+from .repositories import FallbackRepository, acall, get_repository
+from .views import _pager_urls, _receipt_response
+
+_repository = sync_to_async(get_repository)
+_render = sync_to_async(render)
+
+
+# ---------- Pages ----------
+async def dashboard(request):
+    repo = await _repository()
+    # Totals and recent sales are independent reads
+    context, recent_sales = await asyncio.gather(
+        acall(repo, 'inventory_summary'),
+        acall(repo, 'recent_sales', 5),
+    )
+    context['recent_sales'] = recent_sales
+    return await _render(request, 'inventory/dashboard.html', context)
+
+
+async def product_list(request):
+    filters = listing_filters(request.GET)
+    page = await acall(await _repository(), 'product_page', filters, request.GET.get('cursor'))
+    return await _render(request, 'inventory/product_list.html', {
+        'products': page,
+        'filters': filters,
+        **_pager_urls(request, page),
+    })
+
+
+async def customer_list(request):
+    filters = listing_filters(request.GET)
+    page = await acall(await _repository(), 'customer_page', filters, request.GET.get('cursor'))
+    return await _render(request, 'inventory/customer_list.html', {
+        'customers': page,
+        'filters': filters,
+        **_pager_urls(request, page),
+    })
+
+
+async def _find_sale(pk):
+    repo = await _repository()
+    if not isinstance(repo, FallbackRepository):
+        return await acall(repo, 'get_sale', pk)
+    # Ask both stores at once instead of waiting for the remote one to miss;
+    # the database copy wins because its receipt can be stored
+    remote, local = await asyncio.gather(
+        acall(repo.primary, 'get_sale', pk),
+        acall(repo.fallback, 'get_sale', pk),
+        return_exceptions=True,
+    )
+    if isinstance(local, BaseException):
+        raise local
+    return local if local is not None else (None if isinstance(remote, BaseException) else remote)
+
+
+async def sale_receipt(request, pk):
+    etag = receipt_etag(pk)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        return _receipt_response(request, etag, None)
+    html_gz = await sync_to_async(stored_receipt)(pk)
+    if html_gz is None:
+        sale = await _find_sale(pk)
+        if isinstance(sale, Sale):
+            html_gz = await sync_to_async(store_receipt)(sale)
+        elif sale:
+            html_gz = await sync_to_async(render_receipt, thread_sensitive=False)(sale)
+        else:
+            raise Http404('Sale not found')
+    return _receipt_response(request, etag, html_gz)
+
+
+# ---------- API ----------
+async def get_product_price(request, product_id):
+    found = await acall(await _repository(), 'get_products', [product_id])
+    product = found.get(product_id)
+    if product is None:
+        return JsonResponse({'error': 'Product not found'}, status=404)
+    return JsonResponse(_price_entry(product.id, product.name, product.selling_price, product.quantity))
+
+
+async def get_products_batch(request):
+    """Prices and availability for many products: /api/products/batch/?ids=1,2,3"""
+    ids = _parse_ids(request)
+    if len(ids) > MAX_BATCH_IDS:
+        return JsonResponse({'error': f'At most {MAX_BATCH_IDS} ids per request'}, status=400)
+    return _batch_response(ids, await acall(await _repository(), 'get_products', ids))
+
+
+async def catalog_snapshot(request):
+    """Catalog snapshot with the same ETag revalidation as ``api.catalog_snapshot``."""
+    version, rows = await acall(await _repository(), 'catalog')
+    etag = quote_etag(version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if callable(rows):
+            rows = await sync_to_async(rows)()
+        response = _snapshot_response(version, rows)
+    response.headers.setdefault('ETag', etag)
+    return response
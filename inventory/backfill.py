@@ -0,0 +1,172 @@
+"""Bulk Firestore backfill from the Django database.
+
+Rows are read with keyset iteration (``id > last_id``), so every page costs
+the same no matter how far the run has got. Each page becomes one Firestore
+batch write of up to 500 documents. Batches are committed concurrently on a
+thread pool. Progress is checkpointed to a JSON file as the highest id per
+collection below which every batch has committed, so an interrupted run can
+resume where it stopped.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .models import Customer, Product
+from .serializers import customer_doc, product_doc, sale_doc, sales_queryset
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 500  # Firestore maximum writes per batch
+RETRIES = 3
+
+Writes = List[Tuple[str, Dict[str, Any], bool]]
+
+
+def _products(last_id: int, size: int):
+    return Product.objects.filter(id__gt=last_id).order_by('id')[:size]
+
+
+def _customers(last_id: int, size: int):
+    return Customer.objects.filter(id__gt=last_id).order_by('id')[:size]
+
+
+def _sales(last_id: int, size: int):
+    return sales_queryset().filter(id__gt=last_id).order_by('id')[:size]
+
+
+# collection -> (page loader, document builder, merge)
+COLLECTIONS: Dict[str, Tuple[Callable[[int, int], Any], Callable[[Any], Dict[str, Any]], bool]] = {
+    'products': (_products, product_doc, True),
+    'customers': (_customers, customer_doc, True),
+    'sales': (_sales, sale_doc, False),
+}
+
+
+def iter_pages(collection: str, after_id: int = 0, size: int = BATCH_LIMIT) -> Iterator[Tuple[int, Writes]]:
+    """Yield (last id, [(path, document, merge)]) pages of a collection past ``after_id``."""
+    loader, build, merge = COLLECTIONS[collection]
+    while True:
+        rows = list(loader(after_id, size))
+        if not rows:
+            return
+        after_id = rows[-1].id
+        yield after_id, [(f'{collection}/{row.id}', build(row), merge) for row in rows]
+
+
+class Checkpoint:
+    """Last fully committed id per collection, persisted to a JSON file."""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done: Dict[str, int] = {}
+        if resume and os.path.exists(path):
+            with open(path) as fh:
+                self.done = {k: int(v) for k, v in json.load(fh).items()}
+
+    def get(self, collection: str) -> int:
+        return self.done.get(collection, 0)
+
+    def set(self, collection: str, last_id: int) -> None:
+        self.done[collection] = last_id
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(self.done, fh)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    """Thread-safe document counter reporting docs/sec at most every ``interval`` seconds."""
+
+    def __init__(self, report: Callable[[str], None], interval: float = 2.0):
+        self.report = report
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.docs = 0
+
+    def add(self, collection: str, count: int) -> None:
+        with self.lock:
+            self.docs += count
+            now = time.monotonic()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            self.report(f'{collection}: {self.docs} docs written, {self.rate():.0f} docs/sec')
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.docs / elapsed if elapsed > 0 else 0.0
+
+
+def _commit(db, writes: Writes) -> None:
+    for attempt in range(RETRIES + 1):
+        batch = db.batch()
+        for path, data, merge in writes:
+            batch.set(db.document(path), data, merge=merge)
+        try:
+            batch.commit()
+            return
+        except Exception as exc:
+            if attempt == RETRIES:
+                raise
+            logger.warning('Backfill batch failed (attempt %s): %s', attempt + 1, exc)
+            time.sleep(2 ** attempt)
+
+
+def backfill_collection(db, collection: str, checkpoint: Checkpoint, progress: Progress,
+                        workers: int = 8, batch_size: int = BATCH_LIMIT) -> int:
+    """Write every row of ``collection`` past the checkpoint. Returns documents written.
+
+    At most ``workers * 2`` batches are in flight, which bounds memory. The
+    checkpoint only advances over a contiguous prefix of committed batches.
+    """
+    batch_size = max(1, min(batch_size, BATCH_LIMIT))
+    in_flight: Dict[Any, Tuple[int, int]] = {}  # future -> (sequence, last id)
+    finished: Dict[int, int] = {}  # sequence -> last id, committed but not yet checkpointed
+    next_seq = 0  # next batch sequence the checkpoint is waiting for
+    written = 0
+    error: Optional[BaseException] = None
+
+    def drain(block_until: int) -> None:
+        nonlocal next_seq, error
+        while len(in_flight) > block_until:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                seq, last_id = in_flight.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    error = error or exc
+                    continue
+                finished[seq] = last_id
+        while next_seq in finished:
+            checkpoint.set(collection, finished.pop(next_seq))
+            next_seq += 1
+
+    def run(writes: Writes) -> None:
+        nonlocal written
+        _commit(db, writes)
+        with progress.lock:
+            written += len(writes)
+        progress.add(collection, len(writes))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'backfill-{collection}') as pool:
+        seq = 0
+        for last_id, writes in iter_pages(collection, checkpoint.get(collection), batch_size):
+            in_flight[pool.submit(run, writes)] = (seq, last_id)
+            seq += 1
+            drain(workers * 2 - 1)
+            if error is not None:
+                break
+        drain(0)
+    if error is not None:
+        raise error
+    return written
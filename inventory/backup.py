@@ -0,0 +1,377 @@
+"""Streaming, compressed, incremental database backups.
+
+A backup is a set of gzip-compressed JSON Lines chunks, one or more per model,
+plus a ``manifest.json``. Rows are streamed with ``QuerySet.iterator()``
+(server-side cursors on PostgreSQL), so memory stays flat whatever the size of
+the sales history, and each chunk is in Django's ``jsonl`` serialization
+format: ``manage.py loaddata`` reads the files as they are.
+
+Incremental backups dump only rows changed since the previous backup, using a
+watermark per model (``WATERMARKS``): ``updated_at`` for editable tables and
+the creation time for append-only ones. Other models are dumped whole every
+time: the small ones, and the daily rollups, which ``rebuild_rollups``
+re-creates under new primary keys. Each
+incremental starts ``overlap`` before the previous watermark so rows saved by
+transactions still open at that time are not missed (loaddata just overwrites
+them again). Deleted rows are not recorded, so take a full backup regularly.
+
+Chunks are written to a local work directory inside one read transaction,
+then uploaded through a ``BackupStorage`` on a small thread pool once it has
+ended, so no transaction stays open while the network is slow. They are
+deleted locally once uploaded. The manifest goes last and ``latest.json`` is
+only moved to it when every chunk made it, so a failed run never becomes the
+base of the next incremental.
+
+To restore, load the full backup and then each incremental after it, every
+one with the chunks in manifest order, in one loaddata call. ``restore_files``
+lists them, taking tables dumped whole from the last backup only:
+
+    python manage.py loaddata <chunk files...>
+"""
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 50000
+RETRIES = 3
+LATEST = 'latest.json'
+EXCLUDED = {'contenttypes.contenttype', 'auth.permission'}
+
+# Model label -> field (or lookup path) whose value only grows when a row changes
+WATERMARKS: Dict[str, str] = {
+    'inventory.product': 'updated_at',
+    'inventory.inventorystats': 'updated_at',
+    'inventory.sale': 'created_at',
+    'inventory.saleitem': 'sale__created_at',
+    'inventory.receipt': 'created_at',
+    'admin.logentry': 'action_time',
+}
+
+
+# ---------- Storage ----------
+class BackupStorage:
+    """Where backup files go. Names are relative, e.g. ``20250101_020000/manifest.json``."""
+
+    name = 'base'
+
+    def put(self, name: str, path: str) -> str:
+        """Store the local file ``path`` as ``name``; returns its location."""
+        raise NotImplementedError
+
+    def put_bytes(self, name: str, data: bytes) -> str:
+        with tempfile.NamedTemporaryFile(delete=False) as fh:
+            fh.write(data)
+        try:
+            return self.put(name, fh.name)
+        finally:
+            os.remove(fh.name)
+
+    def read(self, name: str) -> Optional[bytes]:
+        """Contents of ``name``, or None if it does not exist."""
+        raise NotImplementedError
+
+
+class LocalStorage(BackupStorage):
+    """A directory on the local filesystem (development, tests, mounted volumes)."""
+
+    name = 'local'
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, name, path):
+        target = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target + '.tmp')
+        os.replace(target + '.tmp', target)
+        return target
+
+    def read(self, name):
+        try:
+            with open(os.path.join(self.root, name), 'rb') as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+
+class CloudinaryStorage(BackupStorage):
+    """Raw uploads under ``prefix`` in Cloudinary (configured from CLOUDINARY_* variables)."""
+
+    name = 'cloudinary'
+
+    def __init__(self, prefix: str = 'backups'):
+        import cloudinary  # noqa: F401 - optional dependency, needed only here
+        self.prefix = prefix
+
+    def put(self, name, path):
+        import cloudinary.uploader
+        result = cloudinary.uploader.upload(
+            path, resource_type='raw', public_id=f'{self.prefix}/{name}', overwrite=True,
+            tags=['backup', 'database'],
+        )
+        return result['secure_url']
+
+    def read(self, name):
+        import cloudinary.api
+        from cloudinary.exceptions import NotFound
+        try:
+            # Versioned URL, so an overwritten latest.json is never served stale from the CDN
+            url = cloudinary.api.resource(f'{self.prefix}/{name}', resource_type='raw')['secure_url']
+        except NotFound:
+            return None
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.read()
+
+
+def get_storage(kind: Optional[str] = None, root: Optional[str] = None) -> BackupStorage:
+    """Storage from BACKUP_STORAGE (cloudinary or local; default cloudinary when configured) and BACKUP_DIR."""
+    kind = (kind or os.environ.get('BACKUP_STORAGE', '')).strip().lower()
+    if not kind:
+        kind = 'cloudinary' if os.environ.get('CLOUDINARY_CLOUD_NAME') else 'local'
+    if kind == 'local':
+        return LocalStorage(root or os.environ.get('BACKUP_DIR') or os.path.join(settings.BASE_DIR, 'backups'))
+    if kind == 'cloudinary':
+        return CloudinaryStorage()
+    raise ValueError(f'Unknown BACKUP_STORAGE {kind!r}; use cloudinary or local')
+
+
+# ---------- Dump ----------
+def backup_models() -> List[Any]:
+    """Models dumpdata would include (minus content types and permissions), dependencies first."""
+    app_list = {config: None for config in apps.get_app_configs() if config.models_module is not None}
+    models = serializers.sort_dependencies(app_list.items(), allow_cycles=True)
+    return [m for m in models if m._meta.label_lower not in EXCLUDED and m._meta.managed and not m._meta.proxy]
+
+
+def _watermark_value(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _since(previous: Optional[str], overlap: timedelta) -> Optional[datetime]:
+    return datetime.fromisoformat(previous) - overlap if previous is not None else None
+
+
+class Progress:
+    """Rows and bytes written so far, reported every few seconds."""
+
+    def __init__(self, write: Callable[[str], None], interval: float = 5.0):
+        self.write = write
+        self.interval = interval
+        self.started = self.last = time.monotonic()
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, rows: int, size: int) -> None:
+        self.rows += rows
+        self.bytes += size
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.write(f'  {self.rows} rows, {self.bytes / 1e6:.1f} MB compressed, '
+                       f'{self.rows / max(now - self.started, 1e-6):.0f} rows/sec')
+
+
+class _Counted:
+    """Iterator wrapper counting the rows the serializer consumed."""
+
+    def __init__(self, rows: Iterable):
+        self.rows = iter(rows)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self.rows)
+        self.count += 1
+        return row
+
+
+def _write_chunk(rows: Iterable, path: str) -> int:
+    counted = _Counted(rows)
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as fh:
+        serializers.serialize('jsonl', counted, stream=fh)
+    return counted.count
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Uploader:
+    """Uploads chunk files on a thread pool, at most ``2 * workers`` waiting at a time."""
+
+    def __init__(self, storage: BackupStorage, workers: int):
+        self.storage = storage
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backup-upload')
+        self.pending: Set[Future] = set()
+
+    def _upload(self, name: str, path: str) -> str:
+        try:
+            for attempt in range(1, RETRIES + 1):
+                try:
+                    return self.storage.put(name, path)
+                except Exception as exc:
+                    if attempt == RETRIES:
+                        raise
+                    logger.warning('Upload of %s failed (attempt %s): %s', name, attempt, exc)
+                    time.sleep(2 ** attempt)
+        finally:
+            os.remove(path)
+
+    def submit(self, name: str, path: str) -> None:
+        while len(self.pending) >= 2 * self.workers:
+            self._collect(FIRST_COMPLETED)
+        self.pending.add(self.pool.submit(self._upload, name, path))
+
+    def _collect(self, mode) -> None:
+        done, self.pending = wait(self.pending, return_when=mode)
+        for future in done:
+            future.result()  # raise the first failed upload
+
+    def finish(self) -> None:
+        try:
+            self._collect(ALL_COMPLETED)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run_backup(storage: BackupStorage, full: bool = False, chunk_rows: int = CHUNK_ROWS, workers: int = 4,
+               overlap: timedelta = timedelta(minutes=5), log: Callable[[str], None] = lambda message: None
+               ) -> Dict[str, Any]:
+    """Write a full or incremental backup to ``storage``; returns its manifest."""
+    started = timezone.now()
+    backup_id = started.strftime('%Y%m%d_%H%M%S_%f')
+    previous = None if full else _read_json(storage, LATEST)
+    base = _read_json(storage, previous['manifest']) if previous else None
+    kind = 'incremental' if base else 'full'
+    manifest: Dict[str, Any] = {
+        'id': backup_id,
+        'kind': kind,
+        'base': base['id'] if base else None,
+        'full': base['full'] if base else backup_id,
+        'started_at': started.isoformat(),
+        'format': 'jsonl.gz',
+        'models': {},
+    }
+    progress = Progress(log)
+    files: List[Tuple[str, str]] = []  # (storage name, local path)
+    uploader = _Uploader(storage, workers)
+    workdir = tempfile.mkdtemp(prefix='backup-')
+    try:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # One snapshot for every table, so rows across chunks are consistent
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            for model in backup_models():
+                label = model._meta.label_lower
+                entry = _dump_model(model, base, overlap, chunk_rows, backup_id, workdir, files, progress)
+                manifest['models'][label] = entry
+                log(f"  {label}: {entry['rows']} rows in {len(entry['chunks'])} chunk(s)"
+                    + (f" since {entry['since']}" if entry['since'] else ''))
+        # Uploaded after the read transaction: it must not wait on the network
+        for name, path in files:
+            uploader.submit(name, path)
+        uploader.finish()
+    except BaseException:
+        uploader.pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    manifest['finished_at'] = timezone.now().isoformat()
+    manifest['rows'] = sum(e['rows'] for e in manifest['models'].values())
+    manifest['bytes'] = sum(c['bytes'] for e in manifest['models'].values() for c in e['chunks'])
+    manifest['chain'] = (base['chain'] if base else []) + [f'{backup_id}/manifest.json']
+    storage.put_bytes(f'{backup_id}/manifest.json', json.dumps(manifest, indent=2).encode())
+    storage.put_bytes(LATEST, json.dumps({'id': backup_id, 'manifest': f'{backup_id}/manifest.json'}).encode())
+    return manifest
+
+
+def _dump_model(model, base: Optional[Dict[str, Any]], overlap: timedelta, chunk_rows: int, backup_id: str,
+                workdir: str, files: List[Tuple[str, str]], progress: Progress) -> Dict[str, Any]:
+    label = model._meta.label_lower
+    field = WATERMARKS.get(label)
+    previous = (base or {}).get('models', {}).get(label, {}).get('watermark') if field else None
+    since = _since(previous, overlap) if field else None
+
+    qs = model._default_manager.order_by(model._meta.pk.name)
+    if since is not None:
+        qs = qs.filter(**{f'{field}__gt': since})
+    watermark = None
+    if field:
+        # Only rows up to the watermark read now are covered; later ones go in the next backup
+        watermark = _watermark_value(qs.aggregate(top=Max(field))['top']) or previous
+
+    entry: Dict[str, Any] = {
+        'watermark_field': field,
+        'since': _watermark_value(since),
+        'watermark': watermark,
+        'rows': 0,
+        'chunks': [],
+    }
+    rows = qs.iterator(chunk_size=2000)
+    for n in itertools.count(1):
+        name = f"{label.replace('.', '_')}-{n:04d}.jsonl.gz"
+        path = os.path.join(workdir, name)
+        count = _write_chunk(itertools.islice(rows, chunk_rows), path)
+        if not count:
+            os.remove(path)
+            break
+        size = os.path.getsize(path)
+        entry['chunks'].append({'name': f'{backup_id}/{name}', 'rows': count, 'bytes': size, 'sha256': _sha256(path)})
+        entry['rows'] += count
+        progress.add(count, size)
+        files.append((f'{backup_id}/{name}', path))
+        if count < chunk_rows:
+            break
+    return entry
+
+
+def _read_json(storage: BackupStorage, name: str) -> Optional[Dict[str, Any]]:
+    raw = storage.read(name)
+    return json.loads(raw) if raw else None
+
+
+def restore_files(storage: BackupStorage, manifest_name: Optional[str] = None) -> List[str]:
+    """Chunk names to pass to loaddata, in order, to restore up to ``manifest_name`` (default: latest)."""
+    if manifest_name is None:
+        latest = _read_json(storage, LATEST)
+        if not latest:
+            return []
+        manifest_name = latest['manifest']
+    manifest = _read_json(storage, manifest_name)
+    # Tables without a watermark are complete in every backup; earlier copies may clash with the last one
+    whole = {label for label, entry in manifest['models'].items() if not entry['watermark_field']}
+    names: List[str] = []
+    for name in manifest['chain']:
+        last = name == manifest['chain'][-1]
+        for label, entry in _read_json(storage, name)['models'].items():
+            if last or label not in whole:
+                names.extend(chunk['name'] for chunk in entry['chunks'])
+    return names
@@ -0,0 +1,190 @@
+"""Circuit breaker for calls to a remote service.
+
+CLOSED: calls go through. ``failure_threshold`` consecutive failures (errors,
+or calls slower than ``deadline``) open the circuit.
+OPEN: calls fail at once with CircuitOpen, without touching the service.
+After ``reset_timeout`` seconds the next call is let through as a probe.
+HALF_OPEN: one probe at a time; other callers still fail fast. A successful
+probe closes the circuit, a failed one opens it again.
+
+``call`` runs the function inline and can only judge it afterwards, so it is
+the one to use for writes, whose outcome must not be abandoned.
+``call_with_deadline`` runs it on a small thread pool and stops waiting at the
+deadline, for reads that are safe to give up on. The call itself should carry
+the same timeout so an abandoned thread ends instead of holding a pool slot
+that a later probe would queue behind.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call did not finish within the breaker's deadline."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30, deadline: float = 5,
+                 workers: int = 8, ignore: Tuple[Type[BaseException], ...] = (),
+                 on_open: Optional[Callable[[], None]] = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.deadline = deadline
+        self.workers = workers
+        # Exceptions that are answers, not outages (e.g. insufficient stock)
+        self.ignore = ignore
+        self.on_open = on_open
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.last_error: Optional[str] = None
+        self.counts = {'calls': 0, 'failures': 0, 'rejected': 0, 'timeouts': 0}
+        self.transitions: deque = deque(maxlen=20)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    # ---------- State ----------
+    def _transition(self, state: str, reason: str) -> None:
+        # Caller holds the lock
+        previous, self._state = self._state, state
+        self.transitions.append({
+            'at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'from': previous, 'to': state, 'reason': reason,
+        })
+        log = logger.warning if state == OPEN else logger.info
+        log('Circuit %s %s -> %s: %s', self.name, previous, state, reason)
+
+    def _before(self) -> None:
+        with self._lock:
+            self.counts['calls'] += 1
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    self.counts['rejected'] += 1
+                    raise CircuitOpen(f'{self.name} circuit is open: {self.last_error}')
+                self._transition(HALF_OPEN, 'reset timeout elapsed, probing')
+            if self._probing:
+                self.counts['rejected'] += 1
+                raise CircuitOpen(f'{self.name} circuit is half-open and a probe is in flight')
+            self._probing = True
+
+    def _success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED, 'probe succeeded')
+
+    def _failure(self, error: str) -> None:
+        opened = False
+        with self._lock:
+            self.counts['failures'] += 1
+            self._failures += 1
+            self._probing = False
+            self.last_error = error
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                reason = 'probe failed' if self._state == HALF_OPEN else f'{self._failures} consecutive failures'
+                self._transition(OPEN, f'{reason}: {error}')
+                self._opened_at = self.clock()
+                opened = True
+        if opened and self.on_open:
+            try:
+                self.on_open()
+            except Exception as exc:  # pragma: no cover - best effort
+                logger.warning('Circuit %s on_open hook failed: %s', self.name, exc)
+
+    # ---------- Calls ----------
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn`` inline; a call slower than the deadline still returns but counts as a failure."""
+        self._before()
+        start = self.clock()
+        try:
+            result = fn(*args, **kwargs)
+        except self.ignore:
+            self._success()
+            raise
+        except BaseException as exc:
+            self._failure(f'{type(exc).__name__}: {exc}')
+            raise
+        elapsed = self.clock() - start
+        if self.deadline and elapsed > self.deadline:
+            self._failure(f'slow call: {elapsed:.2f}s > {self.deadline:g}s deadline')
+        else:
+            self._success()
+        return result
+
+    def call_with_deadline(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn`` on the breaker's pool and raise DeadlineExceeded if it takes too long."""
+        if not self.deadline:
+            return self.call(fn, *args, **kwargs)
+        self._before()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'{self.name}-call')
+            pool = self._pool
+        future = pool.submit(fn, *args, **kwargs)
+        try:
+            result = future.result(timeout=self.deadline)
+        except FutureTimeout:
+            # The call keeps running until its own RPC timeout; nobody waits for it
+            with self._lock:
+                self.counts['timeouts'] += 1
+            self._failure(f'no answer within {self.deadline:g}s')
+            raise DeadlineExceeded(f'{self.name} call exceeded {self.deadline:g}s deadline')
+        except self.ignore:
+            self._success()
+            raise
+        except BaseException as exc:
+            self._failure(f'{type(exc).__name__}: {exc}')
+            raise
+        self._success()
+        return result
+
+    def reset(self) -> None:
+        """Close the circuit and forget failures."""
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED, 'manual reset')
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = max(0.0, round(self.reset_timeout - (self.clock() - self._opened_at), 1))
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'deadline': self.deadline,
+                'retry_in': retry_in,
+                'last_error': self.last_error,
+                'counts': dict(self.counts),
+                'transitions': list(self.transitions),
+            }
@@ -0,0 +1,162 @@
+"""Bulk catalog import/export as CSV.
+
+Imports stream the file and handle it in chunks. Each chunk is validated
+row by row with ProductRowForm and upserted by SKU in one statement
+(``bulk_create(update_conflicts=True)``, or ``bulk_create`` plus
+``bulk_update`` on databases without conflict targets). It is mirrored to
+Firestore through one outbox insert and applied to the dashboard stats. Bad
+rows are reported with their line numbers and never abort the import. When
+a SKU repeats within a chunk the last row wins, and the earlier ones are
+reported as skipped.
+
+Exports stream rows from a server-side cursor, so memory stays flat however
+large the catalog is.
+"""
+import csv
+import io
+from typing import Iterable, Iterator, List, Tuple
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from . import stats
+from .forms import ProductRowForm
+from .models import Product
+from .outbox import enqueue_many
+from .serializers import product_doc
+
+CATALOG_FIELDS = ['sku', 'name', 'description', 'cost_price', 'selling_price', 'quantity']
+UPDATE_FIELDS = ['name', 'description', 'cost_price', 'selling_price', 'quantity', 'updated_at']
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportResult:
+    """Counts and per-row errors of a catalog import."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors: List[Tuple[int, str]] = []  # (CSV line number, message) of failed and skipped rows
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        self._report(line, message)
+
+    def skip(self, line: int, message: str) -> None:
+        self.skipped += 1
+        self._report(line, message)
+
+    def _report(self, line: int, message: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def unreported(self) -> int:
+        return self.failed + self.skipped - len(self.errors)
+
+    @property
+    def processed(self) -> int:
+        return self.created + self.updated + self.failed + self.skipped
+
+
+def _form_errors(form) -> str:
+    return '; '.join(f'{field}: {" ".join(msgs)}' for field, msgs in form.errors.items())
+
+
+def import_products(lines: Iterable[str], chunk_size: int = CHUNK_SIZE) -> ImportResult:
+    """Upsert products by SKU from CSV text lines (header row required)."""
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    missing = set(CATALOG_FIELDS) - {'description'} - set(reader.fieldnames or [])
+    if missing:
+        result.error(1, f'Missing columns: {", ".join(sorted(missing))}')
+        return result
+
+    chunk: dict = {}  # sku -> (line, cleaned row); a later row for a SKU wins
+    for row in reader:
+        form = ProductRowForm({k: (v or '').strip() for k, v in row.items() if k in CATALOG_FIELDS})
+        if not form.is_valid():
+            result.error(reader.line_num, _form_errors(form))
+            continue
+        sku = form.cleaned_data['sku']
+        if sku in chunk:
+            result.skip(chunk[sku][0], f'Skipped: SKU {sku} appears again on line {reader.line_num}')
+        chunk[sku] = (reader.line_num, form.cleaned_data)
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, result)
+            chunk = {}
+    if chunk:
+        _import_chunk(chunk, result)
+    return result
+
+
+def _import_chunk(chunk: dict, result: ImportResult) -> None:
+    try:
+        with transaction.atomic():
+            created, updated = _upsert(chunk)
+    except DatabaseError as exc:
+        for line, _ in chunk.values():
+            result.error(line, f'Not saved: {exc}')
+        return
+    result.created += created
+    result.updated += updated
+
+
+def _upsert(chunk: dict) -> Tuple[int, int]:
+    existing = {p.sku: p for p in Product.objects.select_for_update().filter(sku__in=chunk)}
+    now = timezone.now()
+    products = []
+    for sku, (_, data) in chunk.items():
+        # updated_at is set explicitly: bulk_update does not apply auto_now
+        products.append(Product(updated_at=now, **data))
+
+    if connection.features.supports_update_conflicts_with_target:
+        Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['sku'],
+                                    update_fields=UPDATE_FIELDS)
+        if any(p.pk is None for p in products):
+            # Backends that cannot return ids from an upsert
+            ids = dict(Product.objects.filter(sku__in=chunk).values_list('sku', 'id'))
+            for p in products:
+                p.pk = ids[p.sku]
+    else:
+        for p in products:
+            if p.sku in existing:
+                p.pk = existing[p.sku].pk
+        Product.objects.bulk_create([p for p in products if p.pk is None])
+        Product.objects.bulk_update([p for p in products if p.sku in existing], UPDATE_FIELDS)
+
+    for p in products:
+        if p.sku in existing:
+            # bulk_create stamped auto_now_add on the objects; the rows kept theirs
+            p.created_at = existing[p.sku].created_at
+
+    stats.record_changes([
+        (existing[p.sku].stock_state() if p.sku in existing else None, p.stock_state())
+        for p in products
+    ])
+    enqueue_many((f'products/{p.pk}', product_doc(p), True) for p in products)
+    return len(products) - len(existing), len(existing)
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset=None) -> Iterator[str]:
+    """CSV lines (header first) for every product, read with a server-side cursor."""
+    qs = Product.objects.all() if queryset is None else queryset
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CATALOG_FIELDS)
+    for row in qs.order_by('id').values_list(*CATALOG_FIELDS).iterator(chunk_size=2000):
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def decode_lines(binary_file, encoding: str = 'utf-8-sig') -> Iterator[str]:
+    """Text lines of an uploaded/binary file, decoded incrementally."""
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline='')
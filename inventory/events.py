@@ -0,0 +1,112 @@
+"""Commit-deferred, batched Firestore event logging.
+
+Signal handlers call ``emit`` instead of writing to Firestore directly. Events
+are buffered per transaction (per savepoint, so a rolled back savepoint drops
+its events) and only sent once the transaction commits: all events of the
+transaction go out as one Firestore batch, written on a background thread so
+the request never waits on the network. Nothing is sent for a rolled back
+transaction.
+
+An event can be given as a callable that builds the document; it is called at
+commit time, once related rows (e.g. sale items) exist.
+
+Settings (env vars):
+- FIREBASE_EVENTS_SYNC: write the batch on the committing thread instead of
+  the background writer (default false; handy for scripts and tests).
+"""
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from django.db import connection, transaction
+
+from .firebase import firebase_enabled, firestore_breaker, get_firestore_client
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 500  # Firestore maximum writes per batch
+
+Event = Union[Dict[str, Any], Callable[[], Dict[str, Any]]]
+
+_local = threading.local()
+_executor = {'pool': None}
+_executor_lock = threading.Lock()
+
+
+class _Buffer:
+    """Events of one transaction (savepoint) waiting for its commit."""
+
+    def __init__(self, key: Tuple[str, ...]):
+        self.key = key
+        self.events: List[Tuple[str, Event]] = []
+        self.pending = False
+
+    def flush(self):
+        self.pending = False
+        if _buffers().get(self.key) is self:
+            del _buffers()[self.key]
+        docs = []
+        for collection, event in self.events:
+            try:
+                docs.append((collection, event() if callable(event) else event))
+            except Exception as exc:
+                logger.warning('Dropping %s event that failed to build: %s', collection, exc)
+        send(docs)
+
+
+def _buffers() -> Dict[Tuple[str, ...], _Buffer]:
+    # Only the registered on_commit callback holds a buffer: when a rollback
+    # discards the callback, the buffer and its events go with it
+    if not hasattr(_local, 'buffers'):
+        _local.buffers = weakref.WeakValueDictionary()
+    return _local.buffers
+
+
+def emit(collection: str, event: Event) -> None:
+    """Queue an event document for ``collection`` until the current transaction commits."""
+    if not firebase_enabled():
+        return
+    if not connection.in_atomic_block:
+        send([(collection, event() if callable(event) else event)])
+        return
+    key = tuple(connection.savepoint_ids)
+    buffers = _buffers()
+    buf = buffers.get(key)
+    if buf is None or not buf.pending:
+        buf = buffers[key] = _Buffer(key)
+        transaction.on_commit(buf.flush)
+        buf.pending = True
+    buf.events.append((collection, event))
+
+
+def send(docs: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """Write (collection, document) events, off the calling thread unless configured otherwise."""
+    if not docs:
+        return
+    if os.environ.get('FIREBASE_EVENTS_SYNC', 'false').lower() in ('1', 'true', 'yes'):
+        _write(docs)
+        return
+    with _executor_lock:
+        if _executor['pool'] is None:
+            _executor['pool'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='firestore-events')
+    _executor['pool'].submit(_write, docs)
+
+
+@timed('firestore', 'write_events')
+def _write(docs: List[Tuple[str, Dict[str, Any]]]) -> None:
+    db = get_firestore_client()
+    if not db:
+        return
+    try:
+        for start in range(0, len(docs), BATCH_LIMIT):
+            batch = db.batch()
+            for collection, doc in docs[start:start + BATCH_LIMIT]:
+                batch.set(db.collection(collection).document(), doc)
+            firestore_breaker().call(batch.commit)
+    except Exception as exc:
+        # Event logging must never break the main flow
+        logger.warning('Failed to write %s Firestore events: %s', len(docs), exc)
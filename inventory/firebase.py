@@ -1,22 +1,52 @@
+import functools
 import os
 import json
-from typing import Optional
+import threading
+import time
+from typing import Callable, Optional
+
+from .breaker import CircuitBreaker
 
 _cached = {
     'client': None,
     'error': None,
+    'failed_at': None,
+    # True when the client was built here and may be rebuilt after an outage
+    'owned': False,
 }
+_breaker = {'firestore': None}
+_breaker_lock = threading.Lock()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
 
 def get_firestore_client() -> Optional["firestore.Client"]:
     """Return a cached Firestore client or None if not configured.
     Reads service account JSON from FIREBASE_CRED_JSON and optional
-    FIREBASE_PROJECT_ID. Does not raise on failure; records error for debugging.
+    FIREBASE_PROJECT_ID. Does not raise on failure; records error for debugging
+    and tries again after FIREBASE_INIT_RETRY_SECONDS (default 30).
     """
     if _cached['client'] is not None:
         return _cached['client']
     if _cached['error'] is not None:
-        return None
+        failed_at = _cached['failed_at']
+        if failed_at is None or time.monotonic() - failed_at < _env_float('FIREBASE_INIT_RETRY_SECONDS', 30):
+            return None
+    client = _create_client()
+    if client is None:
+        _cached['failed_at'] = time.monotonic()
+    else:
+        _cached.update(client=client, error=None, failed_at=None, owned=True)
+    return client
+
 
+def _create_client():
+    """Build a client from the environment, or record why not and return None."""
     raw = os.environ.get('FIREBASE_CRED_JSON')
     if not raw:
         _cached['error'] = 'FIREBASE_CRED_JSON not set'
@@ -36,9 +66,9 @@ def get_firestore_client() -> Optional["firestore.Client"]:
         if not project_id:
             _cached['error'] = 'FIREBASE_PROJECT_ID not provided and missing in service account JSON'
             return None
-        client = firestore.Client(project=project_id, credentials=creds)
-        _cached['client'] = client
-        return client
+        from .metrics import track
+        with track('firestore', 'connect'):
+            return firestore.Client(project=project_id, credentials=creds)
     except Exception as exc:  # pragma: no cover
         _cached['error'] = f'Failed to init Firestore: {exc}'
         return None
@@ -49,3 +79,60 @@ def firebase_enabled() -> bool:
 
 def firebase_sor_enabled() -> bool:
     return firebase_enabled() and os.environ.get('FIREBASE_SOR', 'false').lower() in ('1', 'true', 'yes')
+
+
+def firestore_init_error() -> Optional[str]:
+    """Why the last client initialization failed, if it did."""
+    return _cached['error']
+
+
+def reset_firestore_client() -> None:
+    """Drop a client built here so the next call creates a fresh one (and retry a failed init now)."""
+    if _cached['owned']:
+        _cached.update(client=None, owned=False)
+    _cached.update(error=None, failed_at=None)
+
+
+# ---------- Circuit breaker ----------
+def firestore_breaker() -> CircuitBreaker:
+    """The process-wide breaker for Firestore calls, configured from the environment.
+
+    FIRESTORE_BREAKER_FAILURES consecutive failures (default 5) open it for
+    FIRESTORE_BREAKER_RESET_SECONDS (default 30); FIRESTORE_DEADLINE_SECONDS
+    (default 5, 0 disables) bounds each call. Opening it drops the client, so
+    the half-open probe runs on a newly created one.
+    """
+    breaker = _breaker['firestore']
+    if breaker is None:
+        with _breaker_lock:
+            if _breaker['firestore'] is None:
+                _breaker['firestore'] = CircuitBreaker(
+                    'firestore',
+                    failure_threshold=int(_env_float('FIRESTORE_BREAKER_FAILURES', 5)),
+                    reset_timeout=_env_float('FIRESTORE_BREAKER_RESET_SECONDS', 30),
+                    deadline=_env_float('FIRESTORE_DEADLINE_SECONDS', 5),
+                    # Insufficient stock and missing documents are answers, not outages
+                    ignore=(ValueError, KeyError),
+                    on_open=reset_firestore_client,
+                )
+            breaker = _breaker['firestore']
+    return breaker
+
+
+def reset_firestore_breaker() -> None:
+    """Forget the breaker (and its state); the next call builds one from the environment."""
+    with _breaker_lock:
+        _breaker['firestore'] = None
+
+
+def guarded(read: bool = False) -> Callable:
+    """Run a Firestore operation through the breaker; reads are abandoned at the deadline."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            breaker = firestore_breaker()
+            if read:
+                return breaker.call_with_deadline(func, *args, **kwargs)
+            return breaker.call(func, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,14 +1,32 @@
+import hashlib
+import json
+import logging
 import os
+import random
+import threading
+import time
 from types import SimpleNamespace
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterable, List, Optional, Dict, Any, Union
 
-from .firebase import get_firestore_client, firebase_enabled
+from django.conf import settings
+from django.core.cache import caches
+
+from .firebase import get_firestore_client, firebase_enabled, firestore_breaker, guarded
+from .metrics import record_reservation_transaction, timed
+from .listings import LOW_STOCK_THRESHOLD, PAGE_SIZE, PREFIX_END, Page, decode_cursor, encode_cursor, product_sort_field
+from .serializers import customer_doc, product_doc, sale_documents, sale_from_doc
 from typing import Tuple
 try:
     # Optional import; functions that need transactions will guard usage
     from google.cloud import firestore as gcfirestore
 except Exception:  # pragma: no cover - library may not be present locally
     gcfirestore = None
+try:
+    from google.cloud.firestore_v1.base_query import FieldFilter
+except Exception:  # pragma: no cover
+    FieldFilter = None
+
+logger = logging.getLogger(__name__)
 
 
 def firebase_sor_enabled() -> bool:
@@ -16,26 +34,165 @@ def firebase_sor_enabled() -> bool:
     return firebase_enabled() and os.environ.get('FIREBASE_SOR', 'false').lower() in ('1', 'true', 'yes')
 
 
-def _ns(d: Dict[str, Any]) -> SimpleNamespace:
-    return SimpleNamespace(**d)
+def _rpc(read: bool = False) -> Callable:
+    """Time a Firestore operation and run it through the circuit breaker."""
+    def decorator(func):
+        return timed('firestore', func.__name__)(guarded(read)(func))
+    return decorator
+
+
+def _with_pk(doc) -> Dict[str, Any]:
+    """Document dict with id/pk present for templates and links."""
+    d = doc.to_dict() or {}
+    pk = d.get('id') or (doc.id.isdigit() and int(doc.id) or doc.id)
+    d['id'] = pk
+    d['pk'] = pk
+    return d
+
+
+def _where(query, field: str, op: str, value: Any):
+    if FieldFilter is not None:
+        return query.where(filter=FieldFilter(field, op, value))
+    return query.where(field, op, value)
+
+
+def _deadline() -> Optional[float]:
+    """Per-RPC timeout for reads, so calls abandoned by the breaker deadline end too."""
+    return firestore_breaker().deadline or None
+
+
+def _keyset_page(query, sort_field: str, cursor: Optional[str], limit: int) -> Page:
+    """Firestore counterpart of listings.keyset_page using start_after cursors."""
+    query = query.order_by(sort_field).order_by('id')
+    after = decode_cursor(cursor)
+    if after:
+        query = query.start_after({sort_field: after[0], 'id': after[1]})
+    rows = [_with_pk(doc) for doc in query.limit(limit + 1).stream(timeout=_deadline())]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].get(sort_field), rows[-1]['id']])
+    return Page(rows, next_cursor)
+
+
+def _page_key(filters: Dict[str, Any], cursor: Optional[str], limit: int) -> str:
+    raw = json.dumps([filters, cursor, limit], sort_keys=True)
+    return 'page:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+# ---------- Read-through cache ----------
+# Listings are cached in the `firestore` cache alias (see settings.CACHES) under
+# a per-collection generation number. Writes bump the generation instead of
+# deleting keys, so every worker sharing the cache backend stops serving the
+# old entries at once and stale ones simply age out via the TTL.
+_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'uncacheable': 0}
+_cache_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _cache_stats_lock:
+        _cache_stats[name] += 1
+
+
+def _cache():
+    return caches[getattr(settings, 'FIRESTORE_CACHE_ALIAS', 'default')]
+
+
+def _generation(collection: str) -> int:
+    cache = _cache()
+    key = f'fs:{collection}:gen'
+    gen = cache.get(key)
+    if gen is None:
+        # Seed from the clock so an evicted counter never revives old entries
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        gen = cache.get(key)
+    return gen
+
+
+def invalidate_cache(*collections: str) -> None:
+    """Drop cached listings for the given collections in every worker."""
+    cache = _cache()
+    for collection in collections:
+        key = f'fs:{collection}:gen'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), timeout=None)
+        _count('invalidations')
+
+
+def invalidate_for_paths(paths: Iterable[str]) -> None:
+    """Invalidate the collections touched by the given document paths."""
+    invalidate_cache(*sorted({p.split('/', 1)[0] for p in paths}))
+
+
+def _cached(collection: str, key: str, loader: Callable[[], Any]) -> Any:
+    cache = _cache()
+    full_key = f'fs:{collection}:{_generation(collection)}:{key}'
+    value = cache.get(full_key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = loader()
+    # Bound memory: very large results are served but not cached
+    max_docs = getattr(settings, 'FIRESTORE_CACHE_MAX_DOCS', 5000)
+    if isinstance(value, list) and len(value) > max_docs:
+        _count('uncacheable')
+    else:
+        cache.set(full_key, value)
+    return value
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for this worker process."""
+    with _cache_stats_lock:
+        stats = dict(_cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
 
 
 # ---------- Products ----------
 def list_products() -> list[dict]:
+    return _cached('products', 'all', _load_products)
+
+
+@_rpc(read=True)
+def _load_products() -> list[dict]:
     db = get_firestore_client()
     if not db:
         return []
-    docs = db.collection('products').order_by('name').stream()
-    results: list[dict] = []
-    for doc in docs:
-        d = doc.to_dict() or {}
-        # ensure id/pk present for templates/links
-        pid = d.get('id') or (doc.id.isdigit() and int(doc.id) or doc.id)
-        d['id'] = pid
-        d['pk'] = pid
-        results.append(d)
-    return results
+    docs = db.collection('products').order_by('name').stream(timeout=_deadline())
+    return [_with_pk(doc) for doc in docs]
+
+
+def page_products(filters: Dict[str, Any], cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+    """One filtered page of products ordered by name (or SKU for SKU searches).
+
+    Filters mirror listings.product_page. Range filters on name/SKU plus
+    quantity need composite indexes on (sort field, quantity, id) in Firestore.
+    """
+    return _cached('products', _page_key(filters, cursor, limit),
+                   lambda: _load_products_page(filters, cursor, limit))
+
 
+@_rpc(read=True)
+def _load_products_page(filters: Dict[str, Any], cursor: Optional[str], limit: int) -> Page:
+    db = get_firestore_client()
+    if not db:
+        return Page([], None)
+    query = db.collection('products')
+    for field, prefix in (('name', filters.get('q')), ('sku', filters.get('sku'))):
+        if prefix:
+            query = _where(_where(query, field, '>=', prefix), field, '<', prefix + PREFIX_END)
+    if filters.get('in_stock'):
+        query = _where(query, 'quantity', '>', 0)
+    if filters.get('low_stock'):
+        query = _where(query, 'quantity', '<=', LOW_STOCK_THRESHOLD)
+    return _keyset_page(query, product_sort_field(filters), cursor, limit)
+
+@_rpc()
 def upsert_product(product) -> None:
     """Create/update a product document mirroring the Django model.
     Doc id is the Django Product.id as string for easy correlation.
@@ -43,25 +200,16 @@ def upsert_product(product) -> None:
     db = get_firestore_client()
     if not db:
         return
-    data = {
-        'id': product.id,
-        'sku': product.sku,
-        'name': product.name,
-        'description': product.description,
-        'cost_price': float(product.cost_price),
-        'selling_price': float(product.selling_price),
-        'quantity': int(product.quantity),
-        'updated_at': getattr(product, 'updated_at', None).isoformat() if getattr(product, 'updated_at', None) else None,
-        'created_at': getattr(product, 'created_at', None).isoformat() if getattr(product, 'created_at', None) else None,
-    }
-    db.collection('products').document(str(product.id)).set(data, merge=True)
+    db.collection('products').document(str(product.id)).set(product_doc(product), merge=True)
+    invalidate_cache('products')
 
 
+@_rpc(read=True)
 def get_product(product_id: int) -> Optional[Dict[str, Any]]:
     db = get_firestore_client()
     if not db:
         return None
-    doc = db.collection('products').document(str(product_id)).get()
+    doc = db.collection('products').document(str(product_id)).get(timeout=_deadline())
     if not doc.exists:
         return None
     d = doc.to_dict()
@@ -69,6 +217,91 @@ def get_product(product_id: int) -> Optional[Dict[str, Any]]:
     return d
 
 
+@_rpc(read=True)
+def get_products(product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Fetch many product documents in one batched read, keyed by id."""
+    db = get_firestore_client()
+    if not db:
+        return {}
+    refs = [db.collection('products').document(str(pid)) for pid in product_ids]
+    found: Dict[int, Dict[str, Any]] = {}
+    for snap in db.get_all(refs, timeout=_deadline()):
+        if snap.exists:
+            d = snap.to_dict()
+            d['id'] = int(snap.id)
+            found[d['id']] = d
+    return found
+
+
+# ---------- Stock reservation ----------
+# A product's stock normally lives in its document's `quantity`. Hot products
+# can be sharded (see shard_stock): their stock is then split over
+# products/<id>/stock_shards/<n> documents, so concurrent reservations touch
+# different documents instead of all waiting on one. The product document's
+# quantity keeps being mirrored from the ORM for listings, and its stock_shards
+# field is the authority on the shard count: stock transactions read it, while
+# the cached stock_shard_counts() (per instance, stale up to the cache TTL)
+# only plans which documents to read and how many writes a batch may take.
+STOCK_SHARDS = 'stock_shards'
+MAX_STOCK_SHARDS = 100
+MAX_TRANSACTION_WRITES = 500  # Firestore limit per commit
+
+
+class _Stock:
+    """Stock of one product as read inside a reservation transaction."""
+
+    def __init__(self, data: Dict[str, Any], docs: List[Tuple[Any, int]], unread: List[Any]):
+        self.data = data
+        self.docs = docs  # (ref, quantity) read so far
+        self.unread = unread  # shard refs not read yet, in random order
+        self.initial = sum(q for _, q in docs)
+        self.taken = 0
+
+    @property
+    def available(self) -> int:
+        return sum(q for _, q in self.docs) - self.taken
+
+    def read_until(self, need: int, tx, deadline) -> None:
+        while self.available < need and self.unread:
+            ref = self.unread.pop()
+            snap = ref.get(transaction=tx, timeout=deadline)
+            self.docs.append((ref, _shard_quantity(snap)))
+
+    def writes(self) -> List[Tuple[Any, int, int]]:
+        """(ref, new quantity, units taken) for the documents the taken units come from."""
+        out, left = [], self.taken
+        for ref, qty in sorted(self.docs, key=lambda d: -d[1]):
+            if left <= 0:
+                break
+            take = min(qty, left)
+            out.append((ref, qty - take, take))
+            left -= take
+        return out
+
+
+def _shard_quantity(snap) -> int:
+    return max(0, int((snap.to_dict() or {}).get('quantity', 0))) if snap.exists else 0
+
+
+def stock_shard_counts() -> Dict[int, int]:
+    """{product_id: number of stock shards} for the products that are sharded."""
+    return _cached(STOCK_SHARDS, 'counts', _load_stock_shard_counts)
+
+
+@_rpc(read=True)
+def _load_stock_shard_counts() -> Dict[int, int]:
+    db = get_firestore_client()
+    if not db:
+        return {}
+    query = _where(db.collection('products'), STOCK_SHARDS, '>', 0).select([STOCK_SHARDS])
+    return {int(doc.id): int(doc.get(STOCK_SHARDS)) for doc in query.stream(timeout=_deadline())}
+
+
+def _shard_refs(db, product_id: int, shards: int) -> list:
+    products = db.collection('products').document(str(product_id))
+    return [products.collection(STOCK_SHARDS).document(str(n)) for n in range(shards)]
+
+
 def reserve_and_decrement_stock(requested: Dict[int, int]) -> Dict[int, int]:
     """Perform a Firestore transaction to check and decrement stock atomically.
 
@@ -76,66 +309,425 @@ def reserve_and_decrement_stock(requested: Dict[int, int]) -> Dict[int, int]:
     Returns: {product_id: new_quantity_after_decrement}
     Raises ValueError on insufficient stock or RuntimeError if Firestore unavailable.
     """
+    result = reserve_stock_batch([requested])[0]
+    if isinstance(result, ValueError):
+        raise result
+    return result
+
+
+@_rpc()
+def reserve_stock_batch(requests: List[Dict[int, int]]) -> List[Union[Dict[int, int], ValueError]]:
+    """Check and decrement stock for several carts, in one Firestore transaction when they fit.
+
+    Carts are applied in order against the running quantities. One that does
+    not fit gets a ValueError in its slot of the result and changes nothing;
+    the others commit together and get {product_id: quantity left}. For a
+    sharded product only as many shards are read as cover the demand, and the
+    quantity returned counts those shards only.
+
+    Carts whose writes would exceed MAX_TRANSACTION_WRITES are committed in
+    further transactions; a single cart that large is split into chunks, and
+    if a later chunk fails the earlier ones are put back (see
+    ``_reserve_chunked``).
+    Raises RuntimeError if Firestore is unavailable.
+    """
     db = get_firestore_client()
     if not db or not gcfirestore:
         raise RuntimeError('Firestore not available for transactional stock update')
+    shard_counts = stock_shard_counts()
+    carts = [{int(pid): int(qty) for pid, qty in req.items() if int(qty) > 0} for req in requests]
+    results: List[Union[Dict[int, int], ValueError]] = []
+    group: List[Dict[int, int]] = []
+    group_pids: set = set()
+    try:
+        for cart in carts:
+            cost = _write_cost(cart, shard_counts)
+            if group and _write_cost(group_pids | set(cart), shard_counts) > MAX_TRANSACTION_WRITES:
+                results.extend(_commit_carts(db, group, shard_counts).results)
+                group, group_pids = [], set()
+            if cost > MAX_TRANSACTION_WRITES:
+                results.append(_reserve_chunked(db, cart, shard_counts))
+            else:
+                group.append(cart)
+                group_pids |= set(cart)
+        if group:
+            results.extend(_commit_carts(db, group, shard_counts).results)
+    finally:
+        invalidate_cache('products')
+    return results
+
 
-    transaction = db.transaction()
+def _write_cost(pids: Iterable[int], shard_counts: Dict[int, int]) -> int:
+    """Most documents a reservation of ``pids`` can write (every shard of a sharded product)."""
+    return sum(shard_counts.get(pid, 1) for pid in pids)
+
+
+def _commit_carts(db, carts: List[Dict[int, int]], shard_counts: Dict[int, int], report: bool = True) -> SimpleNamespace:
+    """Apply ``carts`` in one transaction.
+
+    Returns a namespace with the per-cart ``results``, the transaction
+    ``attempts`` and what was committed, for a compensating rollback:
+    ``taken`` (ref, units) per written document and the stats ``changes``.
+    """
+    deadline = _deadline()
+    pids = sorted({pid for cart in carts for pid in cart})
+    taken: List[Tuple[Any, int]] = []
+    changes: List[Tuple[Dict[str, Any], int, int]] = []
+    attempts = [0]
+    stale = [False]
+    started = time.perf_counter()
 
     @gcfirestore.transactional
-    def _apply(tx, _db, req: Dict[int, int]) -> Dict[int, int]:
-        new_qty_map: Dict[int, int] = {}
-        # Deterministic order to avoid deadlocks
-        for pid in sorted(req.keys(), key=lambda x: int(x)):
-            need = int(req[pid])
-            ref = _db.collection('products').document(str(pid))
-            snap = ref.get(transaction=tx)
-            data = snap.to_dict() or {}
-            current = int(data.get('quantity', 0))
-            if need <= 0:
+    def _apply(tx, _db) -> List[Union[Dict[int, int], ValueError]]:
+        attempts[0] += 1
+        taken.clear()  # the transaction may be retried
+        changes.clear()
+        # Every product document, and one random shard per product the cached
+        # counts say is sharded, in a single read. Where the stock lives is
+        # decided by the product document's stock_shards field read here, not by
+        # the cache: another instance may have resharded since, and shard_stock
+        # writes that field, so it cannot commit while this transaction runs.
+        products = {pid: _db.collection('products').document(str(pid)) for pid in pids}
+        guessed: Dict[int, List[Any]] = {}
+        for pid in pids:
+            if shard_counts.get(pid):
+                guessed[pid] = _shard_refs(_db, pid, shard_counts[pid])
+                random.shuffle(guessed[pid])
+        refs = list(products.values()) + [shards[0] for shards in guessed.values()]
+        snaps = {snap.reference.path: snap for snap in _db.get_all(refs, transaction=tx, timeout=deadline)}
+        stock: Dict[int, _Stock] = {}
+        sharded: set = set()
+        for pid, ref in products.items():
+            snap = snaps.get(ref.path)
+            data = (snap.to_dict() if snap is not None and snap.exists else None) or {}
+            shards = int(data.get(STOCK_SHARDS) or 0)
+            if shards != shard_counts.get(pid, 0):
+                stale[0] = True
+            if not shards:
+                stock[pid] = _Stock(data, [(ref, int(data.get('quantity', 0)))], [])
                 continue
-            if need > current:
-                raise ValueError(f'Insufficient stock for product {data.get("name", pid)}: need {need}, have {current}')
-            new_q = current - need
-            tx.update(ref, {'quantity': new_q})
-            new_qty_map[pid] = new_q
-        return new_qty_map
+            sharded.add(pid)
+            if shards == shard_counts.get(pid):
+                first = guessed[pid][0]
+                first_snap = snaps.get(first.path)
+                stock[pid] = _Stock(data, [(first, _shard_quantity(first_snap) if first_snap else 0)], guessed[pid][1:])
+            else:
+                unread = _shard_refs(_db, pid, shards)
+                random.shuffle(unread)
+                stock[pid] = _Stock(data, [], unread)
+
+        results: List[Union[Dict[int, int], ValueError]] = []
+        for need in carts:
+            short = None
+            for pid in sorted(need):
+                entry = stock[pid]
+                entry.read_until(need[pid], tx, deadline)
+                if need[pid] > entry.available:
+                    name = entry.data.get('name', pid)
+                    short = ValueError(f'Insufficient stock for product {name}: need {need[pid]}, have {entry.available}')
+                    break
+            if short is not None:
+                results.append(short)
+                continue
+            for pid, qty in need.items():
+                stock[pid].taken += qty
+            results.append({pid: stock[pid].available for pid in need})
+
+        for pid, entry in stock.items():
+            if not entry.taken:
+                continue
+            for ref, qty, units in entry.writes():
+                tx.update(ref, {'quantity': qty})
+                taken.append((ref, units))
+            if pid in sharded:
+                # Only the shards read are known; move the mirrored total by the delta
+                current = int(entry.data.get('quantity', 0))
+                changes.append(({**entry.data, 'id': pid}, current, max(0, current - entry.taken)))
+            else:
+                changes.append(({**entry.data, 'id': pid}, entry.initial, entry.available))
+        return results
+
+    try:
+        results = _apply(db.transaction(), db)
+    finally:
+        if report:
+            _report_transaction(len(carts), attempts[0], started)
+        if stale[0]:
+            invalidate_cache(STOCK_SHARDS)
+    _apply_stock_to_stats(db, changes)
+    return SimpleNamespace(results=results, attempts=attempts[0], taken=list(taken), changes=list(changes))
+
+
+def _report_transaction(carts: int, attempts: int, started: float, chunks: int = 1, rolled_back: bool = False,
+                        rollback_failed: bool = False) -> None:
+    record_reservation_transaction(attempts, chunks, rolled_back, rollback_failed)
+    if attempts > 1 or chunks > 1:
+        logger.info('Stock reservation of %d cart(s) took %.1f ms: %d attempt(s), %d chunk(s)%s',
+                    carts, (time.perf_counter() - started) * 1000, attempts, chunks,
+                    ', rolled back' if rolled_back else '')
+
+
+def _reserve_chunked(db, cart: Dict[int, int], shard_counts: Dict[int, int]) -> Union[Dict[int, int], ValueError]:
+    """Reserve a cart too large for one transaction in several, all or nothing.
+
+    Chunks commit one after another in product id order. If one is short of
+    stock or fails, the units taken by the earlier chunks are added back with
+    server-side increments (no reads, so the rollback cannot conflict), and
+    the short chunk's ValueError is returned or its error re-raised. Other
+    checkouts may briefly see the earlier chunks' units as sold.
+    """
+    chunks: List[Dict[int, int]] = [{}]
+    for pid in sorted(cart):
+        if chunks[-1] and _write_cost(set(chunks[-1]) | {pid}, shard_counts) > MAX_TRANSACTION_WRITES:
+            chunks.append({})
+        chunks[-1][pid] = cart[pid]
+
+    started = time.perf_counter()
+    attempts = done = 0
+    reserved: Dict[int, int] = {}
+    taken: List[Tuple[Any, int]] = []
+    changes: List[Tuple[Dict[str, Any], int, int]] = []
+    try:
+        for chunk in chunks:
+            done += 1
+            committed = _commit_carts(db, [chunk], shard_counts, report=False)
+            attempts += committed.attempts
+            if isinstance(committed.results[0], ValueError):
+                _rollback(db, taken, changes)
+                _report_transaction(1, attempts, started, done, rolled_back=bool(taken))
+                return committed.results[0]
+            reserved.update(committed.results[0])
+            taken.extend(committed.taken)
+            changes.extend(committed.changes)
+    except Exception:
+        try:
+            _rollback(db, taken, changes)
+        except Exception:
+            _report_transaction(1, attempts, started, done, rolled_back=True, rollback_failed=True)
+            raise
+        _report_transaction(1, attempts, started, done, rolled_back=bool(taken))
+        raise
+    _report_transaction(1, attempts, started, done)
+    return reserved
+
+
+def _rollback(db, taken: List[Tuple[Any, int]], changes: List[Tuple[Dict[str, Any], int, int]]) -> None:
+    """Put back units taken by committed reservation chunks."""
+    if not taken:
+        return
+    try:
+        for start in range(0, len(taken), MAX_TRANSACTION_WRITES):
+            batch = db.batch()
+            for ref, units in taken[start:start + MAX_TRANSACTION_WRITES]:
+                batch.update(ref, {'quantity': gcfirestore.Increment(units)})
+            batch.commit()
+    except Exception:
+        logger.error('Could not roll back a partial stock reservation; add back by hand: %s',
+                     ', '.join(f'{ref.path} +{units}' for ref, units in taken))
+        raise
+    _apply_stock_to_stats(db, [(data, new, old) for data, old, new in changes])
+
+
+@_rpc()
+def release_stock(requested: Dict[int, int]) -> None:
+    """Put back units reserved for a checkout whose sale was not saved.
+
+    Like the rollback of a chunked reservation this uses server-side
+    increments, so it cannot conflict; a sharded product gets its units back
+    on one of its shards.
+    """
+    db = get_firestore_client()
+    if not db or not gcfirestore or not requested:
+        return
+    refs = {pid: db.collection('products').document(str(pid)) for pid in requested}
+    taken: List[Tuple[Any, int]] = []
+    changes: List[Tuple[Dict[str, Any], int, int]] = []
+    for snap in db.get_all(list(refs.values()), timeout=_deadline()):
+        if not snap.exists:
+            continue
+        pid = int(snap.id)
+        data = snap.to_dict() or {}
+        units = requested[pid]
+        current = int(data.get('quantity', 0))
+        shards = int(data.get(STOCK_SHARDS) or 0)
+        if shards:
+            taken.append((random.choice(_shard_refs(db, pid, shards)), units))
+            # The mirrored total did not move with the shards; reverse the delta the reservation applied
+            changes.append(({**data, 'id': pid}, current, max(0, current - units)))
+        else:
+            taken.append((refs[pid], units))
+            changes.append(({**data, 'id': pid}, current + units, current))
+    try:
+        _rollback(db, taken, changes)
+    finally:
+        invalidate_cache('products')
+
+
+@_rpc()
+def shard_stock(product_id: int, shards: int, reset: bool = False) -> int:
+    """Split a product's stock over ``shards`` shard documents (0: back into the product document).
+
+    Re-sharding redistributes the current total of the shards; with ``reset``
+    the total is taken from the product document's mirrored quantity instead,
+    to resync shards after stock changed behind them. Returns the total.
+    """
+    if not 0 <= shards <= MAX_STOCK_SHARDS:
+        raise ValueError(f'Shard count must be between 0 and {MAX_STOCK_SHARDS}')
+    db = get_firestore_client()
+    if not db or not gcfirestore:
+        raise RuntimeError('Firestore not available for transactional stock update')
+    product = db.collection('products').document(str(product_id))
+
+    @gcfirestore.transactional
+    def _apply(tx) -> int:
+        snap = product.get(transaction=tx)
+        if not snap.exists:
+            raise KeyError(f'Product {product_id} is not in Firestore')
+        data = snap.to_dict() or {}
+        old = _shard_refs(db, product_id, int(data.get(STOCK_SHARDS) or 0))
+        if old and not reset:
+            total = sum(max(0, int((s.to_dict() or {}).get('quantity', 0))) for s in db.get_all(old, transaction=tx))
+        else:
+            total = int(data.get('quantity', 0))
+        for n, ref in enumerate(_shard_refs(db, product_id, shards)):
+            tx.set(ref, {'quantity': total // shards + (1 if n < total % shards else 0)})
+        for ref in old[shards:]:
+            tx.delete(ref)
+        tx.update(product, {STOCK_SHARDS: shards, 'quantity': total})
+        return total
+
+    try:
+        return _apply(db.transaction())
+    finally:
+        invalidate_cache(STOCK_SHARDS, 'products')
 
-    return _apply(transaction, db, requested)
+
+@_rpc()
+def adjust_sharded_stock(product_id: int, delta: int) -> bool:
+    """Apply a manual stock change (restock, correction) to a sharded product's shards.
+
+    Units are added to the emptiest shard and removed from the fullest ones,
+    never below zero. Returns False when the product is not sharded.
+    """
+    if not delta:
+        return False
+    db = get_firestore_client()
+    if not db or not gcfirestore:
+        raise RuntimeError('Firestore not available for transactional stock update')
+    product = db.collection('products').document(str(product_id))
+
+    @gcfirestore.transactional
+    def _apply(tx) -> bool:
+        # The shard count comes from the product document, read in the transaction
+        snap = product.get(transaction=tx)
+        shards = int(((snap.to_dict() if snap.exists else None) or {}).get(STOCK_SHARDS) or 0)
+        if not shards:
+            return False
+        docs = sorted(
+            ((s.reference, max(0, int((s.to_dict() or {}).get('quantity', 0))))
+             for s in db.get_all(_shard_refs(db, product_id, shards), transaction=tx)),
+            key=lambda d: d[1],
+        )
+        if delta > 0:
+            ref, qty = docs[0]
+            tx.set(ref, {'quantity': qty + delta})
+            return True
+        left = -delta
+        for ref, qty in reversed(docs):
+            take = min(qty, left)
+            if take:
+                tx.set(ref, {'quantity': qty - take})
+                left -= take
+        return True
+
+    return _apply(db.transaction())
+
+
+def _apply_stock_to_stats(db, changes: List[Tuple[Dict[str, Any], int, int]]) -> None:
+    """Apply committed stock changes to the `stats/inventory` aggregates document.
+
+    Uses server-side increments outside the stock transaction so the stats
+    document never joins (or serializes) the per-product transactions. The
+    ORM aggregates are mirrored over it through the outbox afterwards.
+    """
+    if not changes:
+        return
+    update: Dict[str, Any] = {
+        'total_units': gcfirestore.Increment(sum(new - old for _, old, new in changes)),
+        'stock_value': gcfirestore.Increment(
+            sum((new - old) * float(data.get('cost_price') or 0) for data, old, new in changes)
+        ),
+    }
+    for data, old, new in changes:
+        field = f"low_stock.{data['id']}"
+        if new <= LOW_STOCK_THRESHOLD:
+            update[field] = {'id': data['id'], 'sku': data.get('sku'), 'name': data.get('name'), 'quantity': new}
+        elif old <= LOW_STOCK_THRESHOLD:
+            update[field] = gcfirestore.DELETE_FIELD
+    try:
+        db.collection('stats').document('inventory').update(update)
+    except Exception:
+        # Missing stats document; the outbox mirror will create it
+        pass
+    invalidate_cache('stats')
+
+
+def get_inventory_stats() -> Optional[Dict[str, Any]]:
+    """Dashboard aggregates document, or None if it has not been written yet."""
+    return _cached('stats', 'inventory', _load_inventory_stats) or None
+
+
+@_rpc(read=True)
+def _load_inventory_stats() -> Dict[str, Any]:
+    db = get_firestore_client()
+    if not db:
+        return {}
+    doc = db.collection('stats').document('inventory').get(timeout=_deadline())
+    return (doc.to_dict() or {}) if doc.exists else {}
 
 
 # ---------- Customers ----------
 def list_customers() -> list[dict]:
+    return _cached('customers', 'all', _load_customers)
+
+
+@_rpc(read=True)
+def _load_customers() -> list[dict]:
     db = get_firestore_client()
     if not db:
         return []
-    docs = db.collection('customers').order_by('name').stream()
-    results: list[dict] = []
-    for doc in docs:
-        d = doc.to_dict() or {}
-        cid = d.get('id') or (doc.id.isdigit() and int(doc.id) or doc.id)
-        d['id'] = cid
-        d['pk'] = cid
-        results.append(d)
-    return results
+    docs = db.collection('customers').order_by('name').stream(timeout=_deadline())
+    return [_with_pk(doc) for doc in docs]
+
+
+def page_customers(filters: Dict[str, Any], cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+    """One page of customers ordered by name, optionally by name prefix."""
+    return _cached('customers', _page_key(filters, cursor, limit),
+                   lambda: _load_customers_page(filters, cursor, limit))
+
 
+@_rpc(read=True)
+def _load_customers_page(filters: Dict[str, Any], cursor: Optional[str], limit: int) -> Page:
+    db = get_firestore_client()
+    if not db:
+        return Page([], None)
+    query = db.collection('customers')
+    if filters.get('q'):
+        query = _where(_where(query, 'name', '>=', filters['q']), 'name', '<', filters['q'] + PREFIX_END)
+    return _keyset_page(query, 'name', cursor, limit)
+
+@_rpc()
 def upsert_customer(customer) -> None:
     db = get_firestore_client()
     if not db:
         return
-    data = {
-        'id': customer.id,
-        'name': customer.name,
-        'phone': customer.phone,
-        'email': customer.email,
-        'address': customer.address,
-        'created_at': getattr(customer, 'created_at', None).isoformat() if getattr(customer, 'created_at', None) else None,
-    }
-    db.collection('customers').document(str(customer.id)).set(data, merge=True)
+    db.collection('customers').document(str(customer.id)).set(customer_doc(customer), merge=True)
+    invalidate_cache('customers')
 
 
 # ---------- Sales ----------
 
+@_rpc()
 def write_sale_and_sync_products(sale) -> None:
     """Write a canonical sale document and ensure product quantities are mirrored.
     Assumes Django already validated stock and decremented local Product.quantity.
@@ -144,77 +736,30 @@ def write_sale_and_sync_products(sale) -> None:
     if not db:
         return
 
-    items = []
-    for it in sale.items.all():
-        items.append({
-            'product_id': it.product_id,
-            'product_name': it.product.name,
-            'quantity': int(it.quantity),
-            'unit_price': float(it.unit_price),
-            'total_price': float(it.total_price),
-        })
-
-    sale_doc = {
-        'id': sale.id,
-        'invoice_number': sale.invoice_number,
-        'customer_id': sale.customer_id,
-        'customer_name': sale.customer.name,
-        'total_amount': float(sale.total_amount),
-        'date': sale.date.isoformat(),
-        'created_at': sale.created_at.isoformat() if sale.created_at else None,
-        'items': items,
-    }
-    db.collection('sales').document(str(sale.id)).set(sale_doc, merge=False)
-
-    # Mirror product quantities post-sale
+    writes = sale_documents(sale)
     batch = db.batch()
-    for it in sale.items.all():
-        p = it.product
-        ref = db.collection('products').document(str(p.id))
-        batch.set(ref, {
-            'id': p.id,
-            'sku': p.sku,
-            'name': p.name,
-            'description': p.description,
-            'cost_price': float(p.cost_price),
-            'selling_price': float(p.selling_price),
-            'quantity': int(p.quantity),
-        }, merge=True)
+    for path, data, merge in writes:
+        batch.set(db.document(path), data, merge=merge)
     batch.commit()
+    invalidate_for_paths(path for path, _, _ in writes)
 
 
+@_rpc(read=True)
 def get_sale_for_receipt(sale_id: int) -> Optional[SimpleNamespace]:
     """Return a namespaced object suitable for the template."""
     db = get_firestore_client()
     if not db:
         return None
-    doc = db.collection('sales').document(str(sale_id)).get()
+    doc = db.collection('sales').document(str(sale_id)).get(timeout=_deadline())
     if not doc.exists:
         return None
     d = doc.to_dict()
-    # Build a small object with attribute access similar to model
-    items = [
-        _ns({
-            'product': _ns({'name': it.get('product_name')}),
-            'quantity': it.get('quantity'),
-            'unit_price': it.get('unit_price'),
-            'total_price': it.get('total_price'),
-        })
-        for it in d.get('items', [])
-    ]
-    sale_obj = _ns({
-        'id': d.get('id'),
-        'invoice_number': d.get('invoice_number'),
-        'customer': _ns({'name': d.get('customer_name')}),
-        'date': d.get('date'),
-        'total_amount': d.get('total_amount'),
-        'items': items,
-    })
-    return sale_obj
-
-
-def list_recent_sales(limit: int = 5) -> list[dict]:
-    """Fetch recent sales from Firestore for dashboard widgets."""
+    return sale_from_doc(d)
+
+
+@_rpc(read=True)
+def list_recent_sales(limit: int = 5) -> list:
+    """Most recent sales from Firestore (sale_from_doc objects) for dashboard widgets."""
     db = get_firestore_client()
     if not db:
         return []
@@ -222,18 +767,7 @@ def list_recent_sales(limit: int = 5) -> list[dict]:
         # Order by ISO datetime string is acceptable for ISO-8601 format
         direction = gcfirestore.Query.DESCENDING if gcfirestore else None
         q = db.collection('sales').order_by('date', direction=direction).limit(limit)
-        docs = q.stream()
+        docs = q.stream(timeout=_deadline())
     except Exception:
         return []
-    results: list[dict] = []
-    for doc in docs:
-        d = doc.to_dict() or {}
-        d['id'] = d.get('id') or doc.id
-        results.append({
-            'id': d.get('id'),
-            'invoice_number': d.get('invoice_number'),
-            'customer_name': d.get('customer_name'),
-            'total_amount': d.get('total_amount'),
-            'date': d.get('date'),
-        })
-    return results
+    return [sale_from_doc(_with_pk(doc)) for doc in docs]
@@ -1,5 +1,10 @@
+import re
+
 from django import forms
-from django.forms import inlineformset_factory
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from .models import Product, Customer, Sale, SaleItem
 
 class ProductForm(forms.ModelForm):
@@ -7,6 +12,18 @@ class ProductForm(forms.ModelForm):
         model = Product
         fields = ['sku', 'name', 'description', 'cost_price', 'selling_price', 'quantity']
 
+class ProductRowForm(forms.Form):
+    """One row of a catalog CSV import. SKU uniqueness is handled by the upsert."""
+    sku = forms.CharField(max_length=50)
+    name = forms.CharField(max_length=200)
+    description = forms.CharField(required=False)
+    cost_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    selling_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    quantity = forms.IntegerField(min_value=0)
+
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(label='Catalog CSV', help_text='Columns: sku, name, description, cost_price, selling_price, quantity')
+
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
@@ -27,36 +44,164 @@ class SaleForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['customer'].queryset = Customer.objects.order_by('name')
 
+class ProductChoices:
+    """In-stock products for a sale form, loaded with one query and shared by every row.
+
+    Rows validate against it instead of querying per row, and the <option>
+    markup is rendered once and reused by every row's select.
+    """
+    def __init__(self, queryset=None):
+        self.queryset = queryset if queryset is not None else Product.objects.filter(quantity__gt=0)
+        self._all = None
+        self._subset = {}
+        self._preloaded = set()
+        self._options_html = None
+
+    @property
+    def products(self):
+        if self._all is None:
+            self._all = {p.id: p for p in self.queryset.order_by('name', 'id')}
+        return self._all
+
+    def preload(self, ids):
+        """Load just the products a submitted cart refers to (one query)."""
+        if self._all is None and ids:
+            self._subset.update((p.id, p) for p in self.queryset.filter(id__in=ids))
+            self._preloaded.update(ids)
+
+    def get(self, pk):
+        if self._all is None and pk in self._preloaded:
+            # Sold out or deleted ids are simply absent; no need to load the catalog
+            return self._subset.get(pk)
+        return self.products.get(pk)
+
+    def options_html(self, empty_label):
+        if self._options_html is None:
+            options = [format_html('<option value="">{}</option>', empty_label)]
+            for p in self.products.values():
+                options.append(format_html(
+                    '<option value="{}" data-stock="{}" data-price="{}">{}</option>',
+                    p.id, p.quantity, p.selling_price, str(p),
+                ))
+            self._options_html = ''.join(options)
+        return self._options_html
+
+class ProductSelect(forms.Select):
+    """Select that reuses the shared, pre-rendered options of ProductChoices."""
+    product_choices = None
+    empty_label = ''
+
+    def render(self, name, value, attrs=None, renderer=None):
+        if self.product_choices is None:
+            return super().render(name, value, attrs, renderer)
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        options = self.product_choices.options_html(self.empty_label)
+        if value not in (None, ''):
+            marker = format_html('<option value="{}"', value)
+            options = options.replace(marker, marker + ' selected', 1)
+        attrs = self.build_attrs(self.attrs, attrs)
+        return format_html('<select name="{}"{}>{}</select>', name, flatatt(attrs), mark_safe(options))
+
+class ProductChoiceField(forms.ModelChoiceField):
+    """Product field that validates against shared ProductChoices when bound to one."""
+    widget = ProductSelect
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Product.objects.filter(quantity__gt=0), **kwargs)
+        self.product_choices = None
+
+    def bind_choices(self, product_choices):
+        self.product_choices = product_choices
+        self.widget.product_choices = product_choices
+        self.widget.empty_label = self.empty_label or ''
+
+    def to_python(self, value):
+        if self.product_choices is None:
+            return super().to_python(value)
+        if value in self.empty_values:
+            return None
+        try:
+            product = self.product_choices.get(int(value))
+        except (TypeError, ValueError):
+            product = None
+        if product is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return product
+
 class SaleItemForm(forms.ModelForm):
     quantity = forms.IntegerField(min_value=1, initial=1)
-    product = forms.ModelChoiceField(
-        queryset=Product.objects.filter(quantity__gt=0),
-        empty_label="Select a product"
-    )
+    product = ProductChoiceField(empty_label="Select a product")
 
     class Meta:
         model = SaleItem
         fields = ['product', 'quantity']
         widgets = {
             'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': '1'}),
-            'product': forms.Select(attrs={'class': 'form-control'})
+            'product': ProductSelect(attrs={'class': 'form-control'})
         }
 
-    def clean(self):
-        cleaned_data = super().clean()
-        product = cleaned_data.get('product')
-        quantity = cleaned_data.get('quantity')
+    def __init__(self, *args, product_choices=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if product_choices is not None:
+            self.fields['product'].bind_choices(product_choices)
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self.fields['product'].product_choices is not None:
+            # Already resolved from the shared load; skip the per-row FK existence query
+            exclude.add('product')
+        return exclude
+
+class BaseSaleItemFormSet(BaseInlineFormSet):
+    """Sale rows sharing one product load; stock is checked for the whole cart at once."""
 
-        if product and quantity:
-            if quantity > product.quantity:
-                raise forms.ValidationError(f'Only {product.quantity} units available for {product.name}')
-        return cleaned_data
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.product_choices = ProductChoices()
+        if self.is_bound:
+            pattern = re.compile(rf'^{re.escape(self.prefix)}-\d+-product$')
+            self.product_choices.preload({
+                int(value) for key, value in self.data.items()
+                if pattern.match(key) and str(value).isdigit()
+            })
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['product_choices'] = self.product_choices
+        return kwargs
+
+    def lines(self):
+        """(product_id, quantity) for every filled, non-deleted row."""
+        return [
+            (form.cleaned_data['product'].id, int(form.cleaned_data['quantity']))
+            for form in self.forms
+            if form.cleaned_data and not form.cleaned_data.get('DELETE')
+        ]
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        requested = {}
+        for pid, qty in self.lines():
+            requested[pid] = requested.get(pid, 0) + qty
+        if not requested:
+            raise forms.ValidationError('Add at least one product to the sale.')
+        errors = []
+        for pid, need in requested.items():
+            product = self.product_choices.get(pid)
+            if need > product.quantity:
+                errors.append(f'Only {product.quantity} units available for {product.name}')
+        if errors:
+            raise forms.ValidationError(errors)
 
 # Create a formset for sale items
 SaleItemFormSet = inlineformset_factory(
     Sale, 
     SaleItem,
     form=SaleItemForm,
+    formset=BaseSaleItemFormSet,
     extra=1,  # Number of empty forms to display
     can_delete=True,
     validate_min=1,  # Require at least one item
@@ -0,0 +1,93 @@
+"""Invoice number allocation.
+
+Invoice numbers keep the ``INV<YYYYMMDD><n>`` format but ``n`` now comes from
+a dedicated counter instead of a lookup of the latest Sale. On Postgres this
+is a native sequence (``nextval`` never blocks and is not rolled back); on
+other databases a single ``InvoiceCounter`` row is bumped.
+
+Each worker reserves ``INVOICE_BLOCK_SIZE`` numbers at a time (default 1) and
+hands them out locally, so numbering is collision-free under concurrency but
+may contain gaps when a worker exits with unused numbers.
+"""
+import os
+import threading
+from collections import deque
+from typing import List
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import InvoiceCounter
+
+SEQUENCE_NAME = 'inventory_invoice_seq'
+COUNTER_NAME = 'invoice'
+
+_lock = threading.Lock()
+_pool: deque = deque()
+
+
+def _block_size() -> int:
+    try:
+        return max(1, int(os.environ.get('INVOICE_BLOCK_SIZE', '1')))
+    except ValueError:
+        return 1
+
+
+def _uses_sequence() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def _reserve_from_sequence(size: int) -> List[int]:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SEQUENCE_NAME, size])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _reserve_from_counter(size: int) -> List[int]:
+    with transaction.atomic():
+        counters = InvoiceCounter.objects.filter(name=COUNTER_NAME)
+        if not counters.update(value=F('value') + size):
+            InvoiceCounter.objects.get_or_create(name=COUNTER_NAME)
+            counters.update(value=F('value') + size)
+        end = counters.values_list('value', flat=True).get()
+    return list(range(end - size + 1, end + 1))
+
+
+def _release(numbers: List[int]) -> None:
+    with _lock:
+        _pool.extend(numbers)
+
+
+def reset_invoice_pool() -> None:
+    """Forget numbers reserved by this worker; they become gaps in the numbering."""
+    with _lock:
+        _pool.clear()
+
+
+def reserve_block(size: int) -> List[int]:
+    """Reserve ``size`` unused sequence values from the database."""
+    if _uses_sequence():
+        return _reserve_from_sequence(size)
+    return _reserve_from_counter(size)
+
+
+def next_invoice_sequence() -> int:
+    with _lock:
+        if _pool:
+            return _pool.popleft()
+
+    numbers = reserve_block(_block_size())
+    first, rest = numbers[0], numbers[1:]
+    if rest:
+        if _uses_sequence():
+            _release(rest)
+        else:
+            # The counter bump rolls back with the surrounding transaction, so
+            # only keep the rest of the block once it is durably reserved.
+            transaction.on_commit(lambda: _release(rest))
+    return first
+
+
+def next_invoice_number() -> str:
+    return f"INV{timezone.now().strftime('%Y%m%d')}{next_invoice_sequence():04d}"
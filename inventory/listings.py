@@ -0,0 +1,119 @@
+"""Keyset (cursor) pagination and filters for the product/customer listings.
+
+Pages are fetched by seeking past the last (sort value, id) pair of the
+previous page instead of using OFFSET, so every page costs the same no matter
+how deep into the catalog it is. The ORM helpers live here; the Firestore
+equivalents in firestore_repo share the cursor format and Page type.
+
+Name and SKU searches are case-insensitive prefix matches (``istartswith``).
+On PostgreSQL they are served by ``UPPER(column) text_pattern_ops`` indexes
+(migration 0010), which compare bytes rather than by the database's locale
+collation. Firestore has no case-insensitive queries, so there the prefix is a
+case-sensitive range ending at PREFIX_END.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional
+
+from django.db.models import Q
+
+from .models import Customer, Product
+
+PAGE_SIZE = 50
+LOW_STOCK_THRESHOLD = 5
+# Upper bound for Firestore prefix range scans; sorts after any real character there
+PREFIX_END = '\uf8ff'
+
+
+class Page:
+    """One page of results plus the cursor for the next one (None on the last page)."""
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    """Return the [sort value, id] pair of a cursor, or None if missing/invalid."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    return values
+
+
+def listing_filters(params) -> Dict[str, Any]:
+    """Normalize listing filters from a QueryDict."""
+    def flag(name):
+        return params.get(name, '').lower() in ('1', 'true', 'on', 'yes')
+
+    return {
+        'q': params.get('q', '').strip(),
+        'sku': params.get('sku', '').strip(),
+        'in_stock': flag('in_stock'),
+        'low_stock': flag('low_stock'),
+    }
+
+
+def product_sort_field(filters: Dict[str, Any]) -> str:
+    # A SKU prefix is served from the SKU index, everything else by name
+    return 'sku' if filters.get('sku') else 'name'
+
+
+def _prefix(qs, field: str, prefix: str):
+    return qs.filter(**{f'{field}__istartswith': prefix})
+
+
+def keyset_page(qs, sort_field: str, cursor: Optional[str], limit: int = PAGE_SIZE) -> Page:
+    qs = qs.order_by(sort_field, 'id')
+    after = decode_cursor(cursor)
+    if after:
+        value, last_id = after
+        qs = qs.filter(Q(**{f'{sort_field}__gt': value}) | Q(**{sort_field: value, 'id__gt': last_id}))
+    rows = list(qs[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, sort_field), last.id])
+    return Page(rows, next_cursor)
+
+
+def product_page(filters: Dict[str, Any], cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+    qs = Product.objects.all()
+    if filters.get('q'):
+        qs = _prefix(qs, 'name', filters['q'])
+    if filters.get('sku'):
+        qs = _prefix(qs, 'sku', filters['sku'])
+    if filters.get('in_stock'):
+        qs = qs.filter(quantity__gt=0)
+    if filters.get('low_stock'):
+        qs = qs.filter(quantity__lte=LOW_STOCK_THRESHOLD)
+    return keyset_page(qs, product_sort_field(filters), cursor, limit)
+
+
+def customer_page(filters: Dict[str, Any], cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+    qs = Customer.objects.all()
+    if filters.get('q'):
+        qs = _prefix(qs, 'name', filters['q'])
+    return keyset_page(qs, 'name', cursor, limit)
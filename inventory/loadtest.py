@@ -0,0 +1,370 @@
+"""Load generator for the browse, price lookup, checkout and receipt flows.
+
+Worker threads pick flows at random according to a weighted mix and drive
+them either in-process through the Django test client or over HTTP against a
+running server. Latencies are collected per flow. After the run, stock is
+checked against the sales created during it: more units sold than were in
+stock is an oversell, and a final quantity that does not match is a lost
+update. Used by ``manage.py loadtest``.
+"""
+import http.cookiejar
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+
+from .models import Customer, Product, Sale, SaleItem
+
+FLOWS = ('browse', 'price', 'checkout', 'receipt')
+DEFAULT_MIX = 'browse=40,price=25,checkout=25,receipt=10'
+SEED_SKU_PREFIX = 'LOADTEST-'
+RECEIPT_PATH = re.compile(r'/sales/(\d+)/receipt/')
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """'browse=40,checkout=20' -> {'browse': 40, 'checkout': 20}; raises ValueError."""
+    mix = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in FLOWS:
+            raise ValueError(f'Unknown flow {name!r}; choose from {", ".join(FLOWS)}')
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('The mix needs at least one flow with a positive weight')
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list (0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# ---------- Transports ----------
+class ClientTransport:
+    """In-process requests through django.test.Client (one per worker)."""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Tuple[int, str]:
+        response = self.client.get(path, params or {}, secure=True)
+        return response.status_code, response.get('Location', '')
+
+    def post(self, path: str, data: Dict[str, Any]) -> Tuple[int, str]:
+        response = self.client.post(path, data, secure=True)
+        return response.status_code, response.get('Location', '')
+
+    def close(self) -> None:
+        close_old_connections()
+        connection.close()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Requests over HTTP with a per-worker cookie jar and CSRF token."""
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def _open(self, request) -> Tuple[int, str]:
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers.get('Location', '')
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code, exc.headers.get('Location', '')
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Tuple[int, str]:
+        url = self.base_url + path + ('?' + urllib.parse.urlencode(params) if params else '')
+        return self._open(urllib.request.Request(url))
+
+    def _csrf_token(self, path: str) -> str:
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        self.get(path)
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def post(self, path: str, data: Dict[str, Any]) -> Tuple[int, str]:
+        token = self._csrf_token(path)
+        body = urllib.parse.urlencode(dict(data, csrfmiddlewaretoken=token)).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, headers={
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Referer': self.base_url + path,
+            'X-CSRFToken': token,
+        })
+        return self._open(request)
+
+    def close(self) -> None:
+        pass
+
+
+# ---------- Results ----------
+class Results:
+    """Thread-safe latency samples and outcome counts per flow."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {flow: [] for flow in FLOWS}
+        self.outcomes: Dict[str, Dict[str, int]] = {flow: {'ok': 0, 'rejected': 0, 'error': 0} for flow in FLOWS}
+        self.errors: Dict[str, int] = {}
+        self.sale_ids: List[int] = []
+
+    def add(self, flow: str, seconds: float, outcome: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.latencies[flow].append(seconds * 1000)
+            self.outcomes[flow][outcome] += 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def add_sale(self, sale_id: int) -> None:
+        with self._lock:
+            self.sale_ids.append(sale_id)
+
+    def random_sale(self, rng: random.Random) -> Optional[int]:
+        with self._lock:
+            return rng.choice(self.sale_ids) if self.sale_ids else None
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        flows = {}
+        total = 0
+        for flow in FLOWS:
+            values = sorted(self.latencies[flow])
+            if not values:
+                continue
+            total += len(values)
+            flows[flow] = {
+                'requests': len(values),
+                **self.outcomes[flow],
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            }
+        everything = sorted(v for values in self.latencies.values() for v in values)
+        return {
+            'elapsed': elapsed,
+            'requests': total,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'p50': percentile(everything, 50),
+            'p95': percentile(everything, 95),
+            'p99': percentile(everything, 99),
+            'errors': sum(o['error'] for o in self.outcomes.values()),
+            'flows': flows,
+            'error_kinds': dict(sorted(self.errors.items(), key=lambda kv: -kv[1])),
+        }
+
+
+# ---------- Flows ----------
+class UnexpectedStatus(Exception):
+    def __init__(self, status: int):
+        super().__init__(f'HTTP {status}')
+
+
+class Worker(threading.Thread):
+    """Runs randomly chosen flows until the deadline or request budget is used up."""
+
+    def __init__(self, index: int, runner: 'LoadTest'):
+        super().__init__(name=f'loadtest-{index}', daemon=True)
+        self.runner = runner
+        self.rng = random.Random(runner.seed + index)
+
+    def run(self):
+        runner = self.runner
+        transport = runner.transport_factory()
+        flows, weights = zip(*runner.mix.items())
+        try:
+            while runner.take_ticket():
+                flow = self.rng.choices(flows, weights)[0]
+                started = time.perf_counter()
+                try:
+                    outcome = getattr(self, flow)(transport)
+                    error = None
+                except UnexpectedStatus as exc:
+                    outcome, error = 'error', str(exc)
+                except Exception as exc:
+                    outcome, error = 'error', f'{type(exc).__name__}: {str(exc)[:100]}'
+                runner.results.add(flow, time.perf_counter() - started, outcome, error)
+        finally:
+            transport.close()
+
+    @staticmethod
+    def _status(status: int) -> str:
+        if status != 200:
+            raise UnexpectedStatus(status)
+        return 'ok'
+
+    def browse(self, transport) -> str:
+        params = {}
+        if self.rng.random() < 0.3:
+            params['q'] = self.rng.choice(self.runner.products)[1][:4]
+        status, _ = transport.get('/products/', params)
+        if status == 200 and self.rng.random() < 0.5:
+            status, _ = transport.get('/')
+        return self._status(status)
+
+    def price(self, transport) -> str:
+        if self.rng.random() < 0.5:
+            pid = self.rng.choice(self.runner.products)[0]
+            status, _ = transport.get(f'/api/products/{pid}/')
+        else:
+            ids = [p[0] for p in self.rng.sample(self.runner.products, min(10, len(self.runner.products)))]
+            status, _ = transport.get('/api/products/batch/', {'ids': ','.join(map(str, ids))})
+        return self._status(status)
+
+    def checkout(self, transport) -> str:
+        runner = self.runner
+        lines = self.rng.sample(runner.products, min(runner.lines, len(runner.products)))
+        data = {
+            'customer': self.rng.choice(runner.customer_ids),
+            'items-TOTAL_FORMS': len(lines),
+            'items-INITIAL_FORMS': 0,
+            'items-MIN_NUM_FORMS': 0,
+            'items-MAX_NUM_FORMS': 1000,
+        }
+        for i, (pid, _) in enumerate(lines):
+            data[f'items-{i}-product'] = pid
+            data[f'items-{i}-quantity'] = self.rng.randint(1, runner.max_quantity)
+        status, location = transport.post('/sales/create/', data)
+        match = RECEIPT_PATH.search(location) if status == 302 else None
+        if match:
+            runner.results.add_sale(int(match.group(1)))
+            return 'ok'
+        # Form re-rendered (product sold out) or redirected back with a stock message
+        if status not in (200, 302):
+            raise UnexpectedStatus(status)
+        return 'rejected'
+
+    def receipt(self, transport) -> str:
+        sale_id = self.runner.results.random_sale(self.rng) or self.runner.existing_sale_id
+        if sale_id is None:
+            return self.browse(transport)
+        status, _ = transport.get(f'/sales/{sale_id}/receipt/')
+        return self._status(status)
+
+
+class LoadTest:
+    """One load-test run: setup, workers, and stock verification."""
+
+    def __init__(self, transport_factory: Callable[[], Any], mix: Dict[str, int], concurrency: int,
+                 duration: Optional[float] = None, requests: Optional[int] = None, lines: int = 3,
+                 max_quantity: int = 2, product_limit: int = 200, sku_prefix: Optional[str] = None,
+                 seed: int = 1):
+        self.transport_factory = transport_factory
+        self.mix = {flow: weight for flow, weight in mix.items() if weight > 0}
+        self.concurrency = max(1, concurrency)
+        self.duration = duration
+        self.requests = requests
+        self.lines = max(1, lines)
+        self.max_quantity = max(1, max_quantity)
+        self.product_limit = product_limit
+        self.sku_prefix = sku_prefix
+        self.seed = seed
+        self.results = Results()
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._deadline = None
+
+    def prepare(self) -> None:
+        """Pick the products and customers to use and snapshot their stock."""
+        qs = Product.objects.filter(quantity__gt=0).order_by('id')
+        if self.sku_prefix:
+            qs = qs.filter(sku__startswith=self.sku_prefix)
+        self.products = list(qs.values_list('id', 'name')[:self.product_limit])
+        self.customer_ids = list(Customer.objects.order_by('id').values_list('id', flat=True)[:50])
+        if not self.products or not self.customer_ids:
+            raise ValueError('Need at least one in-stock product and one customer (use --seed)')
+        self.stock_before = dict(Product.objects.filter(id__in=[p[0] for p in self.products])
+                                 .values_list('id', 'quantity'))
+        self.last_sale_id = Sale.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        self.existing_sale_id = self.last_sale_id or None
+
+    def take_ticket(self) -> bool:
+        with self._lock:
+            if self.requests is not None and self._issued >= self.requests:
+                return False
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                return False
+            self._issued += 1
+            return True
+
+    def run(self) -> Dict[str, Any]:
+        self.prepare()
+        if self.duration:
+            self._deadline = time.monotonic() + self.duration
+        workers = [Worker(i, self) for i in range(self.concurrency)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        summary = self.results.summary(time.perf_counter() - started)
+        summary['stock'] = self.verify_stock()
+        return summary
+
+    def verify_stock(self, remote_quantities: Optional[Dict[int, int]] = None) -> Dict[str, Any]:
+        """Compare units sold during the run with the stock snapshot taken before it."""
+        sold = dict(
+            SaleItem.objects.filter(sale_id__gt=self.last_sale_id, product_id__in=self.stock_before)
+            .values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        )
+        current = dict(Product.objects.filter(id__in=self.stock_before).values_list('id', 'quantity'))
+        oversold = {pid: units - self.stock_before[pid] for pid, units in sold.items()
+                    if units > self.stock_before[pid]}
+        mismatched = {pid: qty for pid, qty in current.items()
+                      if qty != max(self.stock_before[pid] - sold.get(pid, 0), 0)}
+        result = {
+            'sales': Sale.objects.filter(id__gt=self.last_sale_id).count(),
+            'units_sold': sum(sold.values()),
+            'oversold_products': len(oversold),
+            'oversold_units': sum(oversold.values()),
+            'mismatched_products': len(mismatched),
+        }
+        if remote_quantities is not None:
+            result['remote_mismatched_products'] = sum(
+                1 for pid, qty in remote_quantities.items()
+                if pid in self.stock_before and qty != max(self.stock_before[pid] - sold.get(pid, 0), 0)
+            )
+        return result
+
+
+def seed_data(products: int, customers: int, stock: int) -> Tuple[int, int]:
+    """Create loadtest products/customers that are missing. Returns (products, customers) created."""
+    from .stats import rebuild_stats
+
+    existing = set(Product.objects.filter(sku__startswith=SEED_SKU_PREFIX).values_list('sku', flat=True))
+    new_products = [
+        Product(sku=f'{SEED_SKU_PREFIX}{i:05d}', name=f'Load test part {i}', description='Generated by loadtest',
+                cost_price=Decimal('10.00'), selling_price=Decimal('15.00') + i % 20, quantity=stock)
+        for i in range(products) if f'{SEED_SKU_PREFIX}{i:05d}' not in existing
+    ]
+    Product.objects.bulk_create(new_products, batch_size=1000)
+    have = Customer.objects.filter(name__startswith='Load test customer').count()
+    Customer.objects.bulk_create([Customer(name=f'Load test customer {i}') for i in range(have, customers)])
+    if new_products:
+        rebuild_stats()
+    return len(new_products), max(customers - have, 0)
@@ -1,49 +1,50 @@
-from django.core.management.base import BaseCommand, CommandParser
-from django.db import transaction
-from inventory.models import Product, Customer, Sale
-from inventory.firestore_repo import upsert_product, upsert_customer, write_sale_and_sync_products
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.backfill import BATCH_LIMIT, Checkpoint, Progress, backfill_collection
+from inventory.firebase import get_firestore_client
+from inventory.firestore_repo import invalidate_cache
+
 
 class Command(BaseCommand):
     help = "Backfill Firestore collections from current Django database."
 
     def add_arguments(self, parser: CommandParser) -> None:
-        parser.add_argument('--include-sales', action='store_true', help='Also write canonical sales and mirror product quantities')
-        parser.add_argument('--sales-batch', type=int, default=200, help='Process sales in batches of N')
+        parser.add_argument('--include-sales', action='store_true', help='Also write canonical sales documents')
+        parser.add_argument('--batch-size', '--sales-batch', dest='batch_size', type=int, default=BATCH_LIMIT,
+                            help=f'Documents per Firestore batch write (max {BATCH_LIMIT})')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent batch commits')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, '.backfill_checkpoint.json'),
+                            help='Checkpoint file recording progress per collection')
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint of an earlier run')
 
     def handle(self, *args, **options):
-        include_sales = options['include_sales']
-        self.stdout.write(self.style.MIGRATE_HEADING('Backfilling products...'))
-        with transaction.atomic():
-            for p in Product.objects.all().iterator():
-                try:
-                    upsert_product(p)
-                except Exception as exc:
-                    self.stderr.write(f"Product {p.id} failed: {exc}")
-        self.stdout.write(self.style.SUCCESS('Products backfilled.'))
-
-        self.stdout.write(self.style.MIGRATE_HEADING('Backfilling customers...'))
-        with transaction.atomic():
-            for c in Customer.objects.all().iterator():
-                try:
-                    upsert_customer(c)
-                except Exception as exc:
-                    self.stderr.write(f"Customer {c.id} failed: {exc}")
-        self.stdout.write(self.style.SUCCESS('Customers backfilled.'))
-
-        if include_sales:
-            self.stdout.write(self.style.MIGRATE_HEADING('Backfilling sales...'))
-            batch_size = options['sales_batch'] or 200
-            qs = Sale.objects.order_by('id')
-            total = qs.count()
-            start = 0
-            while start < total:
-                for s in qs[start:start+batch_size]:
-                    try:
-                        write_sale_and_sync_products(s)
-                    except Exception as exc:
-                        self.stderr.write(f"Sale {s.id} failed: {exc}")
-                start += batch_size
-                self.stdout.write(f"Processed {min(start, total)}/{total} sales...")
-            self.stdout.write(self.style.SUCCESS('Sales backfilled.'))
-
-        self.stdout.write(self.style.SUCCESS('Firestore backfill completed.'))
+        db = get_firestore_client()
+        if not db:
+            raise CommandError('Firestore is not configured (see /health/firebase/).')
+
+        collections = ['products', 'customers'] + (['sales'] if options['include_sales'] else [])
+        checkpoint = Checkpoint(options['checkpoint'], resume=options['resume'])
+        progress = Progress(self.stdout.write)
+        for collection in collections:
+            start = checkpoint.get(collection)
+            suffix = f' (resuming after id {start})' if start else ''
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Backfilling {collection}...{suffix}'))
+            try:
+                written = backfill_collection(db, collection, checkpoint, progress,
+                                              workers=max(1, options['workers']),
+                                              batch_size=options['batch_size'])
+            except Exception as exc:
+                raise CommandError(
+                    f'{collection} backfill failed after id {checkpoint.get(collection)}: {exc}. '
+                    'Re-run with --resume to continue.'
+                )
+            self.stdout.write(self.style.SUCCESS(f'{collection}: {written} documents backfilled.'))
+
+        checkpoint.clear()
+        invalidate_cache(*collections)
+        self.stdout.write(self.style.SUCCESS(
+            f'Firestore backfill completed: {progress.docs} documents, {progress.rate():.0f} docs/sec.'
+        ))
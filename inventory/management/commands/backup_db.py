@@ -1,38 +1,42 @@
-from django.core.management.base import BaseCommand
-from django.core import management
-from datetime import datetime
-import os
-import cloudinary
-import cloudinary.uploader
+from datetime import timedelta
 
-class Command(BaseCommand):
-    help = 'Backup database and upload to Cloudinary'
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.backup import CHUNK_ROWS, get_storage, run_backup
 
-    def handle(self, *args, **kwargs):
-        # Timestamp for the backup file
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = f'backup_{timestamp}.json'
 
-        # Create the backup
-        with open(backup_file, 'w') as f:
-            management.call_command('dumpdata', exclude=['contenttypes', 'auth.permission'], indent=2, stdout=f)
+class Command(BaseCommand):
+    help = (
+        "Back up the database as compressed JSON Lines chunks (loaddata-compatible) with a manifest. "
+        "Incremental by default: only rows changed since the last backup; --full for a complete one."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--full', action='store_true', help='Dump every row instead of changes since the last backup')
+        parser.add_argument('--storage', choices=['cloudinary', 'local'],
+                            help='Where to store it (default: BACKUP_STORAGE, else cloudinary when configured)')
+        parser.add_argument('--dir', help='Directory for local storage (default: BACKUP_DIR or ./backups)')
+        parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows per compressed chunk')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent chunk uploads')
+        parser.add_argument('--overlap-minutes', type=float, default=5.0,
+                            help='Re-dump this much before the previous watermark to cover late commits')
 
-        # Upload to Cloudinary
+    def handle(self, *args, **options):
         try:
-            result = cloudinary.uploader.upload(
-                backup_file,
-                resource_type="raw",
-                public_id=f"backups/{backup_file}",
-                tags=['backup', 'database']
-            )
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully created and uploaded backup: {result["secure_url"]}')
-            )
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Failed to upload backup: {str(e)}')
+            storage = get_storage(options['storage'], options['dir'])
+        except (ValueError, ImportError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Backing up to {storage.name} storage...'))
+        try:
+            manifest = run_backup(
+                storage, full=options['full'], chunk_rows=max(1, options['chunk_rows']),
+                workers=options['workers'], overlap=timedelta(minutes=options['overlap_minutes']),
+                log=self.stdout.write,
             )
-        finally:
-            # Clean up local backup file
-            if os.path.exists(backup_file):
-                os.remove(backup_file)
\ No newline at end of file
+        except Exception as exc:
+            raise CommandError(f'Backup failed: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{manifest['kind'].capitalize()} backup {manifest['id']}: {manifest['rows']} rows, "
+            f"{manifest['bytes'] / 1e6:.1f} MB compressed"
+            + (f", on top of {manifest['base']}" if manifest['base'] else '') + '.'
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from inventory.outbox import flush_all, requeue_dead
+
+
+class Command(BaseCommand):
+    help = "Drain the Firestore outbox (once, or continuously with --loop)."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--loop', action='store_true', help='Keep draining until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between drains with --loop')
+        parser.add_argument('--retry-dead', action='store_true',
+                            help='Requeue writes parked after too many failures before draining')
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            self.stdout.write(f"Requeued {requeue_dead()} parked write(s).")
+        while True:
+            try:
+                written = flush_all()
+                if written:
+                    self.stdout.write(f"Wrote {written} document(s) to Firestore.")
+            except Exception as exc:
+                self.stderr.write(f"Flush failed: {exc}")
+                if not options['loop']:
+                    raise SystemExit(1)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
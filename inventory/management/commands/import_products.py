@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.catalog import CHUNK_SIZE, import_products
+
+
+class Command(BaseCommand):
+    help = "Create or update products by SKU from a catalog CSV file."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('path', help='CSV with columns sku, name, description, cost_price, selling_price, quantity')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows validated and upserted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            fh = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with fh:
+            result = import_products(fh, chunk_size=max(1, options['chunk_size']))
+
+        for line, message in result.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if result.unreported:
+            self.stderr.write(f'... {result.unreported} more rows not shown')
+        style = self.style.SUCCESS if not (result.failed or result.skipped) else self.style.WARNING
+        self.stdout.write(style(
+            f'Imported {result.processed} rows: {result.created} created, '
+            f'{result.updated} updated, {result.skipped} skipped, {result.failed} failed.'
+        ))
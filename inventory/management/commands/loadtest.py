@@ -0,0 +1,144 @@
+import contextlib
+import json
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.loadtest import (
+    DEFAULT_MIX, SEED_SKU_PREFIX, ClientTransport, HttpTransport, LoadTest, parse_mix, seed_data,
+)
+from inventory.models import Product
+from inventory.serializers import product_doc
+
+
+class Command(BaseCommand):
+    help = ("Drive a weighted mix of browse, price lookup, checkout and receipt flows with concurrent "
+            "workers and report latency percentiles, throughput, errors and oversells. "
+            "Writes real sales to the configured database; point it at a local or staging database.")
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--url', help='Base URL of a running server (default: in-process test client)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Worker threads')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (ignored with --requests)')
+        parser.add_argument('--requests', type=int, help='Stop after this many flows instead of after --duration')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Flow weights (default: {DEFAULT_MIX})')
+        parser.add_argument('--lines', type=int, default=3, help='Cart lines per checkout')
+        parser.add_argument('--max-quantity', type=int, default=2, help='Largest quantity per cart line')
+        parser.add_argument('--products', type=int, default=200,
+                            help='Distinct products in play; fewer means more stock contention')
+        parser.add_argument('--seed', type=int, default=0, help='Create this many load-test products first')
+        parser.add_argument('--stock', type=int, default=100, help='Starting quantity of seeded products')
+        parser.add_argument('--customers', type=int, default=20, help='Load-test customers to create with --seed')
+        parser.add_argument('--fake-firestore', action='store_true',
+                            help='Run with Firestore mirroring against the in-process test double '
+                                 '(devtools.fake_firestore, from a source checkout only)')
+        parser.add_argument('--sor', action='store_true', help='With --fake-firestore, use it as stock system of record')
+        parser.add_argument('--random-seed', type=int, default=1, help='Seed for the flow and cart choices')
+        parser.add_argument('--json', dest='json_path', help='Also write the summary to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['sor'] and not options['fake_firestore']:
+            raise CommandError('--sor requires --fake-firestore')
+        if options['fake_firestore'] and options['url']:
+            raise CommandError('--fake-firestore only applies to the in-process client; '
+                               'start the server with its own Firestore settings instead')
+
+        if options['seed']:
+            products, customers = seed_data(options['seed'], options['customers'], options['stock'])
+            self.stdout.write(f'Seeded {products} products and {customers} customers.')
+
+        url = options['url']
+        runner = LoadTest(
+            (lambda: HttpTransport(url)) if url else ClientTransport,
+            mix,
+            concurrency=options['concurrency'],
+            duration=None if options['requests'] else options['duration'],
+            requests=options['requests'],
+            lines=options['lines'],
+            max_quantity=options['max_quantity'],
+            product_limit=options['products'],
+            sku_prefix=SEED_SKU_PREFIX if options['seed'] else None,
+            seed=options['random_seed'],
+        )
+
+        with self._firestore(options) as db:
+            target = url or 'in-process client'
+            firestore = (' with fake Firestore' + (' (system of record)' if options['sor'] else '')) if db else ''
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Load testing {target}{firestore}: {runner.concurrency} workers, mix {options["mix"]}'
+            ))
+            try:
+                summary = runner.run()
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            if db is not None and options['sor']:
+                summary['stock'].update(runner.verify_stock(self._remote_quantities(db)))
+
+        self._report(summary)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(summary, fh, indent=2)
+        if summary['stock']['oversold_products']:
+            raise CommandError(f"{summary['stock']['oversold_products']} products were oversold")
+
+    @contextlib.contextmanager
+    def _firestore(self, options):
+        if not options['fake_firestore']:
+            yield None
+            return
+        # Dev-only test double, kept out of the inventory app
+        try:
+            from devtools import fake_firestore
+        except ImportError:
+            raise CommandError('--fake-firestore needs the devtools package from a source checkout')
+        with fake_firestore.install(sor=options['sor']) as db:
+            if options['sor']:
+                # Stock is reserved against product documents, so they must exist first
+                batch = db.batch()
+                for product in Product.objects.filter(quantity__gt=0).iterator():
+                    batch.set(db.document(f'products/{product.pk}'), product_doc(product))
+                    if len(batch) == 500:
+                        batch.commit()
+                        batch = db.batch()
+                batch.commit()
+            yield db
+
+    @staticmethod
+    def _remote_quantities(db):
+        quantities = {}
+        for snap in db.collection('products').stream():
+            data = snap.to_dict() or {}
+            if snap.id.isdigit() and 'quantity' in data:
+                quantities[int(snap.id)] = int(data['quantity'])
+        return quantities
+
+    def _report(self, summary):
+        self.stdout.write(
+            f"{summary['requests']} flows in {summary['elapsed']:.1f}s "
+            f"({summary['throughput']:.1f}/s), {summary['errors']} errors"
+        )
+        self.stdout.write(f"{'flow':<10}{'count':>7}{'ok':>7}{'rejected':>10}{'errors':>8}"
+                          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        rows = list(summary['flows'].items()) + [('all', {
+            'requests': summary['requests'], 'ok': sum(f['ok'] for f in summary['flows'].values()),
+            'rejected': sum(f['rejected'] for f in summary['flows'].values()), 'error': summary['errors'],
+            'p50': summary['p50'], 'p95': summary['p95'], 'p99': summary['p99'],
+            'max': max((f['max'] for f in summary['flows'].values()), default=0),
+        })]
+        for flow, row in rows:
+            self.stdout.write(f"{flow:<10}{row['requests']:>7}{row['ok']:>7}{row['rejected']:>10}{row['error']:>8}"
+                              f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{row['max']:>9.1f}")
+        for kind, count in summary['error_kinds'].items():
+            self.stdout.write(self.style.WARNING(f'  {count} x {kind}'))
+
+        stock = summary['stock']
+        line = (f"Stock: {stock['sales']} sales, {stock['units_sold']} units sold, "
+                f"{stock['oversold_products']} oversold products ({stock['oversold_units']} units), "
+                f"{stock['mismatched_products']} quantity mismatches")
+        if 'remote_mismatched_products' in stock:
+            line += f", {stock['remote_mismatched_products']} Firestore mismatches"
+        bad = stock['oversold_products'] or stock['mismatched_products'] or stock.get('remote_mismatched_products')
+        self.stdout.write((self.style.ERROR if bad else self.style.SUCCESS)(line))
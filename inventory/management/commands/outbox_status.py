@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandParser
+import json
+
+from inventory.outbox import outbox_stats
+
+
+class Command(BaseCommand):
+    help = "Report Firestore outbox backlog depth and lag."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--json', action='store_true', help='Print the stats as JSON')
+
+    def handle(self, *args, **options):
+        stats = outbox_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, default=str))
+            return
+
+        self.stdout.write(f"Pending writes:   {stats['depth']}")
+        self.stdout.write(f"Distinct docs:    {stats['documents']}")
+        self.stdout.write(f"Lag:              {stats['lag_seconds']:.1f}s")
+        self.stdout.write(f"Retrying writes:  {stats['retrying']}")
+        self.stdout.write(f"Parked writes:    {stats['dead']}")
+        last = stats['last_error']
+        if last:
+            self.stdout.write(self.style.WARNING(
+                f"Last failure: {last['path']} after {last['attempts']} attempt(s)"
+                f"{' (parked)' if last['dead'] else ''}: {last['last_error']}"
+            ))
+        if stats['dead']:
+            self.stdout.write(self.style.WARNING(
+                'Parked writes are not retried; fix the cause, then run flush_outbox --retry-dead.'
+            ))
+        elif stats['depth'] == 0:
+            self.stdout.write(self.style.SUCCESS('Outbox is empty.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard inventory aggregates from the Product table."
+
+    def handle(self, *args, **options):
+        stats = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats: {stats.total_products} products, {stats.total_units} units, "
+            f"stock value {stats.stock_value}, {len(stats.low_stock)} low-stock."
+        ))
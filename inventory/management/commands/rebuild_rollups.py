@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily product/customer sales rollups from Sale and SaleItem."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD); default: all history')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD); default: all history')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(f'Invalid date: {exc}')
+        counts = rebuild_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups: {counts['product_days']} product-days, {counts['customer_days']} customer-days."
+        ))
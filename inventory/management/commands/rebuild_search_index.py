@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.search import install_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = "Recreate the product full-text index and its sync triggers, then reindex all products."
+
+    def handle(self, *args, **options):
+        install_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Product search index rebuilt ({search_backend()}).'))
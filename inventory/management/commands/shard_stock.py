@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from inventory.firebase import firebase_enabled
+from inventory.firestore_repo import shard_stock, stock_shard_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Split the Firestore stock of hot products over several shard documents so concurrent "
+        "reservations stop contending on one document (--shards 0 merges it back). "
+        "Re-running redistributes the current total; --reset takes it from the product's mirrored quantity."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('product_ids', nargs='*', type=int, help='Products to (re)shard')
+        parser.add_argument('--shards', type=int, default=8, help='Shards per product (default 8; 0 unshards)')
+        parser.add_argument('--reset', action='store_true',
+                            help="Resync: split the product document's quantity instead of the shards' total")
+        parser.add_argument('--list', action='store_true', help='Show the sharded products and exit')
+
+    def handle(self, *args, **options):
+        if not firebase_enabled():
+            raise CommandError('Firebase is disabled (set FIREBASE_ENABLED=true).')
+        if options['list']:
+            for pid, shards in sorted(stock_shard_counts().items()):
+                self.stdout.write(f"Product {pid}: {shards} shards")
+            return
+        if not options['product_ids']:
+            raise CommandError('Give at least one product id, or --list.')
+        for pid in options['product_ids']:
+            try:
+                total = shard_stock(pid, options['shards'], reset=options['reset'])
+            except (KeyError, ValueError) as exc:
+                raise CommandError(exc.args[0])
+            self.stdout.write(self.style.SUCCESS(
+                f"Product {pid}: {total} units over {options['shards'] or 'no'} shards."
+            ))
@@ -0,0 +1,406 @@
+"""Per-request performance instrumentation and Prometheus metrics.
+
+MetricsMiddleware opens a RequestMetrics for each request in a context
+variable, and ``track(kind, name)`` adds the time spent in an operation both to
+it and to the process-wide totals. Operations are recorded from:
+
+* every database statement (an execute wrapper added to each new connection),
+* Firestore calls in firestore_repo, the outbox and the event writer (``timed``),
+* template rendering (the ``inventory.metrics.DjangoTemplates`` backend),
+* the model signal handlers.
+
+Stock reservations add their own series: latency per checkout by outcome,
+transaction attempts (retries under contention), chunked carts and rollbacks.
+
+Nested operations are recorded as self time (a query inside a template counts
+as db, not template), so a sync request's breakdown adds up to its duration;
+in async views concurrent reads overlap.
+``render_prometheus()`` serves the totals at /health/metrics/; they are per
+worker process. Requests slower than METRICS_SLOW_REQUEST_MS (default 500,
+0 disables) are logged with their breakdown, and METRICS_SERVER_TIMING=true
+adds it to responses as a Server-Timing header.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.template.backends.django import DjangoTemplates as _DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_STARTED = time.time()
+
+
+class RequestMetrics:
+    """Operation counts and self times of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ops: Dict[Tuple[str, str], List[float]] = {}
+        # Time spent in nested operations, one slot per open operation and per
+        # thread: async views run operations of one request on several threads
+        self._children: Dict[int, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _enter(self) -> List[float]:
+        with self._lock:
+            stack = self._children.setdefault(threading.get_ident(), [])
+        stack.append(0.0)
+        return stack
+
+    def _exit(self, stack: List[float], kind: str, name: str, elapsed: float) -> float:
+        own = elapsed - stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with self._lock:
+            entry = self.ops.setdefault((kind, name), [0, 0.0])
+            entry[0] += 1
+            entry[1] += own
+        return own
+
+    def by_kind(self) -> Dict[str, List[float]]:
+        kinds: Dict[str, List[float]] = {}
+        for (kind, _), (count, seconds) in self.ops.items():
+            entry = kinds.setdefault(kind, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        return kinds
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar('inventory_metrics', default=None)
+
+# Process-wide totals
+_lock = threading.Lock()
+_ops: Dict[Tuple[str, str], List[float]] = {}                 # (kind, name) -> [count, seconds]
+_requests: Dict[Tuple[str, str, str], int] = {}               # (view, method, status) -> count
+_durations: Dict[str, List[float]] = {}                       # view -> bucket counts + [sum, count]
+_view_ops: Dict[Tuple[str, str], List[float]] = {}            # (view, kind) -> [count, self seconds]
+_slow: Dict[str, int] = {}                                    # view -> slow requests
+_reservations: Dict[str, List[float]] = {}                    # outcome -> bucket counts + [sum, count]
+_reservation_tx: Dict[str, int] = {}                          # transactions, attempts, chunked, rollbacks, ...
+
+
+@contextlib.contextmanager
+def track(kind: str, name: str):
+    """Time the enclosed block as one ``kind`` operation (db, firestore, template, signal)."""
+    request = _current.get()
+    stack = request._enter() if request is not None else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        own = request._exit(stack, kind, name, elapsed) if request is not None else elapsed
+        with _lock:
+            entry = _ops.setdefault((kind, name), [0, 0.0])
+            entry[0] += 1
+            entry[1] += own
+
+
+def timed(kind: str, name: Optional[str] = None) -> Callable:
+    """Decorator form of ``track``; the operation name defaults to the function name."""
+    def decorator(func):
+        op = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(kind, op):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------- Database ----------
+_STATEMENT_KINDS = {'select', 'insert', 'update', 'delete', 'with'}
+_TRANSACTION_STATEMENTS = {'savepoint', 'release', 'rollback', 'begin', 'commit'}
+
+
+def _statement_kind(sql: str) -> str:
+    head = sql.lstrip()[:12].split(None, 1)
+    word = head[0].lower() if head else ''
+    if word in _STATEMENT_KINDS:
+        return 'select' if word == 'with' else word
+    return 'transaction' if word in _TRANSACTION_STATEMENTS else 'other'
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    with track('db', _statement_kind(sql)):
+        return execute(sql, params, many, context)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install() -> None:
+    """Time every statement on database connections opened from now on."""
+    from django.db.backends.signals import connection_created
+    connection_created.connect(_instrument_connection, dispatch_uid='inventory.metrics')
+
+
+# ---------- Templates ----------
+class _TimedTemplate:
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    def __getattr__(self, attr):
+        return getattr(self._wrapped, attr)
+
+    def render(self, context=None, request=None):
+        with track('template', self._wrapped.origin.template_name or 'string'):
+            return self._wrapped.render(context, request)
+
+
+class DjangoTemplates(_DjangoTemplates):
+    """The Django template backend, with rendering time recorded per template."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+# ---------- Middleware ----------
+def _slow_threshold() -> float:
+    try:
+        return float(os.environ.get('METRICS_SLOW_REQUEST_MS', '500') or 0) / 1000
+    except ValueError:
+        return 0.5
+
+
+def _view_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.url_name or 'unnamed'
+
+
+def breakdown(metrics: RequestMetrics, total: float) -> str:
+    """`db.select 12x 40.1ms, template.x.html 1x 20.0ms, other 5.2ms`, slowest first."""
+    parts = [
+        f'{kind}.{name} {int(count)}x {seconds * 1000:.1f}ms'
+        for (kind, name), (count, seconds) in sorted(metrics.ops.items(), key=lambda item: -item[1][1])
+    ]
+    other = total - sum(seconds for _, seconds in metrics.ops.values())
+    parts.append(f'other {max(other, 0) * 1000:.1f}ms')
+    return ', '.join(parts)
+
+
+class MetricsMiddleware:
+    """Record per-request timings, totals per view and slow-request logs."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    async def _acall(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    def _finish(self, request, response, metrics: RequestMetrics):
+        total = time.perf_counter() - metrics.started
+        view = _view_name(request)
+        slow = _slow_threshold()
+        is_slow = bool(slow) and total >= slow
+        _record_request(view, request.method, response.status_code, total, metrics, is_slow)
+
+        if is_slow:
+            logger.warning('Slow request %s %s (%s) %s in %.1fms: %s', request.method, request.path, view,
+                           response.status_code, total * 1000, breakdown(metrics, total))
+        if os.environ.get('METRICS_SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes'):
+            timings = [f'{kind};dur={seconds * 1000:.1f};desc="{int(count)} calls"'
+                       for kind, (count, seconds) in sorted(metrics.by_kind().items())]
+            response['Server-Timing'] = ', '.join(timings + [f'total;dur={total * 1000:.1f}'])
+        return response
+
+
+def _record_request(view: str, method: str, status: int, total: float, metrics: RequestMetrics, slow: bool) -> None:
+    with _lock:
+        key = (view, method, str(status))
+        _requests[key] = _requests.get(key, 0) + 1
+        _observe(_durations, view, total)
+        for kind, (count, seconds) in metrics.by_kind().items():
+            entry = _view_ops.setdefault((view, kind), [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        if slow:
+            _slow[view] = _slow.get(view, 0) + 1
+
+
+def _observe(registry: Dict[str, List[float]], key: str, seconds: float) -> None:
+    # Caller holds the lock
+    hist = registry.setdefault(key, [0] * len(DURATION_BUCKETS) + [0.0, 0])
+    for i, bound in enumerate(DURATION_BUCKETS):
+        if seconds <= bound:
+            hist[i] += 1
+    hist[-2] += seconds
+    hist[-1] += 1
+
+
+# ---------- Stock reservations ----------
+def record_reservation(outcome: str, seconds: float) -> None:
+    """One checkout's stock reservation: reserved, insufficient or failed, and how long it waited."""
+    with _lock:
+        _observe(_reservations, outcome, seconds)
+
+
+def record_reservation_transaction(attempts: int, chunks: int = 1, rolled_back: bool = False,
+                                   rollback_failed: bool = False) -> None:
+    """One reservation commit: transaction attempts (1 + retries), chunks of an oversized batch, rollback."""
+    with _lock:
+        for key, value in (('transactions', chunks), ('attempts', attempts), ('chunked', int(chunks > 1)),
+                           ('rollbacks', int(rolled_back)), ('rollback_failures', int(rollback_failed))):
+            _reservation_tx[key] = _reservation_tx.get(key, 0) + value
+
+
+def reset() -> None:
+    """Clear the process-wide totals."""
+    with _lock:
+        for registry in (_ops, _requests, _durations, _view_ops, _slow, _reservations, _reservation_tx):
+            registry.clear()
+
+
+# ---------- Prometheus exposition ----------
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_samples(label: str, registry: Dict[str, List[float]]) -> list:
+    samples = []
+    for key, hist in sorted(registry.items()):
+        for bound, count in zip(DURATION_BUCKETS, hist):
+            samples.append(('_bucket', {label: key, 'le': _number(bound)}, count))
+        samples.append(('_bucket', {label: key, 'le': '+Inf'}, hist[-1]))
+        samples.append(('_sum', {label: key}, hist[-2]))
+        samples.append(('_count', {label: key}, hist[-1]))
+    return samples
+
+
+def render_prometheus() -> str:
+    """All totals of this process in the Prometheus text exposition format."""
+    from .firebase import firestore_breaker
+    from .firestore_repo import cache_stats
+    from .reservations import _coordinator
+
+    with _lock:
+        ops = {key: list(value) for key, value in _ops.items()}
+        requests = dict(_requests)
+        durations = {key: list(value) for key, value in _durations.items()}
+        view_ops = {key: list(value) for key, value in _view_ops.items()}
+        slow = dict(_slow)
+        reservations = {key: list(value) for key, value in _reservations.items()}
+        reservation_tx = dict(_reservation_tx)
+
+    lines: List[str] = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{_labels(**labels) if labels else ""} {_number(value)}')
+
+    family('inventory_requests_total', 'counter', 'Requests handled, by view, method and status.', [
+        ('', {'view': view, 'method': method, 'status': status}, count)
+        for (view, method, status), count in sorted(requests.items())
+    ])
+    family('inventory_request_duration_seconds', 'histogram', 'Request latency by view.',
+           _histogram_samples('view', durations))
+    family('inventory_request_operations_total', 'counter', 'Operations issued by requests, by view and kind.', [
+        ('', {'view': view, 'kind': kind}, int(count)) for (view, kind), (count, _) in sorted(view_ops.items())
+    ])
+    family('inventory_request_operation_seconds_total', 'counter',
+           'Self time of operations issued by requests, by view and kind.', [
+               ('', {'view': view, 'kind': kind}, seconds) for (view, kind), (_, seconds) in sorted(view_ops.items())
+           ])
+    family('inventory_slow_requests_total', 'counter', 'Requests slower than METRICS_SLOW_REQUEST_MS, by view.', [
+        ('', {'view': view}, count) for view, count in sorted(slow.items())
+    ])
+    family('inventory_operations_total', 'counter', 'Database statements, Firestore calls, template renders and '
+           'signal handlers, in and outside requests.', [
+               ('', {'kind': kind, 'name': name}, int(count)) for (kind, name), (count, _) in sorted(ops.items())
+           ])
+    family('inventory_operation_seconds_total', 'counter', 'Self time of those operations.', [
+        ('', {'kind': kind, 'name': name}, seconds) for (kind, name), (_, seconds) in sorted(ops.items())
+    ])
+    breaker = firestore_breaker().snapshot()
+    family('inventory_circuit_state', 'gauge', 'Circuit breaker state (1 for the current one).', [
+        ('', {'name': 'firestore', 'state': state}, int(breaker['state'] == state))
+        for state in ('closed', 'open', 'half_open')
+    ])
+    family('inventory_circuit_calls_total', 'counter', 'Calls through the circuit breaker by outcome.', [
+        ('', {'name': 'firestore', 'result': result}, count) for result, count in sorted(breaker['counts'].items())
+    ])
+    family('inventory_reservation_duration_seconds', 'histogram',
+           'Stock reservation latency per checkout (queueing included), by outcome.',
+           _histogram_samples('outcome', reservations))
+    family('inventory_reservation_transactions_total', 'counter', 'Stock reservation transactions committed.', [
+        ('', None, reservation_tx.get('transactions', 0)),
+    ])
+    family('inventory_reservation_attempts_total', 'counter',
+           'Stock reservation transaction attempts; attempts minus transactions are contention retries.', [
+               ('', None, reservation_tx.get('attempts', 0)),
+           ])
+    family('inventory_reservation_chunked_total', 'counter', 'Reservations split over several transactions.', [
+        ('', None, reservation_tx.get('chunked', 0)),
+    ])
+    family('inventory_reservation_rollbacks_total', 'counter',
+           'Chunked reservations undone by compensating transactions, by result.', [
+               ('', {'result': 'ok'}, reservation_tx.get('rollbacks', 0) - reservation_tx.get('rollback_failures', 0)),
+               ('', {'result': 'failed'}, reservation_tx.get('rollback_failures', 0)),
+           ])
+    coordinator = _coordinator['firestore']
+    if coordinator is not None:
+        counts = dict(coordinator.counts)
+        family('inventory_reservation_carts_total', 'counter', 'Carts reserved through the group-commit coordinator.', [
+            ('', None, counts['requests']),
+        ])
+        family('inventory_reservation_batches_total', 'counter', 'Firestore reservation transactions committed by it.', [
+            ('', None, counts['batches']),
+        ])
+        family('inventory_reservation_largest_batch', 'gauge', 'Most carts committed in one transaction.', [
+            ('', None, counts['largest_batch']),
+        ])
+    cache = cache_stats()
+    family('inventory_firestore_cache_total', 'counter', 'Firestore read-through cache lookups by result.', [
+        ('', {'result': result}, cache[result]) for result in ('hits', 'misses', 'invalidations', 'uncacheable')
+    ])
+    family('inventory_process_start_time_seconds', 'gauge', 'Start time of this worker process.', [
+        ('', None, _STARTED),
+    ])
+    return '\n'.join(lines) + '\n'
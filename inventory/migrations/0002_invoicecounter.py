@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_invoice_sequence(apps, schema_editor):
+    """Continue numbering after the highest id used by the old lookup scheme."""
+    Sale = apps.get_model('inventory', 'Sale')
+    InvoiceCounter = apps.get_model('inventory', 'InvoiceCounter')
+    last_id = Sale.objects.aggregate(m=Max('id'))['m'] or 0
+    InvoiceCounter.objects.update_or_create(name='invoice', defaults={'value': last_id})
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS inventory_invoice_seq')
+        if last_id:
+            schema_editor.execute("SELECT setval('inventory_invoice_seq', %s)", [last_id])
+
+
+def drop_invoice_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS inventory_invoice_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_invoice_sequence, drop_invoice_sequence),
+    ]
@@ -0,0 +1,92 @@
+"""Full-text product search: an FTS5 table with sync triggers on SQLite, a
+generated tsvector column with a GIN index on PostgreSQL.
+
+The SQL is spelled out here instead of imported from inventory.search, so later
+changes to that module cannot change what this migration did. SQLite drops the
+triggers whenever a later migration rebuilds inventory_product (AlterField and
+friends); the app's post_migrate handler (search.repair_search_triggers) puts
+them back.
+"""
+from django.db import migrations
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_product_fts USING fts5(
+        sku, name, description,
+        content='inventory_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_product_fts_ai AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(rowid, sku, name, description)
+        VALUES (new.id, new.sku, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_product_fts_ad AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, sku, name, description)
+        VALUES ('delete', old.id, old.sku, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_product_fts_au AFTER UPDATE OF sku, name, description ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, sku, name, description)
+        VALUES ('delete', old.id, old.sku, old.name, old.description);
+        INSERT INTO inventory_product_fts(rowid, sku, name, description)
+        VALUES (new.id, new.sku, new.name, new.description);
+    END
+    """,
+    "INSERT INTO inventory_product_fts(inventory_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS inventory_product_fts_au',
+    'DROP TRIGGER IF EXISTS inventory_product_fts_ad',
+    'DROP TRIGGER IF EXISTS inventory_product_fts_ai',
+    'DROP TABLE IF EXISTS inventory_product_fts',
+]
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE inventory_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS inventory_product_search_idx ON inventory_product USING GIN (search_vector)',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS inventory_product_search_idx',
+    'ALTER TABLE inventory_product DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    _run(schema_editor, {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}.get(vendor, []))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    _run(schema_editor, {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(vendor, []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_inventorystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
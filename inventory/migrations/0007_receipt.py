@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Receipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_version', models.CharField(max_length=20)),
+                ('html_gz', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='inventory.sale')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sale', 'template_version'), name='receipt_sale_version_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    """Seed the rollups from existing sales, costed at current product cost prices."""
+    SaleItem = apps.get_model('inventory', 'SaleItem')
+    DailyProductSales = apps.get_model('inventory', 'DailyProductSales')
+    DailyCustomerSales = apps.get_model('inventory', 'DailyCustomerSales')
+    cost = ExpressionWrapper(F('quantity') * F('product__cost_price'),
+                             output_field=DecimalField(max_digits=16, decimal_places=2))
+    items = SaleItem.objects.annotate(day=TruncDate('sale__date'))
+    DailyProductSales.objects.bulk_create((
+        DailyProductSales(day=r['day'], product_id=r['product_id'], units=r['u'], revenue=r['r'], cost=r['c'])
+        for r in items.values('day', 'product_id').annotate(
+            u=Sum('quantity'), r=Sum('total_price'), c=Sum(cost)).order_by().iterator()
+    ), batch_size=1000)
+    DailyCustomerSales.objects.bulk_create((
+        DailyCustomerSales(day=r['day'], customer_id=r['sale__customer_id'], sales_count=r['n'],
+                           units=r['u'], revenue=r['r'], cost=r['c'])
+        for r in items.values('day', 'sale__customer_id').annotate(
+            n=Count('sale_id', distinct=True), u=Sum('quantity'), r=Sum('total_price'), c=Sum(cost)
+        ).order_by().iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyCustomerSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sales_count', models.IntegerField(default=0)),
+                ('units', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='inventory.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'day'], name='daily_customer_sales_cust_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'customer'), name='daily_customer_sales_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'day'], name='daily_product_sales_prod_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='daily_product_sales_uniq')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='firestoreoutbox',
+            name='dead',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='firestoreoutbox',
+            index=models.Index(fields=['dead', 'next_attempt_at'], name='outbox_due_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+"""Indexes for the case-insensitive prefix searches of the listings (PostgreSQL only).
+
+Django turns ``istartswith`` into ``UPPER(column::text) LIKE UPPER(pattern)``.
+An index on that expression with ``text_pattern_ops`` serves the LIKE prefix
+whatever the database collation. Nothing is created on SQLite, whose LIKE is
+already case-insensitive for ASCII and is not served by these indexes anyway.
+"""
+from django.db import migrations
+
+POSTGRES_INSTALL = [
+    'CREATE INDEX IF NOT EXISTS product_name_upper_idx ON inventory_product (UPPER(name::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS product_sku_upper_idx ON inventory_product (UPPER(sku::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS customer_name_upper_idx ON inventory_customer (UPPER(name::text) text_pattern_ops)',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS product_name_upper_idx',
+    'DROP INDEX IF EXISTS product_sku_upper_idx',
+    'DROP INDEX IF EXISTS customer_name_upper_idx',
+]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_INSTALL)
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_UNINSTALL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_outbox_dead_letter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
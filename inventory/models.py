@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils import timezone
 
+STOCK_STATE_FIELDS = {'id', 'sku', 'name', 'quantity', 'cost_price'}
+
 class Product(models.Model):
     sku = models.CharField(max_length=50, unique=True, blank=True, null=True)
     name = models.CharField(max_length=200)
@@ -11,9 +13,33 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (name, id); see inventory.listings
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the stats table last saw so saves can apply deltas
+        if STOCK_STATE_FIELDS.issubset(field_names):
+            instance._loaded_stock_state = instance.stock_state()
+        return instance
+
+    def stock_state(self) -> dict:
+        """Fields the dashboard aggregates depend on (see inventory.stats)."""
+        return {
+            'id': self.id,
+            'sku': self.sku,
+            'name': self.name,
+            'quantity': int(self.quantity),
+            'cost_price': str(self.cost_price),
+        }
+
 class Customer(models.Model):
     name = models.CharField(max_length=200)
     phone = models.CharField(max_length=20, blank=True, null=True)
@@ -21,6 +47,11 @@ class Customer(models.Model):
     address = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='customer_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -36,18 +67,27 @@ class Sale(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            # Generate invoice number based on date and ID
-            last_sale = Sale.objects.order_by('-id').first()
-            last_id = last_sale.id if last_sale else 0
-            self.invoice_number = f"INV{timezone.now().strftime('%Y%m%d')}{last_id + 1:04d}"
+            # Allocate from the invoice sequence; never scans the Sale table
+            from .invoicing import next_invoice_number
+            self.invoice_number = next_invoice_number()
         super().save(*args, **kwargs)
 
+class InvoiceCounter(models.Model):
+    """Counter row backing invoice numbers on databases without native sequences."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Product cost at the time of sale, for margin reporting (null for older sales)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     def save(self, *args, **kwargs):
         # Calculate total price
@@ -59,3 +99,106 @@ class SaleItem(models.Model):
             self.product.save()
             
         super().save(*args, **kwargs)
+
+class FirestoreOutbox(models.Model):
+    """Pending Firestore write, recorded in the same transaction as the ORM change.
+
+    Drained by inventory.outbox; `path` is the Firestore document path
+    (e.g. ``products/12``).
+    """
+    path = models.CharField(max_length=300, db_index=True)
+    data = models.JSONField()
+    merge = models.BooleanField(default=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    # Parked after FIREBASE_OUTBOX_MAX_ATTEMPTS failed writes; requeued by flush_outbox --retry-dead
+    dead = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The flusher seeks due rows that are not parked
+            models.Index(fields=['dead', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} (attempts={self.attempts}{', dead' if self.dead else ''})"
+
+class InventoryStats(models.Model):
+    """Singleton row of incrementally maintained dashboard aggregates (see inventory.stats)."""
+    total_products = models.IntegerField(default=0)
+    total_units = models.BigIntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # {product_id: {id, sku, name, quantity}} for the lowest products at or below the
+    # low-stock threshold (at most stats.LOW_STOCK_LIMIT)
+    low_stock = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'inventory stats'
+
+    def __str__(self):
+        return f"{self.total_products} products, {self.total_units} units"
+
+class Receipt(models.Model):
+    """Receipt HTML rendered once per sale and template version, stored gzip-compressed (see inventory.receipts)."""
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='receipts')
+    template_version = models.CharField(max_length=20)
+    html_gz = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sale', 'template_version'], name='receipt_sale_version_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Receipt for sale {self.sale_id} ({self.template_version})"
+
+class DailyProductSales(models.Model):
+    """Per-day, per-product sales totals maintained as sales post (see inventory.rollups)."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='daily_product_sales_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'day'], name='daily_product_sales_prod_idx'),
+        ]
+
+    @property
+    def margin(self):
+        return self.revenue - self.cost
+
+    def __str__(self):
+        return f"{self.day} product {self.product_id}: {self.units} units"
+
+class DailyCustomerSales(models.Model):
+    """Per-day, per-customer sales totals maintained as sales post (see inventory.rollups)."""
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_sales')
+    sales_count = models.IntegerField(default=0)
+    units = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'customer'], name='daily_customer_sales_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['customer', 'day'], name='daily_customer_sales_cust_idx'),
+        ]
+
+    @property
+    def margin(self):
+        return self.revenue - self.cost
+
+    def __str__(self):
+        return f"{self.day} customer {self.customer_id}: {self.sales_count} sales"
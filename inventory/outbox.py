@@ -0,0 +1,326 @@
+"""Durable write-behind outbox for Firestore mirroring.
+
+Views record the Firestore writes they need as FirestoreOutbox rows inside the
+same DB transaction as the ORM change, so a mirror is never lost and checkout
+latency no longer includes a Firestore round trip. A background flusher drains
+the table in Firestore batch writes of up to 500 documents, coalescing repeated
+writes to the same document and backing off exponentially on failure.
+
+A failed batch is retried one document at a time, so a document Firestore
+rejects only holds back its own writes. Those back off on their own and are
+parked (``dead``) after FIREBASE_OUTBOX_MAX_ATTEMPTS failures, which lets
+newer writes to the same document through again; the first of those to land
+discards the parked ones it supersedes. While the circuit breaker is open
+nothing counts as an attempt, so an outage never parks anything.
+
+Every worker process runs its own flusher. A flusher claims the rows it will
+write in one short transaction (locking them with SKIP LOCKED where the
+database has it) by leasing them: their ``next_attempt_at`` moves
+FIREBASE_OUTBOX_LEASE_SECONDS ahead. It talks to Firestore with no transaction
+open, then deletes or reschedules the rows in a second short transaction. A
+document is left alone while an earlier write to it is leased by another
+flusher or backing off. Rows of a flusher that died come due again when the
+lease runs out.
+
+Settings (env vars):
+- FIREBASE_OUTBOX_THREAD: run the in-process flusher thread (default true).
+- FIREBASE_OUTBOX_POLL_SECONDS: idle poll interval of the flusher (default 5).
+- FIREBASE_OUTBOX_MAX_ATTEMPTS: failed writes before a row is parked (default 10).
+- FIREBASE_OUTBOX_LEASE_SECONDS: how long claimed rows are held for a flush (default 300).
+"""
+import logging
+import os
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .breaker import OPEN, CircuitOpen
+from .firebase import firebase_enabled, firestore_breaker, get_firestore_client
+from .firestore_repo import invalidate_for_paths
+from .metrics import track
+from .models import FirestoreOutbox
+from .serializers import customer_doc, product_doc, sale_documents
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 500  # Firestore maximum writes per batch
+FETCH_LIMIT = BATCH_LIMIT * 4
+MAX_BACKOFF_SECONDS = 300
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, MAX_BACKOFF_SECONDS))
+
+
+def _max_attempts() -> int:
+    return max(1, int(os.environ.get('FIREBASE_OUTBOX_MAX_ATTEMPTS', '10')))
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=float(os.environ.get('FIREBASE_OUTBOX_LEASE_SECONDS', '300')))
+
+
+# ---------- Enqueue ----------
+def enqueue_many(writes: Iterable[Tuple[str, Dict[str, Any], bool]]) -> None:
+    """Record (document path, data, merge) writes; no-op when Firebase is disabled."""
+    if not firebase_enabled():
+        return
+    rows = [FirestoreOutbox(path=path, data=data, merge=merge) for path, data, merge in writes]
+    if not rows:
+        return
+    FirestoreOutbox.objects.bulk_create(rows)
+    transaction.on_commit(wake_flusher)
+
+
+def enqueue(path: str, data: Dict[str, Any], merge: bool = True) -> None:
+    enqueue_many([(path, data, merge)])
+
+
+def enqueue_product(product) -> None:
+    enqueue(f'products/{product.id}', product_doc(product))
+
+
+def enqueue_customer(customer) -> None:
+    enqueue(f'customers/{customer.id}', customer_doc(customer))
+
+
+def enqueue_sale(sale) -> None:
+    """Queue the canonical sale document plus the post-sale product mirrors."""
+    if not firebase_enabled():
+        return
+    enqueue_many(sale_documents(sale))
+
+
+# ---------- Flush ----------
+def _coalesce(rows: List[FirestoreOutbox], blocked: set) -> Dict[str, Dict[str, Any]]:
+    """Fold rows (in id order) into at most BATCH_LIMIT per-document writes."""
+    docs: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if row.path in blocked:
+            continue
+        entry = docs.get(row.path)
+        if entry is None:
+            if len(docs) >= BATCH_LIMIT:
+                continue
+            entry = docs[row.path] = {'data': {}, 'merge': True, 'ids': [], 'attempts': 0}
+        if row.merge:
+            entry['data'].update(row.data)
+        else:
+            # A full overwrite discards everything queued before it
+            entry['data'] = dict(row.data)
+            entry['merge'] = False
+        entry['ids'].append(row.id)
+        entry['attempts'] = max(entry['attempts'], row.attempts)
+    return docs
+
+
+def _blocked_paths(rows: List[FirestoreOutbox]) -> set:
+    """Paths with a pending write that is not among ``rows`` but older than one of them.
+
+    That write is either backing off or leased by another process's flusher
+    (every worker runs one). Writing the newer rows first would let the older
+    one overwrite them when it lands, so those documents wait.
+    """
+    fetched: Dict[str, set] = {}
+    for row in rows:
+        fetched.setdefault(row.path, set()).add(row.id)
+    last = {path: max(ids) for path, ids in fetched.items()}
+    pending = (FirestoreOutbox.objects.filter(path__in=fetched, dead=False, id__lt=max(last.values()))
+               .values_list('path', 'id'))
+    return {path for path, pk in pending if pk < last[path] and pk not in fetched[path]}
+
+
+def _write(db, breaker, docs: Dict[str, Dict[str, Any]]) -> None:
+    batch = db.batch()
+    for path, entry in docs.items():
+        batch.set(db.document(path), entry['data'], merge=entry['merge'])
+    with track('firestore', 'outbox_commit'):
+        breaker.call(batch.commit)
+
+
+def _commit(db, breaker,
+            docs: Dict[str, Dict[str, Any]]) -> Tuple[List[str], Dict[str, Exception], Optional[Exception]]:
+    """Write ``docs`` in one batch, or one at a time if the batch fails.
+
+    Returns (written paths, {path: error} for documents that failed on their
+    own, outage error). Once the circuit opens the remaining documents are
+    neither written nor failed: an outage is not their fault.
+    """
+    try:
+        _write(db, breaker, docs)
+        return list(docs), {}, None
+    except Exception as exc:
+        if isinstance(exc, CircuitOpen) or breaker.state == OPEN:
+            return [], {}, exc
+        if len(docs) == 1:
+            return [], dict.fromkeys(docs, exc), None
+    written: List[str] = []
+    failed: Dict[str, Exception] = {}
+    for path, entry in docs.items():
+        try:
+            _write(db, breaker, {path: entry})
+        except Exception as exc:
+            if isinstance(exc, CircuitOpen) or breaker.state == OPEN:
+                return written, failed, exc
+            failed[path] = exc
+        else:
+            written.append(path)
+    return written, failed, None
+
+
+def _reschedule(docs: Dict[str, Dict[str, Any]], failed: Dict[str, Exception], now) -> None:
+    """Back off the rows of documents that failed; park those out of attempts."""
+    limit = _max_attempts()
+    groups: Dict[Tuple[int, str], List[int]] = {}
+    for path, exc in failed.items():
+        entry = docs[path]
+        attempts = entry['attempts'] + 1
+        if attempts >= limit:
+            logger.error('Parking Firestore outbox writes to %s after %s attempts: %s', path, attempts, exc)
+        groups.setdefault((min(attempts, limit), str(exc)[:1000]), []).extend(entry['ids'])
+    for (attempts, error), ids in groups.items():
+        fields = {'attempts': F('attempts') + 1, 'last_error': error}
+        if attempts >= limit:
+            fields['dead'] = True
+        else:
+            fields['next_attempt_at'] = now + _backoff(attempts)
+        FirestoreOutbox.objects.filter(id__in=ids).update(**fields)
+
+
+def _claim(now) -> Dict[str, Dict[str, Any]]:
+    """Coalesce due rows into per-document writes and lease their rows to this flusher."""
+    with transaction.atomic():
+        qs = FirestoreOutbox.objects.filter(dead=False, next_attempt_at__lte=now).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        rows = list(qs[:FETCH_LIMIT])
+        if not rows:
+            return {}
+        docs = _coalesce(rows, _blocked_paths(rows))
+        if docs:
+            FirestoreOutbox.objects.filter(id__in=[pk for entry in docs.values() for pk in entry['ids']]).update(
+                next_attempt_at=now + _lease())
+    return docs
+
+
+def flush_once() -> int:
+    """Write one Firestore batch from the outbox. Returns documents written.
+
+    Raises the Firestore error when nothing could be written, after
+    scheduling retries for the documents that failed.
+    """
+    db = get_firestore_client()
+    if not db:
+        return 0
+    breaker = firestore_breaker()
+    if breaker.state == OPEN:
+        # Fail before claiming rows, so an outage does not count against their backoff
+        raise CircuitOpen(f'Firestore circuit is open: {breaker.last_error}')
+
+    now = timezone.now()
+    docs = _claim(now)
+    if not docs:
+        return 0
+
+    # No transaction is open while Firestore is called: checkouts must not wait on it
+    written, failed, outage = _commit(db, breaker, docs)
+
+    with transaction.atomic():
+        if written:
+            # Writes parked for these documents are older than the ones just written
+            FirestoreOutbox.objects.filter(
+                Q(id__in=[pk for path in written for pk in docs[path]['ids']]) | Q(dead=True, path__in=written)
+            ).delete()
+        if failed:
+            _reschedule(docs, failed, now)
+        untried = [pk for path, entry in docs.items() if path not in written and path not in failed
+                   for pk in entry['ids']]
+        if untried:
+            # Cut short by an outage: give the lease back without counting an attempt
+            FirestoreOutbox.objects.filter(id__in=untried).update(next_attempt_at=now)
+    if written:
+        invalidate_for_paths(written)
+    error = outage or (next(iter(failed.values())) if failed and not written else None)
+    if error is not None:
+        raise error
+    return len(written)
+
+
+def flush_all() -> int:
+    """Drain every due outbox row. Returns total documents written."""
+    total = 0
+    while True:
+        written = flush_once()
+        if not written:
+            return total
+        total += written
+
+
+def outbox_stats() -> Dict[str, Any]:
+    """Backlog depth and lag of the outbox."""
+    now = timezone.now()
+    qs = FirestoreOutbox.objects.all()
+    # Parked rows wait for an operator, so they do not count towards the lag
+    oldest = qs.filter(dead=False).order_by('id').values_list('created_at', flat=True).first()
+    failing = qs.filter(attempts__gt=0)
+    last_failure = failing.order_by('-id').values('path', 'attempts', 'last_error', 'dead').first()
+    return {
+        'depth': qs.count(),
+        'documents': qs.values('path').distinct().count(),
+        'lag_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+        'retrying': failing.filter(dead=False).count(),
+        'dead': qs.filter(dead=True).count(),
+        'last_error': last_failure,
+    }
+
+
+def requeue_dead() -> int:
+    """Give parked rows a fresh set of attempts (after fixing what made Firestore reject them)."""
+    updated = FirestoreOutbox.objects.filter(dead=True).update(dead=False, attempts=0, next_attempt_at=timezone.now())
+    if updated:
+        transaction.on_commit(wake_flusher)
+    return updated
+
+
+# ---------- Background flusher ----------
+class _Flusher(threading.Thread):
+    def __init__(self):
+        super().__init__(name='firestore-outbox', daemon=True)
+        self.wakeup = threading.Event()
+        self.failures = 0
+
+    def run(self):
+        poll = float(os.environ.get('FIREBASE_OUTBOX_POLL_SECONDS', '5'))
+        while True:
+            delay = poll if not self.failures else _backoff(self.failures).total_seconds()
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            try:
+                flush_all()
+                self.failures = 0
+            except Exception as exc:
+                self.failures += 1
+                logger.warning('Firestore outbox flush failed (%s consecutive): %s', self.failures, exc)
+            finally:
+                close_old_connections()
+
+
+_flusher = {'thread': None}
+_flusher_lock = threading.Lock()
+
+
+def wake_flusher() -> None:
+    """Start the in-process flusher if needed and nudge it to drain now."""
+    if not firebase_enabled():
+        return
+    if os.environ.get('FIREBASE_OUTBOX_THREAD', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    with _flusher_lock:
+        if _flusher['thread'] is None:
+            _flusher['thread'] = _Flusher()
+            _flusher['thread'].start()
+    _flusher['thread'].wakeup.set()
@@ -0,0 +1,87 @@
+"""Render-once receipt storage.
+
+Sales never change after creation, so a receipt is rendered right after the
+sale commits and stored gzip-compressed per (sale, template version). Requests
+are answered from the default cache, then the Receipt table, and only render
+again for sales created before this existed or after a template change. The
+ETag is derived from the sale id and template version alone, so a matching
+If-None-Match is answered without any database or Firestore read.
+"""
+import gzip
+import hashlib
+from typing import Optional
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.template.loader import get_template, render_to_string
+from django.templatetags.static import static
+
+from .models import Receipt
+from .serializers import prefetch_sales, receipt_items
+
+TEMPLATE_NAME = 'inventory/receipt.html'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+_version = {'value': None}
+
+
+def template_version() -> str:
+    """Short hash of the receipt template and the static assets it links to."""
+    if _version['value'] is None:
+        source = get_template(TEMPLATE_NAME).template.source
+        raw = source + static('inventory/images/logo.png')
+        _version['value'] = hashlib.sha1(raw.encode()).hexdigest()[:12]
+    return _version['value']
+
+
+def receipt_etag(sale_id: int) -> str:
+    return f'"{sale_id}-{template_version()}"'
+
+
+def _cache_key(sale_id: int) -> str:
+    return f'receipt:{sale_id}:{template_version()}'
+
+
+def render_receipt(sale) -> bytes:
+    """Gzip-compressed receipt HTML for a model sale or a sale_from_doc namespace."""
+    html = render_to_string(TEMPLATE_NAME, {'sale': sale, 'items': receipt_items(sale)})
+    return gzip.compress(html.encode('utf-8'))
+
+
+def store_receipt(sale) -> bytes:
+    """Render and persist the receipt for the current template version."""
+    html_gz = render_receipt(sale)
+    try:
+        with transaction.atomic():
+            Receipt.objects.create(sale_id=sale.id, template_version=template_version(), html_gz=html_gz)
+    except IntegrityError:
+        pass  # Stored concurrently; same content
+    cache.set(_cache_key(sale.id), html_gz, CACHE_TIMEOUT)
+    return html_gz
+
+
+def schedule_receipt(sale) -> None:
+    """Render and store the receipt once the sale's transaction commits."""
+    def _store():
+        try:
+            prefetch_sales([sale])
+            store_receipt(sale)
+        except Exception:
+            # Served by rendering on first request instead
+            pass
+    transaction.on_commit(_store)
+
+
+def stored_receipt(sale_id: int) -> Optional[bytes]:
+    """Compressed receipt HTML from the cache or the Receipt table, if present."""
+    key = _cache_key(sale_id)
+    html_gz = cache.get(key)
+    if html_gz is not None:
+        return html_gz
+    row = (Receipt.objects.filter(sale_id=sale_id, template_version=template_version())
+           .values_list('html_gz', flat=True).first())
+    if row is None:
+        return None
+    html_gz = bytes(row)
+    cache.set(key, html_gz, CACHE_TIMEOUT)
+    return html_gz
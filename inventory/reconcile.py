@@ -0,0 +1,230 @@
+"""Checksum-based reconciliation of Firestore with the Django database.
+
+Every mirrored document carries a ``checksum`` of its fields
+(``serializers.checksum``). For each collection the id space is cut into
+ranges whose signature is (document count, sum of checksums), plus the sum of
+quantities for products because stock reservations change those in Firestore
+without re-signing the document. The database side of a signature comes from
+one pass over the rows; the Firestore side from an aggregation query, which is
+billed one read per 1000 documents instead of one per document.
+
+Ranges whose signatures differ are split into ``fanout`` parts and compared
+again until they are at most ``leaf`` ids wide; only those leaves' documents
+are read and compared one by one. A nightly run over a store with little
+drift therefore reads a small fraction of the documents. Documents written
+before checksums existed make every range differ once, so the first run after
+an upgrade reads and re-signs everything, like a backfill.
+
+Checksums are written with the documents, so a signature catches any
+document whose last mirror write is missing or older than the database row,
+plus stock drift. An edit made in Firestore behind the app's back (console,
+another service) keeps its old checksum and is only seen if it changes a
+summed field.
+
+The database is the reference, as for backfill and the outbox: ``repair``
+rewrites drifted documents from it in batched writes and deletes documents
+it no longer has. Documents with writes still queued in the outbox are
+counted as pending and left alone; writes parked as dead do not count.
+"""
+import bisect
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import firestore_repo
+from .backfill import BATCH_LIMIT, COLLECTIONS, iter_pages
+from .firebase import firestore_breaker
+from .firestore_repo import _deadline, _rpc, _where, invalidate_cache
+from .models import FirestoreOutbox
+from .serializers import checksum
+
+# Fields summed into a range signature besides count and checksum
+SUMMED_FIELDS: Dict[str, Tuple[str, ...]] = {'products': ('quantity',), 'customers': (), 'sales': ()}
+DRIFT_KINDS = ('missing', 'extra', 'changed', 'unsigned', 'pending')
+
+Signature = Tuple[int, ...]
+
+
+class LocalIndex:
+    """Database side of a collection: ids in order with prefix sums of their signatures."""
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.fields = SUMMED_FIELDS[collection]
+        self.ids: List[int] = []
+        width = 2 + len(self.fields)
+        self._prefix: List[List[int]] = [[0] * width]
+        for _, writes in iter_pages(collection):
+            for _, doc, _ in writes:
+                row = [1, doc['checksum'], *(int(doc.get(f) or 0) for f in self.fields)]
+                self.ids.append(int(doc['id']))
+                self._prefix.append([a + b for a, b in zip(self._prefix[-1], row)])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def signature(self, lo: int, hi: int) -> Signature:
+        i, j = bisect.bisect_left(self.ids, lo), bisect.bisect_left(self.ids, hi)
+        return tuple(b - a for a, b in zip(self._prefix[i], self._prefix[j]))
+
+    def documents(self, lo: int, hi: int) -> Dict[int, Dict[str, Any]]:
+        """Freshly built documents for the rows with lo <= id < hi."""
+        loader, build, _ = COLLECTIONS[self.collection]
+        return {row.id: build(row) for row in loader(lo - 1, hi - lo) if row.id < hi}
+
+
+def _in_range(query, lo: int, hi: int):
+    return _where(_where(query, 'id', '>=', lo), 'id', '<', hi)
+
+
+@_rpc(read=True)
+def remote_signature(db, collection: str, lo: int, hi: int) -> Signature:
+    """(count, checksum sum, summed fields...) of the Firestore documents with lo <= id < hi."""
+    query = _in_range(db.collection(collection), lo, hi).count(alias='count').sum('checksum', alias='checksum')
+    for field in SUMMED_FIELDS[collection]:
+        query = query.sum(field, alias=field)
+    values = {result.alias: result.value for result in query.get(timeout=_deadline())[0]}
+    return (int(values['count']), int(values.get('checksum') or 0),
+            *(int(values.get(f) or 0) for f in SUMMED_FIELDS[collection]))
+
+
+@_rpc(read=True)
+def remote_documents(db, collection: str, lo: int, hi: int) -> Dict[int, Dict[str, Any]]:
+    return {int(doc.id): doc.to_dict() or {} for doc in _in_range(db.collection(collection), lo, hi).stream(timeout=_deadline())}
+
+
+@_rpc(read=True)
+def remote_id_bounds(db, collection: str) -> Optional[Tuple[int, int]]:
+    """Lowest and highest ``id`` in a Firestore collection, or None when it is empty."""
+    bounds = []
+    for direction in (None, firestore_repo.gcfirestore.Query.DESCENDING):
+        docs = list(db.collection(collection).order_by('id', direction=direction).limit(1).stream(timeout=_deadline()))
+        if not docs:
+            return None
+        bounds.append(int(docs[0].id))
+    return bounds[0], bounds[1]
+
+
+class Report:
+    """Drift statistics of one collection."""
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.documents = 0
+        self.ranges_compared = 0
+        self.ranges_differing = 0
+        self.leaves = 0
+        self.documents_read = 0
+        self.drift = {kind: 0 for kind in DRIFT_KINDS}
+        self.drifted_ids: List[int] = []  # the first 50
+        self.repaired = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'collection': self.collection,
+            'documents': self.documents,
+            'ranges_compared': self.ranges_compared,
+            'ranges_differing': self.ranges_differing,
+            'leaf_ranges': self.leaves,
+            'documents_read': self.documents_read,
+            'read_fraction': round(self.documents_read / self.documents, 4) if self.documents else 0.0,
+            'drift': dict(self.drift),
+            'drifted_ids': self.drifted_ids,
+            'repaired': self.repaired,
+            'seconds': round(self.seconds, 2),
+        }
+
+
+def _classify(local: Optional[Dict[str, Any]], remote: Optional[Dict[str, Any]]) -> Optional[str]:
+    if remote is None:
+        return 'missing'
+    if local is None:
+        return 'extra'
+    if checksum({k: remote.get(k) for k in local}) != local['checksum']:
+        return 'changed'
+    if remote.get('checksum') != local['checksum']:
+        return 'unsigned'
+    return None
+
+
+def reconcile_collection(db, collection: str, ranges: int = 64, fanout: int = 8, leaf: int = 256,
+                         repair: bool = False, log: Callable[[str], None] = lambda message: None) -> Report:
+    """Compare one collection range by range and (optionally) repair the drifted documents."""
+    started = time.perf_counter()
+    fanout, leaf = max(2, fanout), max(1, leaf)
+    report = Report(collection)
+    local = LocalIndex(collection)
+    report.documents = len(local)
+    remote_bounds = remote_id_bounds(db, collection)
+    bounds = [b for b in (remote_bounds, local.ids and (local.ids[0], local.ids[-1])) if b]
+    if not bounds:
+        report.seconds = time.perf_counter() - started
+        return report
+    lo, hi = min(b[0] for b in bounds), max(b[1] for b in bounds) + 1
+
+    leaves: List[Tuple[int, int]] = []
+
+    def compare(lo: int, hi: int) -> None:
+        report.ranges_compared += 1
+        if local.signature(lo, hi) == remote_signature(db, collection, lo, hi):
+            return
+        report.ranges_differing += 1
+        if hi - lo <= leaf:
+            leaves.append((lo, hi))
+            return
+        step = -(-(hi - lo) // fanout)
+        for start in range(lo, hi, step):
+            compare(start, min(start + step, hi))
+
+    step = max(1, -(-(hi - lo) // max(1, ranges)))
+    for start in range(lo, hi, step):
+        compare(start, min(start + step, hi))
+    report.leaves = len(leaves)
+    log(f'{collection}: {report.ranges_differing}/{report.ranges_compared} ranges differ, '
+        f'{len(leaves)} leaf range(s) to inspect')
+
+    # Parked writes are never going to land on their own, so those documents are repaired
+    pending = set(FirestoreOutbox.objects.filter(path__startswith=f'{collection}/', dead=False)
+                  .values_list('path', flat=True))
+    _, _, merge = COLLECTIONS[collection]
+    writes: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+    for lo, hi in leaves:
+        local_docs = local.documents(lo, hi)
+        remote_docs = remote_documents(db, collection, lo, hi)
+        report.documents_read += len(remote_docs)
+        for pk in sorted(set(local_docs) | set(remote_docs)):
+            kind = _classify(local_docs.get(pk), remote_docs.get(pk))
+            if kind is None:
+                continue
+            path = f'{collection}/{pk}'
+            if path in pending:
+                kind = 'pending'
+            report.drift[kind] += 1
+            if len(report.drifted_ids) < 50:
+                report.drifted_ids.append(pk)
+            if kind != 'pending':
+                writes.append((path, local_docs.get(pk)))
+
+    if repair and writes:
+        report.repaired = _repair(db, writes, merge)
+        invalidate_cache(collection)
+        log(f'{collection}: repaired {report.repaired} document(s)')
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _repair(db, writes: List[Tuple[str, Optional[Dict[str, Any]]]], merge: bool) -> int:
+    """Write database documents over drifted ones (deleting extras) in batches of BATCH_LIMIT."""
+    breaker = firestore_breaker()
+    done = 0
+    for start in range(0, len(writes), BATCH_LIMIT):
+        chunk = writes[start:start + BATCH_LIMIT]
+        batch = db.batch()
+        for path, doc in chunk:
+            if doc is None:
+                batch.delete(db.document(path))
+            else:
+                batch.set(db.document(path), doc, merge=merge)
+        breaker.call(batch.commit)
+        done += len(chunk)
+    return done
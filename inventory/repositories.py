@@ -0,0 +1,509 @@
+"""Read and stock-reservation access to products, customers and sales.
+
+Views talk to one repository instead of branching on the Firestore flags:
+
+* ``OrmRepository``: the Django database (the default).
+* ``FirestoreRepository``: Firestore as system of record; stock is reserved in
+  a Firestore transaction before the ORM write.
+* ``MemoryRepository``: in-process dictionaries, for tests and benchmarks.
+
+Every backend returns the same shapes: Page objects of model instances or
+model-shaped objects (see ``serializers.*_from_doc``), plain dicts for the
+dashboard summary. ``FallbackRepository`` serves reads from a second backend
+when the first one fails, and ``LatencyRepository`` adds a fixed delay to each
+call so remote backends can be benchmarked offline.
+
+The backend is chosen once per process by ``get_repository()`` from
+INVENTORY_BACKEND (orm, firestore or memory; default: firestore when
+FIREBASE_SOR is on, else orm) and INVENTORY_LATENCY_MS.
+
+Async views call repositories through ``acall()``: database-backed calls stay
+on the request's sync thread (Django connections are per thread), remote and
+in-memory ones run on the thread pool so they can overlap.
+
+Checkouts save the sale in ``sale_transaction``, which gives reserved stock
+back when that transaction does not commit.
+"""
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count, Max
+
+from . import firestore_repo, reservations
+from .breaker import CircuitOpen
+from .firebase import firebase_sor_enabled
+from .listings import (
+    LOW_STOCK_THRESHOLD, PAGE_SIZE, Page, customer_page, decode_cursor, encode_cursor, product_page,
+    product_sort_field,
+)
+from .models import Customer, Product, Sale
+from .serializers import customer_doc, customer_from_doc, product_doc, product_from_doc, sales_queryset
+from .stats import LOW_STOCK_LIMIT, get_stats, low_stock_products
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FIELDS = ['id', 'sku', 'name', 'selling_price', 'quantity']
+
+
+class Repository:
+    """Interface shared by all backends."""
+
+    name = 'base'
+    # Must run on the request's sync thread under async views (uses the ORM)
+    thread_sensitive = True
+
+    def product_page(self, filters: Dict[str, Any], cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+        raise NotImplementedError
+
+    def customer_page(self, filters: Dict[str, Any], cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Page:
+        raise NotImplementedError
+
+    def get_products(self, ids: Iterable[int]) -> Dict[int, Any]:
+        """Products by id; missing ids are left out."""
+        raise NotImplementedError
+
+    def catalog(self) -> Tuple[str, Union[List[list], Callable[[], List[list]]]]:
+        """(version, rows) of the catalog snapshot.
+
+        ``rows`` may be a callable that loads them from the same backend, so a
+        revalidation that ends in 304 Not Modified never loads them.
+        """
+        raise NotImplementedError
+
+    def inventory_summary(self) -> Dict[str, Any]:
+        """Dashboard totals: total_products, total_units, stock_value, low_stock_products."""
+        raise NotImplementedError
+
+    def recent_sales(self, limit: int = 5) -> list:
+        raise NotImplementedError
+
+    def get_sale(self, sale_id: int):
+        """Sale with customer and items for a receipt, or None."""
+        raise NotImplementedError
+
+    def reserve_stock(self, requested: Dict[int, int]) -> bool:
+        """Check and decrement stock for {product_id: quantity}; raises ValueError if short.
+
+        Returns False when this backend does not own stock, so the ORM write
+        must check it instead.
+        """
+        return False
+
+    def release_stock(self, requested: Dict[int, int]) -> None:
+        """Give back stock reserved by ``reserve_stock`` for a sale that was not saved."""
+
+    def record_sale(self, sale) -> None:
+        """Called with each sale once it is saved (the database backends need nothing)."""
+
+    def adjust_stock(self, product_id: int, delta: int) -> None:
+        """Called when a product's stock is edited by hand (restock, correction) rather than sold."""
+
+
+# ---------- Django ORM ----------
+class OrmRepository(Repository):
+    name = 'orm'
+
+    def product_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        return product_page(filters, cursor, limit)
+
+    def customer_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        return customer_page(filters, cursor, limit)
+
+    def get_products(self, ids):
+        return Product.objects.in_bulk(list(ids))
+
+    def catalog(self):
+        # Any create, edit, sale or delete changes the count, the newest update or the newest id
+        agg = Product.objects.aggregate(n=Count('id'), updated=Max('updated_at'), last=Max('id'))
+        raw = f"{agg['n']}:{agg['updated'].isoformat() if agg['updated'] else ''}:{agg['last']}"
+        return f'db-{hashlib.sha1(raw.encode()).hexdigest()[:16]}', self._catalog_rows
+
+    def _catalog_rows(self):
+        return [
+            [pid, sku, name, float(price), qty]
+            for pid, sku, name, price, qty in Product.objects.order_by('name', 'id').values_list(*CATALOG_FIELDS)
+        ]
+
+    def inventory_summary(self):
+        stats = get_stats()
+        return {
+            'total_products': stats.total_products,
+            'total_units': stats.total_units,
+            'stock_value': stats.stock_value,
+            'low_stock_products': low_stock_products(stats.low_stock),
+        }
+
+    def recent_sales(self, limit=5):
+        return list(Sale.objects.select_related('customer').order_by('-created_at')[:limit])
+
+    def get_sale(self, sale_id):
+        return sales_queryset().filter(pk=sale_id).first()
+
+
+# ---------- Firestore ----------
+class FirestoreRepository(Repository):
+    name = 'firestore'
+    thread_sensitive = False
+
+    def product_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        page = firestore_repo.page_products(filters, cursor, limit)
+        return Page([product_from_doc(d) for d in page.items], page.next_cursor)
+
+    def customer_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        page = firestore_repo.page_customers(filters, cursor, limit)
+        return Page([customer_from_doc(d) for d in page.items], page.next_cursor)
+
+    def get_products(self, ids):
+        return {pid: product_from_doc(d) for pid, d in firestore_repo.get_products(ids).items()}
+
+    def catalog(self):
+        rows = [
+            [d.get('id'), d.get('sku'), d.get('name'), float(d.get('selling_price') or 0), int(d.get('quantity') or 0)]
+            for d in firestore_repo.list_products()
+        ]
+        return f'fs-{hashlib.sha1(repr(rows).encode()).hexdigest()[:16]}', rows
+
+    def inventory_summary(self):
+        summary = firestore_repo.get_inventory_stats()
+        if summary is None:
+            raise LookupError('stats/inventory not written yet')
+        return {
+            'total_products': summary.get('total_products', 0),
+            'total_units': summary.get('total_units', 0),
+            'stock_value': Decimal(str(summary.get('stock_value', 0))),
+            'low_stock_products': low_stock_products(summary.get('low_stock') or {}),
+        }
+
+    def recent_sales(self, limit=5):
+        return firestore_repo.list_recent_sales(limit)
+
+    def get_sale(self, sale_id):
+        return firestore_repo.get_sale_for_receipt(sale_id)
+
+    def reserve_stock(self, requested):
+        # Batched with concurrent checkouts of this worker into one transaction
+        reservations.reserve_stock(requested)
+        return True
+
+    def release_stock(self, requested):
+        firestore_repo.release_stock(requested)
+
+    def adjust_stock(self, product_id, delta):
+        # Unsharded stock is mirrored from the ORM through the outbox
+        firestore_repo.adjust_sharded_stock(product_id, delta)
+
+
+# ---------- In-process memory ----------
+def _page(records: List[Any], sort_field: str, cursor: Optional[str], limit: int) -> Page:
+    records = sorted(records, key=lambda r: (getattr(r, sort_field) or '', r.id))
+    after = decode_cursor(cursor)
+    if after:
+        value, last_id = after
+        records = [r for r in records if ((getattr(r, sort_field) or ''), r.id) > (value or '', last_id)]
+    rows = records[:limit]
+    next_cursor = None
+    if len(records) > limit:
+        next_cursor = encode_cursor([getattr(rows[-1], sort_field), rows[-1].id])
+    return Page(rows, next_cursor)
+
+
+def _prefixed(value: Optional[str], prefix: str) -> bool:
+    # Case-insensitive, like the ORM listings
+    return bool(value) and value.upper().startswith(prefix.upper())
+
+
+class MemoryRepository(Repository):
+    """Products, customers and sales held in process memory.
+
+    Stock is reserved here under a lock, like a system of record; load it
+    with ``from_orm()`` or the ``add_*`` methods.
+    """
+    name = 'memory'
+    thread_sensitive = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.products: Dict[int, SimpleNamespace] = {}
+        self.customers: Dict[int, SimpleNamespace] = {}
+        self.sales: Dict[int, Any] = {}
+
+    @classmethod
+    def from_orm(cls, sales: int = 100) -> 'MemoryRepository':
+        repo = cls()
+        for product in Product.objects.iterator(chunk_size=2000):
+            repo.add_product(product_from_doc(product_doc(product)))
+        for customer in Customer.objects.iterator(chunk_size=2000):
+            repo.add_customer(customer_from_doc(customer_doc(customer)))
+        for sale in sales_queryset().order_by('-created_at')[:sales]:
+            repo.add_sale(sale)
+        return repo
+
+    def add_product(self, product) -> None:
+        self.products[product.id] = product
+
+    def add_customer(self, customer) -> None:
+        self.customers[customer.id] = customer
+
+    def add_sale(self, sale) -> None:
+        self.sales[sale.id] = sale
+
+    def product_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        records = list(self.products.values())
+        if filters.get('q'):
+            records = [p for p in records if _prefixed(p.name, filters['q'])]
+        if filters.get('sku'):
+            records = [p for p in records if _prefixed(p.sku, filters['sku'])]
+        if filters.get('in_stock'):
+            records = [p for p in records if p.quantity > 0]
+        if filters.get('low_stock'):
+            records = [p for p in records if p.quantity <= LOW_STOCK_THRESHOLD]
+        return _page(records, product_sort_field(filters), cursor, limit)
+
+    def customer_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        records = list(self.customers.values())
+        if filters.get('q'):
+            records = [c for c in records if _prefixed(c.name, filters['q'])]
+        return _page(records, 'name', cursor, limit)
+
+    def get_products(self, ids):
+        return {pid: self.products[pid] for pid in ids if pid in self.products}
+
+    def catalog(self):
+        products = sorted(self.products.values(), key=lambda p: (p.name or '', p.id))
+        rows = [[p.id, p.sku, p.name, float(p.selling_price or 0), p.quantity] for p in products]
+        return f'mem-{hashlib.sha1(repr(rows).encode()).hexdigest()[:16]}', rows
+
+    def inventory_summary(self):
+        products = list(self.products.values())
+        low = sorted((p for p in products if p.quantity <= LOW_STOCK_THRESHOLD),
+                     key=lambda p: (p.quantity, p.name or '', p.id))
+        return {
+            'total_products': len(products),
+            'total_units': sum(p.quantity for p in products),
+            'stock_value': sum((p.quantity * (p.cost_price or 0) for p in products), Decimal('0')),
+            'low_stock_products': [
+                {'id': p.id, 'sku': p.sku, 'name': p.name, 'quantity': p.quantity} for p in low[:LOW_STOCK_LIMIT]
+            ],
+        }
+
+    def recent_sales(self, limit=5):
+        return sorted(self.sales.values(), key=lambda s: s.created_at, reverse=True)[:limit]
+
+    def get_sale(self, sale_id):
+        return self.sales.get(sale_id)
+
+    def reserve_stock(self, requested):
+        with self._lock:
+            for pid, need in requested.items():
+                product = self.products.get(pid)
+                if product is None:
+                    raise ValueError(f'Product {pid} not found')
+                if need > product.quantity:
+                    raise ValueError(f'Only {product.quantity} units available for {product.name}')
+            for pid, need in requested.items():
+                self.products[pid].quantity -= need
+        return True
+
+    def release_stock(self, requested):
+        with self._lock:
+            for pid, units in requested.items():
+                if pid in self.products:
+                    self.products[pid].quantity += units
+
+    def record_sale(self, sale):
+        self.add_sale(sale)
+
+    def adjust_stock(self, product_id, delta):
+        with self._lock:
+            product = self.products.get(product_id)
+            if product is not None:
+                product.quantity = max(0, product.quantity + delta)
+
+
+# ---------- Wrappers ----------
+class FallbackRepository(Repository):
+    """Reads from ``primary``, or from ``fallback`` when primary raises.
+
+    Receipts are the exception: ``get_sale`` asks ``fallback`` first.
+    Stock reservation falls back only when the primary's circuit is open, i.e.
+    it was not attempted; any other failure may have reserved stock and must
+    fail the sale.
+    """
+
+    def __init__(self, primary: Repository, fallback: Repository):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f'{primary.name}+{fallback.name}'
+
+    def _read(self, method: str, *args, **kwargs):
+        try:
+            return getattr(self.primary, method)(*args, **kwargs)
+        except Exception:
+            return getattr(self.fallback, method)(*args, **kwargs)
+
+    def product_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        return self._read('product_page', filters, cursor, limit)
+
+    def customer_page(self, filters, cursor=None, limit=PAGE_SIZE):
+        return self._read('customer_page', filters, cursor, limit)
+
+    def get_products(self, ids):
+        return self._read('get_products', list(ids))
+
+    def catalog(self):
+        return self._read('catalog')
+
+    def inventory_summary(self):
+        return self._read('inventory_summary')
+
+    def recent_sales(self, limit=5):
+        return self._read('recent_sales', limit)
+
+    def get_sale(self, sale_id):
+        # The fallback (database) copy wins: a receipt rendered from it can be
+        # stored, so the primary is only asked for sales the database lacks
+        sale = self.fallback.get_sale(sale_id)
+        if sale is not None:
+            return sale
+        try:
+            return self.primary.get_sale(sale_id)
+        except Exception:
+            return None
+
+    def reserve_stock(self, requested):
+        try:
+            return self.primary.reserve_stock(requested)
+        except CircuitOpen:
+            return self.fallback.reserve_stock(requested)
+
+    def release_stock(self, requested):
+        # Only the primary owns stock: the fallback is the database, which checks it itself
+        self.primary.release_stock(requested)
+
+    def record_sale(self, sale):
+        self.primary.record_sale(sale)
+
+    def adjust_stock(self, product_id, delta):
+        self.primary.adjust_stock(product_id, delta)
+
+
+class LatencyRepository(Repository):
+    """Delays every call to ``inner`` by ``delay_ms`` (+ up to ``jitter_ms``) to simulate a remote store."""
+
+    def __init__(self, inner: Repository, delay_ms: float, jitter_ms: float = 0):
+        self.inner = inner
+        self.delay = delay_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.name = f'{inner.name}~{delay_ms:g}ms'
+        self.thread_sensitive = inner.thread_sensitive
+
+    def __getattribute__(self, attr):
+        if attr.startswith('_') or attr in ('inner', 'delay', 'jitter', 'name', 'thread_sensitive'):
+            return object.__getattribute__(self, attr)
+        target = getattr(self.inner, attr)
+        if not callable(target):
+            return target
+
+        def delayed(*args, **kwargs):
+            time.sleep(self.delay + (random.random() * self.jitter if self.jitter else 0))
+            return target(*args, **kwargs)
+        return delayed
+
+
+# ---------- Checkout ----------
+@contextmanager
+def sale_transaction(repo: Repository, requested: Dict[int, int], reserved: bool) -> Iterator[None]:
+    """``transaction.atomic()`` for saving a sale, giving stock reserved in ``repo`` back unless it commits.
+
+    The units go back when the block raises, when it marks the transaction
+    for rollback (``set_rollback``) and when the commit itself fails. Use it
+    as the outermost transaction: a rollback of an enclosing one is not seen.
+    Does nothing extra when ``reserved`` is false.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            rolled_back = transaction.get_rollback()
+    except BaseException:
+        if reserved:
+            _release(repo, requested)
+        raise
+    if reserved and rolled_back:
+        _release(repo, requested)
+
+
+def _release(repo: Repository, requested: Dict[int, int]) -> None:
+    try:
+        repo.release_stock(requested)
+    except Exception as exc:
+        logger.error('Could not give back reserved stock of an unsaved sale; add back by hand: %s (%s)',
+                     ', '.join(f'product {pid} +{units}' for pid, units in sorted(requested.items())), exc)
+
+
+# ---------- Async access ----------
+async def acall(repo: Repository, method: str, *args, **kwargs):
+    """Run the read ``repo.method(*args)`` from async code without blocking the event loop."""
+    if isinstance(repo, FallbackRepository):
+        # Each side runs on its own kind of thread: the ORM must not run on the pool
+        try:
+            return await acall(repo.primary, method, *args, **kwargs)
+        except Exception:
+            return await acall(repo.fallback, method, *args, **kwargs)
+    return await sync_to_async(getattr(repo, method), thread_sensitive=repo.thread_sensitive)(*args, **kwargs)
+
+
+# ---------- Selection ----------
+_selected: Dict[str, Optional[Repository]] = {'repository': None}
+_select_lock = threading.Lock()
+
+
+def build_repository(backend: Optional[str] = None, latency_ms: Optional[float] = None) -> Repository:
+    """Repository for ``backend`` (default: from the environment), optionally latency-wrapped."""
+    backend = (backend or os.environ.get('INVENTORY_BACKEND', '')).strip().lower()
+    if not backend:
+        backend = 'firestore' if firebase_sor_enabled() else 'orm'
+    if latency_ms is None:
+        try:
+            latency_ms = float(os.environ.get('INVENTORY_LATENCY_MS', '0') or 0)
+        except ValueError:
+            latency_ms = 0
+
+    if backend == 'orm':
+        repo: Repository = OrmRepository()
+    elif backend == 'firestore':
+        primary: Repository = FirestoreRepository()
+        if latency_ms:
+            primary = LatencyRepository(primary, latency_ms)
+        return FallbackRepository(primary, OrmRepository())
+    elif backend == 'memory':
+        repo = MemoryRepository.from_orm()
+    else:
+        raise ValueError(f'Unknown INVENTORY_BACKEND {backend!r}; use orm, firestore or memory')
+    return LatencyRepository(repo, latency_ms) if latency_ms else repo
+
+
+def get_repository() -> Repository:
+    """The process-wide repository, built on first use."""
+    repo = _selected['repository']
+    if repo is None:
+        with _select_lock:
+            if _selected['repository'] is None:
+                _selected['repository'] = build_repository()
+            repo = _selected['repository']
+    return repo
+
+
+def set_repository(repo: Optional[Repository]) -> None:
+    """Replace the process-wide repository (None: choose again on next use)."""
+    with _select_lock:
+        _selected['repository'] = repo
@@ -0,0 +1,157 @@
+"""Group commit for Firestore stock reservations.
+
+Every checkout used to run its own Firestore transaction; when several
+counters sell the same fast-moving part at once, those transactions contend
+on one product document and retry one after another. The coordinator queues
+concurrent reservations of a worker process and commits each batch in one
+transaction (``firestore_repo.reserve_stock_batch``), handing every caller
+its own result: the new quantities, or the ValueError for its cart only.
+
+There is no background thread. The first caller becomes the leader: it waits
+FIRESTORE_RESERVATION_WINDOW_MS (default 0) for others to join, commits up to
+FIRESTORE_RESERVATION_MAX_BATCH carts (default 50), and hands the lead to the
+first caller that queued meanwhile. With the default window nothing waits:
+carts only batch up while a commit is already in flight, so the batches grow
+with the contention. FIRESTORE_GROUP_COMMIT=false commits every cart on its
+own. Batching needs checkouts that overlap within one process, so it only
+helps threaded workers (gunicorn --threads). Under ASGI the sync checkout view
+runs on the worker's single sync thread, so its reservations never overlap.
+Each checkout's reservation latency, queueing included, is recorded by outcome
+in the metrics (see /health/metrics/).
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .firebase import _env_float
+from .firestore_repo import reserve_and_decrement_stock, reserve_stock_batch
+from .metrics import record_reservation
+
+
+class _Pending:
+    __slots__ = ('requested', 'result', 'error', 'lead', 'wake')
+
+    def __init__(self, requested: Dict[int, int]):
+        self.requested = requested
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.lead = False
+        self.wake = threading.Event()
+
+
+class ReservationCoordinator:
+    """Batches concurrent ``reserve`` calls into calls of ``commit(list of carts)``.
+
+    ``commit`` returns one entry per cart, either its result or the exception
+    to raise for it; if ``commit`` itself raises, every cart of the batch fails.
+    """
+
+    def __init__(self, commit: Callable[[List[Dict[int, int]]], List[Any]], window: float = 0.0,
+                 max_batch: int = 50):
+        self.commit = commit
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._queue: List[_Pending] = []
+        self._busy = False
+        self.counts = {'requests': 0, 'batches': 0, 'largest_batch': 0}
+
+    def reserve(self, requested: Dict[int, int]) -> Any:
+        pending = _Pending(requested)
+        with self._lock:
+            self.counts['requests'] += 1
+            self._queue.append(pending)
+            if not self._busy:
+                self._busy = pending.lead = True
+        if not pending.lead:
+            # Woken with a result, or to take over as leader
+            pending.wake.wait()
+        if pending.lead:
+            self._lead()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _lead(self) -> None:
+        try:
+            if self.window:
+                time.sleep(self.window)
+            with self._lock:
+                # The leader is first in the queue, so its cart is in this batch
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+                self.counts['batches'] += 1
+                self.counts['largest_batch'] = max(self.counts['largest_batch'], len(batch))
+            self._run(batch)
+        finally:
+            with self._lock:
+                if self._queue:
+                    successor = self._queue[0]
+                    successor.lead = True
+                    successor.wake.set()
+                else:
+                    self._busy = False
+
+    def _run(self, batch: List[_Pending]) -> None:
+        try:
+            results = self.commit([p.requested for p in batch])
+        except BaseException as exc:
+            results = [exc] * len(batch)
+        for pending, result in zip(batch, results):
+            if isinstance(result, BaseException):
+                pending.error = result
+            else:
+                pending.result = result
+            if not pending.lead:
+                pending.wake.set()
+
+
+_coordinator: Dict[str, Optional[ReservationCoordinator]] = {'firestore': None}
+_coordinator_lock = threading.Lock()
+
+
+def group_commit_enabled() -> bool:
+    return os.environ.get('FIRESTORE_GROUP_COMMIT', 'true').lower() in ('1', 'true', 'yes')
+
+
+def firestore_coordinator() -> ReservationCoordinator:
+    """The process-wide coordinator for Firestore reservations, configured from the environment."""
+    coordinator = _coordinator['firestore']
+    if coordinator is None:
+        with _coordinator_lock:
+            if _coordinator['firestore'] is None:
+                _coordinator['firestore'] = ReservationCoordinator(
+                    reserve_stock_batch,
+                    window=_env_float('FIRESTORE_RESERVATION_WINDOW_MS', 0) / 1000,
+                    max_batch=int(_env_float('FIRESTORE_RESERVATION_MAX_BATCH', 50)),
+                )
+            coordinator = _coordinator['firestore']
+    return coordinator
+
+
+def reset_firestore_coordinator() -> None:
+    """Forget the coordinator; the next reservation builds one from the environment."""
+    with _coordinator_lock:
+        _coordinator['firestore'] = None
+
+
+def reserve_stock(requested: Dict[int, int]) -> Dict[int, int]:
+    """Reserve one cart in Firestore, batched with concurrent ones when group commit is on.
+
+    Returns {product_id: quantity left}; raises ValueError if the cart does not fit.
+    """
+    started = time.perf_counter()
+    outcome = 'failed'
+    try:
+        if group_commit_enabled():
+            result = firestore_coordinator().reserve(requested)
+        else:
+            result = reserve_and_decrement_stock(requested)
+        outcome = 'reserved'
+        return result
+    except ValueError:
+        outcome = 'insufficient'
+        raise
+    finally:
+        record_reservation(outcome, time.perf_counter() - started)
@@ -0,0 +1,175 @@
+"""Daily sales rollups for revenue and margin reporting.
+
+post_sale adds each sale to per-day, per-product and per-customer totals
+right after the sale's transaction commits, in a short transaction of its own
+with one increment-upsert statement per table, so checkouts never queue on a
+busy day's rollup rows (every walk-in sale shares one customer row) while
+holding their product locks. Reports read only these tables, so a month or a year is a scan of at
+most (days x products) small rows no matter how many sales exist.
+``rebuild_rollups`` recomputes them from Sale/SaleItem.
+
+Cost comes from SaleItem.unit_cost, captured at posting time; older items
+without it fall back to the product's current cost price.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DailyCustomerSales, DailyProductSales, SaleItem
+
+ZERO = Decimal('0')
+MONEY = DecimalField(max_digits=16, decimal_places=2)
+
+
+def sale_day(sale) -> date:
+    value = sale.date
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+# ---------- Incremental updates ----------
+def record_sale(sale, items: Iterable[SaleItem]) -> None:
+    """Add a freshly posted sale to the rollups once the sale transaction commits."""
+    day = sale_day(sale)
+    per_product: Dict[int, List[Any]] = {}
+    units, revenue, cost = 0, ZERO, ZERO
+    for it in items:
+        item_cost = it.quantity * (it.unit_cost or ZERO)
+        row = per_product.setdefault(it.product_id, [0, ZERO, ZERO])
+        row[0] += it.quantity
+        row[1] += it.total_price
+        row[2] += item_cost
+        units += it.quantity
+        revenue += it.total_price
+        cost += item_cost
+
+    product_rows = [(day, pid, *totals) for pid, totals in sorted(per_product.items())]
+    customer_rows = [(day, sale.customer_id, 1, units, revenue, cost)]
+    transaction.on_commit(lambda: _apply(product_rows, customer_rows))
+
+
+def _apply(product_rows: List[tuple], customer_rows: List[tuple]) -> None:
+    with transaction.atomic():
+        _increment(DailyProductSales, ['day', 'product'], ['units', 'revenue', 'cost'], product_rows)
+        _increment(DailyCustomerSales, ['day', 'customer'], ['sales_count', 'units', 'revenue', 'cost'],
+                   customer_rows)
+
+
+def _increment(model, keys: Sequence[str], values: Sequence[str], rows: List[tuple]) -> None:
+    """Upsert rows, adding ``values`` onto existing rows with the same ``keys``."""
+    if not rows:
+        return
+    if connection.vendor in ('sqlite', 'postgresql'):
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        key_cols = [qn(model._meta.get_field(k).column) for k in keys]
+        value_cols = [qn(model._meta.get_field(v).column) for v in values]
+        placeholders = '(' + ', '.join(['%s'] * (len(keys) + len(values))) + ')'
+        sql = (
+            f'INSERT INTO {table} ({", ".join(key_cols + value_cols)}) '
+            f'VALUES {", ".join([placeholders] * len(rows))} '
+            f'ON CONFLICT ({", ".join(key_cols)}) DO UPDATE SET '
+            + ', '.join(f'{col} = {table}.{col} + excluded.{col}' for col in value_cols)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [param for row in rows for param in row])
+        return
+    # Portable fallback: UPDATE ... SET col = col + n, INSERT when missing
+    for row in rows:
+        lookup = dict(zip(keys, row[:len(keys)]))
+        deltas = dict(zip(values, row[len(keys):]))
+        increments = {name: F(name) + delta for name, delta in deltas.items()}
+        if model.objects.filter(**lookup).update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **deltas)
+        except IntegrityError:
+            model.objects.filter(**lookup).update(**increments)
+
+
+# ---------- Rebuild ----------
+def _item_cost():
+    return ExpressionWrapper(F('quantity') * Coalesce(F('unit_cost'), F('product__cost_price')), output_field=MONEY)
+
+
+def rebuild_rollups(start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, int]:
+    """Recompute rollups for days in [start, end] (all history by default)."""
+    items = SaleItem.objects.annotate(day=TruncDate('sale__date'))
+    product_rows = DailyProductSales.objects.all()
+    customer_rows = DailyCustomerSales.objects.all()
+    if start:
+        items = items.filter(day__gte=start)
+        product_rows = product_rows.filter(day__gte=start)
+        customer_rows = customer_rows.filter(day__gte=start)
+    if end:
+        items = items.filter(day__lte=end)
+        product_rows = product_rows.filter(day__lte=end)
+        customer_rows = customer_rows.filter(day__lte=end)
+
+    by_product = items.values('day', 'product_id').annotate(
+        total_units=Sum('quantity'), total_revenue=Sum('total_price'), total_cost=Sum(_item_cost()),
+    ).order_by()
+    by_customer = items.values('day', 'sale__customer_id').annotate(
+        total_sales=Count('sale_id', distinct=True), total_units=Sum('quantity'),
+        total_revenue=Sum('total_price'), total_cost=Sum(_item_cost()),
+    ).order_by()
+
+    with transaction.atomic():
+        product_rows.delete()
+        customer_rows.delete()
+        DailyProductSales.objects.bulk_create((
+            DailyProductSales(day=r['day'], product_id=r['product_id'], units=r['total_units'],
+                              revenue=r['total_revenue'] or ZERO, cost=r['total_cost'] or ZERO)
+            for r in by_product.iterator()
+        ), batch_size=1000)
+        DailyCustomerSales.objects.bulk_create((
+            DailyCustomerSales(day=r['day'], customer_id=r['sale__customer_id'], sales_count=r['total_sales'],
+                               units=r['total_units'], revenue=r['total_revenue'] or ZERO,
+                               cost=r['total_cost'] or ZERO)
+            for r in by_customer.iterator()
+        ), batch_size=1000)
+    return {
+        'product_days': product_rows.count(),
+        'customer_days': customer_rows.count(),
+    }
+
+
+# ---------- Reports ----------
+def _totals(qs) -> Dict[str, Any]:
+    return qs.aggregate(units=Coalesce(Sum('units'), 0), revenue=Coalesce(Sum('revenue'), ZERO, output_field=MONEY),
+                        cost=Coalesce(Sum('cost'), ZERO, output_field=MONEY))
+
+
+def _with_margin(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    result = []
+    for row in rows:
+        row['margin'] = row['revenue'] - row['cost']
+        row['margin_pct'] = (row['margin'] / row['revenue'] * 100) if row['revenue'] else None
+        result.append(row)
+    return result
+
+
+def sales_report(start: date, end: date, limit: int = 50) -> Dict[str, Any]:
+    """Totals, per-day series and top products/customers for [start, end], from rollups only."""
+    products = DailyProductSales.objects.filter(day__gte=start, day__lte=end)
+    customers = DailyCustomerSales.objects.filter(day__gte=start, day__lte=end)
+    sums = dict(units=Sum('units'), revenue=Sum('revenue'), cost=Sum('cost'))
+
+    totals = _with_margin([_totals(customers)])[0]
+    totals['sales'] = customers.aggregate(n=Coalesce(Sum('sales_count'), 0))['n']
+    return {
+        'totals': totals,
+        'days': _with_margin(customers.values('day').annotate(sales=Sum('sales_count'), **sums).order_by('day')),
+        'products': _with_margin(
+            products.values('product_id', 'product__sku', 'product__name').annotate(**sums).order_by('-revenue')[:limit]
+        ),
+        'customers': _with_margin(
+            customers.values('customer_id', 'customer__name')
+            .annotate(sales=Sum('sales_count'), **sums).order_by('-revenue')[:limit]
+        ),
+    }
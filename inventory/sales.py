@@ -0,0 +1,92 @@
+"""Sale posting service.
+
+Posts a whole cart in a fixed number of queries: one locked read of the
+products involved, one INSERT for the sale, one UPDATE that decrements stock
+with database-side arithmetic and one bulk INSERT for the items. The stats
+counters and sales rollups are updated after the transaction commits.
+"""
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from . import rollups, stats
+from .models import Product, Sale, SaleItem
+
+
+def post_sale(sale: Sale, lines: Iterable[Tuple[int, int]], check_stock: bool = True) -> Sale:
+    """Persist an unsaved ``sale`` with one SaleItem per (product_id, quantity) line.
+
+    Stock for the whole cart is checked against rows locked with
+    SELECT ... FOR UPDATE, so concurrent checkouts of the same SKU serialize
+    instead of overwriting each other. Pass check_stock=False when stock was
+    already reserved elsewhere (Firestore SoR); quantities are then clamped at 0.
+    Raises ValueError when a product is missing or stock is insufficient.
+    """
+    lines = [(int(pid), int(qty)) for pid, qty in lines if int(qty) > 0]
+    if not lines:
+        raise ValueError('Add at least one product to the sale.')
+
+    requested: Dict[int, int] = {}
+    for pid, qty in lines:
+        requested[pid] = requested.get(pid, 0) + qty
+
+    with transaction.atomic():
+        # Lock in primary key order so concurrent carts cannot deadlock
+        products = {
+            p.id: p
+            for p in Product.objects.select_for_update().filter(id__in=requested).order_by('id')
+        }
+        for pid, need in requested.items():
+            product = products.get(pid)
+            if product is None:
+                raise ValueError(f'Product {pid} no longer exists')
+            if check_stock and need > product.quantity:
+                raise ValueError(f'Only {product.quantity} units available for {product.name}')
+
+        items: List[SaleItem] = []
+        total = Decimal('0')
+        for pid, qty in lines:
+            product = products[pid]
+            item = SaleItem(
+                product=product,
+                quantity=qty,
+                unit_price=product.selling_price,
+                total_price=qty * product.selling_price,
+                unit_cost=product.cost_price,
+            )
+            total += item.total_price
+            items.append(item)
+
+        sale.total_amount = total
+        sale.save()
+
+        Product.objects.filter(id__in=requested).update(
+            quantity=Case(
+                *[When(id=pid, then=Greatest(F('quantity') - need, 0)) for pid, need in requested.items()],
+                default=F('quantity'),
+                output_field=Product._meta.get_field('quantity'),
+            ),
+            updated_at=timezone.now(),
+        )
+        changes = []
+        for pid, need in requested.items():
+            before = products[pid].stock_state()
+            products[pid].quantity = max(products[pid].quantity - need, 0)
+            changes.append((before, products[pid].stock_state()))
+        stats.record_changes(changes)
+
+        for item in items:
+            item.sale = sale
+        SaleItem.objects.bulk_create(items)
+        rollups.record_sale(sale, items)
+
+        # bulk_create bypasses save(); keep per-item post_save receivers informed
+        for item in items:
+            post_save.send(sender=SaleItem, instance=item, created=True, raw=False,
+                           using=sale._state.db, update_fields=None)
+    return sale
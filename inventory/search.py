@@ -0,0 +1,225 @@
+"""Ranked full-text product search over sku, name and description.
+
+SQLite uses an external-content FTS5 table kept in sync by triggers; Postgres
+uses a generated, weighted ``tsvector`` column with a GIN index. Both are
+maintained by the database itself, so form saves, queryset updates and bulk
+catalog imports are indexed without any application code. Every query term is
+matched as a prefix (typeahead) and SKU hits rank above name hits above
+description hits. Other databases fall back to a plain prefix/contains filter.
+
+SQLite drops triggers when Django rebuilds a table during a migration (e.g.
+an AlterField on Product); ``repair_search_triggers`` runs after every
+``migrate`` and recreates them, reindexing what changed in between.
+``manage.py rebuild_search_index`` does the same by hand.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+MAX_TERMS = 8
+MIN_RANKED_CHARS = 3
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_product_fts USING fts5(
+        sku, name, description,
+        content='inventory_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_product_fts_ai AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(rowid, sku, name, description)
+        VALUES (new.id, new.sku, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_product_fts_ad AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, sku, name, description)
+        VALUES ('delete', old.id, old.sku, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_product_fts_au AFTER UPDATE OF sku, name, description ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, sku, name, description)
+        VALUES ('delete', old.id, old.sku, old.name, old.description);
+        INSERT INTO inventory_product_fts(rowid, sku, name, description)
+        VALUES (new.id, new.sku, new.name, new.description);
+    END
+    """,
+    "INSERT INTO inventory_product_fts(inventory_product_fts) VALUES ('rebuild')",
+]
+SQLITE_TRIGGERS = ('inventory_product_fts_ai', 'inventory_product_fts_ad', 'inventory_product_fts_au')
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS inventory_product_fts_au',
+    'DROP TRIGGER IF EXISTS inventory_product_fts_ad',
+    'DROP TRIGGER IF EXISTS inventory_product_fts_ai',
+    'DROP TABLE IF EXISTS inventory_product_fts',
+]
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE inventory_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS inventory_product_search_idx ON inventory_product USING GIN (search_vector)',
+]
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS inventory_product_search_idx',
+    'ALTER TABLE inventory_product DROP COLUMN IF EXISTS search_vector',
+]
+
+_available: Dict[str, bool] = {}
+
+
+# ---------- Schema ----------
+def _execute(conn, statements: List[str]) -> None:
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def install_search_index(conn=None) -> None:
+    """Create (or repair) the index and its sync triggers, then (re)build it."""
+    conn = conn or connection
+    if conn.vendor == 'sqlite':
+        _execute(conn, SQLITE_INSTALL)
+    elif conn.vendor == 'postgresql':
+        _execute(conn, POSTGRES_INSTALL)
+    _available.pop(conn.alias, None)
+
+
+def uninstall_search_index(conn=None) -> None:
+    conn = conn or connection
+    if conn.vendor == 'sqlite':
+        _execute(conn, SQLITE_UNINSTALL)
+    elif conn.vendor == 'postgresql':
+        _execute(conn, POSTGRES_UNINSTALL)
+    _available.pop(conn.alias, None)
+
+
+def repair_search_triggers(conn=None) -> bool:
+    """Recreate the SQLite sync triggers if a table rebuild dropped them. Returns True if it did."""
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        if 'inventory_product_fts' not in conn.introspection.table_names(cursor):
+            return False
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'inventory_product'")
+        present = {row[0] for row in cursor.fetchall()}
+    if present.issuperset(SQLITE_TRIGGERS):
+        return False
+    # Rows changed while the triggers were missing are picked up by the rebuild
+    install_search_index(conn)
+    return True
+
+
+def search_backend(conn=None) -> str:
+    """'fts5', 'tsvector' or 'basic' depending on what the database provides."""
+    conn = conn or connection
+    if conn.alias not in _available:
+        with conn.cursor() as cursor:
+            if conn.vendor == 'sqlite':
+                _available[conn.alias] = 'inventory_product_fts' in conn.introspection.table_names(cursor)
+            elif conn.vendor == 'postgresql':
+                columns = conn.introspection.get_table_description(cursor, 'inventory_product')
+                _available[conn.alias] = any(col.name == 'search_vector' for col in columns)
+            else:
+                _available[conn.alias] = False
+    if not _available[conn.alias]:
+        return 'basic'
+    return 'fts5' if conn.vendor == 'sqlite' else 'tsvector'
+
+
+# ---------- Queries ----------
+def _terms(query: str) -> List[str]:
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _fts5(terms: List[str], in_stock: bool, limit: int, offset: int) -> List[Tuple]:
+    # Quoted terms with a trailing * are prefix matches; spaces mean AND
+    match = ' '.join(f'"{t}"*' for t in terms)
+    # One or two typed characters match a large share of the catalog and
+    # ranking all of them costs more than it helps; serve those in index order.
+    if sum(len(t) for t in terms) < MIN_RANKED_CHARS:
+        order = 'p.id'
+    else:
+        order = 'bm25(inventory_product_fts, 10.0, 5.0, 1.0), p.name, p.id'
+    sql = (
+        'SELECT p.id, p.sku, p.name, p.selling_price, p.quantity '
+        'FROM inventory_product_fts f JOIN inventory_product p ON p.id = f.rowid '
+        'WHERE inventory_product_fts MATCH %s'
+        + (' AND p.quantity > 0' if in_stock else '') +
+        f' ORDER BY {order} LIMIT %s OFFSET %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit, offset])
+        return cursor.fetchall()
+
+
+def _tsvector(terms: List[str], in_stock: bool, limit: int, offset: int) -> List[Tuple]:
+    tsquery = ' & '.join(f'{t}:*' for t in terms)
+    sql = (
+        "SELECT id, sku, name, selling_price, quantity FROM inventory_product, to_tsquery('simple', %s) q "
+        'WHERE search_vector @@ q'
+        + (' AND quantity > 0' if in_stock else '') +
+        ' ORDER BY ts_rank_cd(search_vector, q) DESC, name, id LIMIT %s OFFSET %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, limit, offset])
+        return cursor.fetchall()
+
+
+def _basic(query: str, in_stock: bool, limit: int, offset: int) -> List[Tuple]:
+    qs = Product.objects.filter(Q(sku__istartswith=query) | Q(name__icontains=query))
+    if in_stock:
+        qs = qs.filter(quantity__gt=0)
+    fields = ('id', 'sku', 'name', 'selling_price', 'quantity')
+    return list(qs.order_by('name', 'id').values_list(*fields)[offset:offset + limit])
+
+
+def search_products(query: str, page: int = 1, page_size: int = PAGE_SIZE,
+                    in_stock: bool = False) -> Dict[str, Any]:
+    """One page of ranked matches: {'results': [...], 'page': n, 'has_next': bool}."""
+    page = max(1, page)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    offset = (page - 1) * page_size
+    terms = _terms(query)
+    if not terms:
+        return {'results': [], 'page': page, 'has_next': False}
+
+    backend = search_backend()
+    if backend == 'fts5':
+        rows = _fts5(terms, in_stock, page_size + 1, offset)
+    elif backend == 'tsvector':
+        rows = _tsvector(terms, in_stock, page_size + 1, offset)
+    else:
+        rows = _basic(query.strip(), in_stock, page_size + 1, offset)
+
+    results = [
+        {'id': pid, 'sku': sku, 'name': name, 'selling_price': float(price), 'quantity': qty}
+        for pid, sku, name, price, qty in rows[:page_size]
+    ]
+    return {'results': results, 'page': page, 'has_next': len(rows) > page_size}
+
+
+def search_product_ids(query: str, limit: int = MAX_PAGE_SIZE) -> Optional[List[int]]:
+    """Ids of the best matches, or None when no full-text index is available."""
+    terms = _terms(query)
+    backend = search_backend()
+    if backend == 'fts5':
+        return [row[0] for row in _fts5(terms, False, limit, 0)] if terms else []
+    if backend == 'tsvector':
+        return [row[0] for row in _tsvector(terms, False, limit, 0)] if terms else []
+    return None
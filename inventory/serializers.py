@@ -0,0 +1,242 @@
+"""Firestore document builders for products, customers and sales.
+
+Every path that writes a sale to Firestore (outbox sync, event signals,
+backfill) and the receipt view share these helpers. Sales are loaded with
+their customer joined and their items prefetched with products joined, so
+serializing any number of sales costs a constant number of queries.
+
+The ``*_from_doc`` readers turn documents back into objects with the same
+attributes and value types as the models, so templates see one shape
+whichever backend served them.
+"""
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.dateparse import parse_datetime
+
+from .models import Sale, SaleItem
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except Exception:
+        return None
+
+
+def _decimal(value) -> Optional[Decimal]:
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _datetime(value):
+    if isinstance(value, str):
+        try:
+            return parse_datetime(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _doc_id(d: Dict[str, Any]):
+    pk = d.get('id')
+    return int(pk) if isinstance(pk, str) and pk.isdigit() else pk
+
+
+# ---------- Querysets ----------
+def _items_prefetch() -> Prefetch:
+    return Prefetch('items', queryset=SaleItem.objects.select_related('product').order_by('id'))
+
+
+def sales_queryset(qs=None):
+    """Sales with customer and items (with products) loaded in two queries."""
+    qs = Sale.objects.all() if qs is None else qs
+    return qs.select_related('customer').prefetch_related(_items_prefetch())
+
+
+def prefetch_sales(sales: Iterable[Sale]) -> List[Sale]:
+    """Load customers and items for already fetched sales; skips what is cached."""
+    sales = list(sales)
+    prefetch_related_objects(sales, 'customer', _items_prefetch())
+    return sales
+
+
+# ---------- Documents ----------
+def checksum(doc: Dict[str, Any]) -> int:
+    """32-bit digest of a document's fields, its own ``checksum`` excluded.
+
+    Mirrored documents carry it so inventory.reconcile can compare whole id
+    ranges with Firestore sum() aggregations instead of reading them.
+    """
+    raw = json.dumps({k: v for k, v in doc.items() if k != 'checksum'},
+                     sort_keys=True, separators=(',', ':'), default=str)
+    return int(hashlib.sha1(raw.encode()).hexdigest()[:8], 16)
+
+
+def _signed(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc['checksum'] = checksum(doc)
+    return doc
+
+
+def product_doc(product) -> Dict[str, Any]:
+    """Firestore representation of a Django Product."""
+    return _signed({
+        'id': product.id,
+        'sku': product.sku,
+        'name': product.name,
+        'description': product.description,
+        'cost_price': float(product.cost_price),
+        'selling_price': float(product.selling_price),
+        'quantity': int(product.quantity),
+        'updated_at': _iso(getattr(product, 'updated_at', None)),
+        'created_at': _iso(getattr(product, 'created_at', None)),
+    })
+
+
+def customer_doc(customer) -> Dict[str, Any]:
+    """Firestore representation of a Django Customer."""
+    return _signed({
+        'id': customer.id,
+        'name': customer.name,
+        'phone': customer.phone,
+        'email': customer.email,
+        'address': customer.address,
+        'created_at': _iso(getattr(customer, 'created_at', None)),
+    })
+
+
+def sale_item_doc(item: SaleItem) -> Dict[str, Any]:
+    return {
+        'product_id': item.product_id,
+        'product_name': item.product.name,
+        'quantity': int(item.quantity),
+        'unit_price': _float(item.unit_price),
+        'total_price': _float(item.total_price),
+    }
+
+
+def sale_doc(sale: Sale) -> Dict[str, Any]:
+    """Canonical sale document; expects a sale from sales_queryset/prefetch_sales."""
+    return _signed({
+        'id': sale.id,
+        'invoice_number': sale.invoice_number,
+        'customer_id': sale.customer_id,
+        'customer_name': sale.customer.name,
+        'total_amount': _float(sale.total_amount),
+        'date': sale.date.isoformat(),
+        'created_at': _iso(sale.created_at),
+        'items': [sale_item_doc(it) for it in sale.items.all()],
+    })
+
+
+def sale_documents(sale: Sale) -> List[Tuple[str, Dict[str, Any], bool]]:
+    """Return (document path, data, merge) writes that mirror a committed sale:
+    the canonical sale document followed by the post-sale product documents.
+    """
+    prefetch_sales([sale])
+    writes = [(f'sales/{sale.id}', sale_doc(sale), False)]
+    for it in sale.items.all():
+        writes.append((f'products/{it.product_id}', product_doc(it.product), True))
+    return writes
+
+
+def sales_documents(sales: Iterable[Sale]) -> List[Tuple[str, Dict[str, Any], bool]]:
+    """sale_documents for many sales, prefetched together."""
+    writes = []
+    for sale in prefetch_sales(sales):
+        writes.extend(sale_documents(sale))
+    return writes
+
+
+# ---------- Events ----------
+def sale_event(sale: Sale) -> Dict[str, Any]:
+    prefetch_sales([sale])
+    doc = sale_doc(sale)
+    del doc['checksum']
+    doc['sale_id'] = doc.pop('id')
+    doc['event_type'] = 'sale_created'
+    return doc
+
+
+def stock_event(item: SaleItem) -> Dict[str, Any]:
+    doc = sale_item_doc(item)
+    doc['sale_id'] = item.sale_id
+    doc['quantity_change'] = -doc.pop('quantity')
+    doc['event_type'] = 'stock_decremented'
+    return doc
+
+
+# ---------- Receipts ----------
+def product_from_doc(d: Dict[str, Any]) -> SimpleNamespace:
+    """Product-shaped object (attribute access like the model) from a product document."""
+    pk = _doc_id(d)
+    return SimpleNamespace(
+        id=pk,
+        pk=pk,
+        sku=d.get('sku'),
+        name=d.get('name'),
+        description=d.get('description'),
+        cost_price=_decimal(d.get('cost_price')),
+        selling_price=_decimal(d.get('selling_price')),
+        quantity=int(d.get('quantity') or 0),
+        created_at=_datetime(d.get('created_at')),
+        updated_at=_datetime(d.get('updated_at')),
+    )
+
+
+def customer_from_doc(d: Dict[str, Any]) -> SimpleNamespace:
+    """Customer-shaped object from a customer document."""
+    pk = _doc_id(d)
+    return SimpleNamespace(
+        id=pk,
+        pk=pk,
+        name=d.get('name'),
+        phone=d.get('phone'),
+        email=d.get('email'),
+        address=d.get('address'),
+        created_at=_datetime(d.get('created_at')),
+    )
+
+
+def sale_from_doc(d: Dict[str, Any]) -> SimpleNamespace:
+    """Sale-shaped object (attribute access like the model) from a sale document."""
+    items = [
+        SimpleNamespace(
+            product_id=it.get('product_id'),
+            product=SimpleNamespace(id=it.get('product_id'), name=it.get('product_name')),
+            quantity=it.get('quantity'),
+            unit_price=_decimal(it.get('unit_price')),
+            total_price=_decimal(it.get('total_price')),
+        )
+        for it in d.get('items', [])
+    ]
+    pk = _doc_id(d)
+    return SimpleNamespace(
+        id=pk,
+        pk=pk,
+        invoice_number=d.get('invoice_number'),
+        customer_id=d.get('customer_id'),
+        customer=SimpleNamespace(id=d.get('customer_id'), name=d.get('customer_name')),
+        date=_datetime(d.get('date')),
+        created_at=_datetime(d.get('created_at')),
+        total_amount=_decimal(d.get('total_amount')),
+        items=items,
+    )
+
+
+def receipt_items(sale) -> list:
+    """Line items of a model sale or a sale_from_doc namespace."""
+    items = sale.items
+    return list(items.all()) if hasattr(items, 'all') else list(items)
@@ -1,76 +1,47 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.forms.models import model_to_dict
-from .models import Sale, SaleItem
-from .firebase import get_firestore_client, firebase_enabled
-
-
-def _safe_float(value):
-    try:
-        return float(value)
-    except Exception:
-        return None
+from .models import Product, Sale, SaleItem
+from .serializers import sale_event, stock_event
+from . import events, stats
+from .metrics import timed
 
 
 @receiver(post_save, sender=Sale)
+@timed('signal')
 def log_sale_to_firestore(sender, instance: Sale, created: bool, **kwargs):
     if not created:
         return
-    if not firebase_enabled():
-        return
-
-    db = get_firestore_client()
-    if not db:
-        return
-
-    try:
-        items = []
-        for it in instance.items.all():
-            items.append({
-                'product_id': it.product_id,
-                'product_name': it.product.name,
-                'quantity': it.quantity,
-                'unit_price': _safe_float(it.unit_price),
-                'total_price': _safe_float(it.total_price),
-            })
-        doc = {
-            'sale_id': instance.id,
-            'invoice_number': instance.invoice_number,
-            'customer_id': instance.customer_id,
-            'customer_name': instance.customer.name,
-            'total_amount': _safe_float(instance.total_amount),
-            'date': instance.date.isoformat(),
-            'created_at': instance.created_at.isoformat() if instance.created_at else None,
-            'items': items,
-            'event_type': 'sale_created',
-        }
-        db.collection('sales_events').add(doc)
-    except Exception:
-        # Never block main flow
-        pass
+    # Built at commit time, once the sale items have been saved
+    events.emit('sales_events', lambda: sale_event(instance))
 
 
 @receiver(post_save, sender=SaleItem)
+@timed('signal')
 def log_stock_event(sender, instance: SaleItem, created: bool, **kwargs):
     if not created:
         return
-    if not firebase_enabled():
-        return
+    events.emit('stock_events', stock_event(instance))
 
-    db = get_firestore_client()
-    if not db:
-        return
 
-    try:
-        doc = {
-            'sale_id': instance.sale_id,
-            'product_id': instance.product_id,
-            'product_name': instance.product.name,
-            'quantity_change': -int(instance.quantity),
-            'unit_price': _safe_float(instance.unit_price),
-            'total_price': _safe_float(instance.total_price),
-            'event_type': 'stock_decremented',
-        }
-        db.collection('stock_events').add(doc)
-    except Exception:
-        pass
+@receiver(post_save, sender=Product)
+@timed('signal')
+def track_product_stats(sender, instance: Product, created: bool, raw: bool = False, **kwargs):
+    if raw:
+        return
+    after = instance.stock_state()
+    if created:
+        stats.record_changes([(None, after)])
+    elif hasattr(instance, '_loaded_stock_state'):
+        stats.record_changes([(instance._loaded_stock_state, after)])
+    else:
+        # Saved without being loaded first; the previous state is unknown
+        transaction.on_commit(stats.rebuild_stats)
+    instance._loaded_stock_state = after
+
+
+@receiver(post_delete, sender=Product)
+@timed('signal')
+def untrack_product_stats(sender, instance: Product, **kwargs):
+    before = getattr(instance, '_loaded_stock_state', None) or instance.stock_state()
+    stats.record_changes([(before, None)])
@@ -0,0 +1,145 @@
+"""Incrementally maintained inventory aggregates for the dashboard.
+
+Every place that changes product quantities or prices reports (before, after)
+product states here. The deltas are applied to the single InventoryStats row
+right after the surrounding transaction commits, in a short transaction of
+their own, so checkouts never queue on the stats row while holding their
+product locks. The row is mirrored to the Firestore ``stats/inventory``
+document through the outbox, making the dashboard a single small read on
+either backend. ``rebuild_stats`` recomputes everything from scratch.
+"""
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+from .listings import LOW_STOCK_THRESHOLD
+from .models import InventoryStats, Product
+from .outbox import enqueue
+
+StockState = Optional[Dict[str, Any]]
+
+STATS_ID = 1
+STATS_DOC_PATH = 'stats/inventory'
+# Only the lowest entries are kept: the row and its Firestore mirror are
+# rewritten on every stock change and must stay small however many products
+# run low.
+LOW_STOCK_LIMIT = 50
+
+
+def _low_stock_entry(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {'id': state['id'], 'sku': state['sku'], 'name': state['name'], 'quantity': state['quantity']}
+
+
+def _low_stock_key(entry: Dict[str, Any]):
+    return (entry.get('quantity', 0), entry.get('name') or '', entry.get('id') or 0)
+
+
+def _lowest(entries: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {str(e['id']): e for e in sorted(entries, key=_low_stock_key)[:LOW_STOCK_LIMIT]}
+
+
+def _load_low_stock() -> Dict[str, Dict[str, Any]]:
+    rows = (Product.objects.filter(quantity__lte=LOW_STOCK_THRESHOLD)
+            .order_by('quantity', 'name', 'id').values('id', 'sku', 'name', 'quantity')[:LOW_STOCK_LIMIT])
+    return {str(row['id']): row for row in rows}
+
+
+def _value(state: StockState) -> Decimal:
+    if not state:
+        return Decimal('0')
+    return state['quantity'] * Decimal(state['cost_price'])
+
+
+def summarize(changes: Iterable[Tuple[StockState, StockState]]) -> Dict[str, Any]:
+    """Fold (before, after) product states into counter deltas and low-stock updates."""
+    delta = {'products': 0, 'units': 0, 'value': Decimal('0'), 'low_stock': {}}
+    for before, after in changes:
+        delta['products'] += (after is not None) - (before is not None)
+        delta['units'] += (after['quantity'] if after else 0) - (before['quantity'] if before else 0)
+        delta['value'] += _value(after) - _value(before)
+        state = after or before
+        key = str(state['id'])
+        if after is not None and after['quantity'] <= LOW_STOCK_THRESHOLD:
+            delta['low_stock'][key] = _low_stock_entry(after)
+        elif after is None or (before is not None and before['quantity'] <= LOW_STOCK_THRESHOLD):
+            delta['low_stock'][key] = None
+    return delta
+
+
+def record_changes(changes: Iterable[Tuple[StockState, StockState]]) -> None:
+    """Apply product state changes to the aggregates once the transaction commits."""
+    delta = summarize(changes)
+    if not (delta['products'] or delta['units'] or delta['value'] or delta['low_stock']):
+        return
+    transaction.on_commit(lambda: _apply(delta))
+
+
+def _apply(delta: Dict[str, Any]) -> None:
+    with transaction.atomic():
+        stats = InventoryStats.objects.select_for_update().filter(pk=STATS_ID).first()
+        if stats is None:
+            # First use: the committed rows already include this change
+            rebuild_stats()
+            return
+        stats.total_products += delta['products']
+        stats.total_units += delta['units']
+        stats.stock_value += delta['value']
+        removed = False
+        for key, entry in delta['low_stock'].items():
+            if entry is None:
+                removed |= stats.low_stock.pop(key, None) is not None
+            else:
+                stats.low_stock[key] = entry
+        if removed and len(stats.low_stock) < LOW_STOCK_LIMIT:
+            # Products beyond the cap may now belong in the list
+            stats.low_stock = _load_low_stock()
+        else:
+            stats.low_stock = _lowest(stats.low_stock.values())
+        stats.save()
+        _mirror(stats)
+
+
+def rebuild_stats() -> InventoryStats:
+    """Recompute the aggregates from the Product table."""
+    value_expr = ExpressionWrapper(F('quantity') * F('cost_price'),
+                                   output_field=DecimalField(max_digits=16, decimal_places=2))
+    totals = Product.objects.aggregate(products=Count('id'), units=Sum('quantity'), value=Sum(value_expr))
+    low_stock = _load_low_stock()
+    with transaction.atomic():
+        stats, _ = InventoryStats.objects.update_or_create(
+            pk=STATS_ID,
+            defaults={
+                'total_products': totals['products'] or 0,
+                'total_units': totals['units'] or 0,
+                'stock_value': totals['value'] or 0,
+                'low_stock': low_stock,
+            },
+        )
+        _mirror(stats)
+    return stats
+
+
+def get_stats() -> InventoryStats:
+    stats = InventoryStats.objects.filter(pk=STATS_ID).first()
+    return stats if stats is not None else rebuild_stats()
+
+
+def low_stock_products(low_stock: Dict[str, Dict[str, Any]]) -> list:
+    """Up to LOW_STOCK_LIMIT low-stock entries ordered for display (lowest quantity first)."""
+    return sorted(low_stock.values(), key=_low_stock_key)[:LOW_STOCK_LIMIT]
+
+
+def stats_doc(stats: InventoryStats) -> Dict[str, Any]:
+    return {
+        'total_products': stats.total_products,
+        'total_units': int(stats.total_units),
+        'stock_value': float(stats.stock_value),
+        'low_stock': stats.low_stock,
+        'updated_at': stats.updated_at.isoformat() if stats.updated_at else None,
+    }
+
+
+def _mirror(stats: InventoryStats) -> None:
+    enqueue(STATS_DOC_PATH, stats_doc(stats), merge=False)
@@ -1,3 +1,1248 @@
-from django.test import TestCase
+"""Query-count and latency budgets for the inventory views.
 
-# Create your tests here.
+Each test seeds a dataset at two or more sizes (catalog rows, cart lines,
+sales) and asserts that a view issues the same number of queries at every
+size, and no more than its budget. A count that grows with N is an N+1
+regression. Firestore code paths run against ``devtools.fake_firestore``
+so the suite works offline on SQLite.
+
+Wall-clock timings are collected per view and size. Set PERF_BASELINE to a
+file path to write them as JSON. Set PERF_BASELINE_COMPARE to an earlier
+baseline to fail when a view got more than PERF_BASELINE_TOLERANCE times
+slower (default 3; timings below 5 ms are ignored as noise).
+
+    PERF_BASELINE=perf.json python manage.py test inventory
+"""
+import contextlib
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from devtools import fake_firestore
+
+from . import async_views, backfill, events, firestore_repo, metrics, views
+from .backup import LocalStorage, restore_files, run_backup
+from .breaker import CLOSED, HALF_OPEN, OPEN, DeadlineExceeded
+from .catalog import export_rows, import_products
+from .firebase import firestore_breaker
+from .firestore_repo import (
+    adjust_sharded_stock, cache_stats, get_products, list_customers, list_products, reserve_and_decrement_stock,
+    shard_stock, stock_shard_counts, upsert_customer, upsert_product, write_sale_and_sync_products,
+)
+from .invoicing import COUNTER_NAME, next_invoice_sequence, reset_invoice_pool
+from .listings import LOW_STOCK_THRESHOLD, customer_page, product_page
+from .loadtest import ClientTransport, LoadTest, Worker, parse_mix
+from .models import (
+    Customer, DailyCustomerSales, DailyProductSales, FirestoreOutbox, InvoiceCounter, Product, Receipt, Sale,
+)
+from .outbox import _blocked_paths, enqueue_product, flush_all, flush_once, outbox_stats, requeue_dead
+from .receipts import receipt_etag
+from .reconcile import reconcile_collection
+from .reservations import firestore_coordinator, reserve_stock
+from .repositories import LatencyRepository, MemoryRepository, sale_transaction, set_repository
+from .rollups import rebuild_rollups
+from .sales import post_sale
+from .search import repair_search_triggers, search_product_ids
+from .stats import rebuild_stats
+
+TIMINGS: Dict[str, Dict[str, float]] = {}
+NOISE_FLOOR_MS = 5.0
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'perf-default'},
+    'firestore': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'perf-firestore'},
+}
+
+
+def tearDownModule():
+    path = os.environ.get('PERF_BASELINE')
+    if path and TIMINGS:
+        with open(path, 'w') as fh:
+            json.dump(TIMINGS, fh, indent=2, sort_keys=True)
+    compare = os.environ.get('PERF_BASELINE_COMPARE')
+    if compare and TIMINGS:
+        _compare_baseline(compare, float(os.environ.get('PERF_BASELINE_TOLERANCE', '3')))
+
+
+def _compare_baseline(path: str, tolerance: float) -> None:
+    with open(path) as fh:
+        baseline = json.load(fh)
+    slower = []
+    for view, sizes in TIMINGS.items():
+        for size, ms in sizes.items():
+            before = baseline.get(view, {}).get(size)
+            if before and ms > NOISE_FLOOR_MS and ms > before * tolerance:
+                slower.append(f'{view}[{size}]: {before:.1f} ms -> {ms:.1f} ms')
+    if slower:
+        raise AssertionError('Slower than baseline:\n' + '\n'.join(slower))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PerfTestCase(TestCase):
+    """Seeding helpers plus query-count assertions that also record timings."""
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        patcher = mock.patch.dict(os.environ, {
+            'FIREBASE_ENABLED': 'false',
+            'FIREBASE_SOR': 'false',
+            'FIREBASE_OUTBOX_THREAD': 'false',
+            'FIREBASE_EVENTS_SYNC': 'true',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # ---------- Seeding ----------
+    def seed_products(self, count: int, quantity: int = 50, low_stock: bool = True) -> List[Product]:
+        start = Product.objects.count()
+        products = Product.objects.bulk_create([
+            Product(
+                sku=f'SKU-{start + i:05d}',
+                name=f'Brake pad set {start + i}',
+                description='Front axle, ceramic compound',
+                cost_price=Decimal('10.00') + i % 7,
+                selling_price=Decimal('18.50') + i % 11,
+                # Every fifth product is low on stock so the dashboard lists some
+                quantity=3 if low_stock and i % 5 == 0 else quantity,
+            )
+            for i in range(count)
+        ])
+        rebuild_stats()
+        return list(Product.objects.filter(sku__in=[p.sku for p in products]).order_by('id'))
+
+    def seed_customers(self, count: int) -> List[Customer]:
+        start = Customer.objects.count()
+        Customer.objects.bulk_create([
+            Customer(name=f'Garage {start + i}', phone=f'555-{start + i:04d}', email=f'garage{start + i}@example.com')
+            for i in range(count)
+        ])
+        return list(Customer.objects.order_by('id')[start:])
+
+    def seed_sales(self, count: int, lines: int, products: List[Product],
+                   customers: List[Customer]) -> List[Sale]:
+        products = [p for p in products if p.quantity > LOW_STOCK_THRESHOLD]
+        sales = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                cart = [(products[(i + j) % len(products)].id, 1) for j in range(lines)]
+                sales.append(post_sale(Sale(customer=customers[i % len(customers)]), cart))
+        return sales
+
+    # ---------- Measuring ----------
+    def measure(self, fn) -> Tuple[int, float, object]:
+        """(query count, milliseconds, result) of fn(), running on_commit callbacks."""
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                started = time.perf_counter()
+                result = fn()
+                elapsed = (time.perf_counter() - started) * 1000
+        return len(queries), elapsed, result
+
+    def record(self, name: str, size, ms: float) -> None:
+        TIMINGS.setdefault(name, {})[str(size)] = round(ms, 3)
+
+    def assertConstantQueries(self, name: str, sizes: Iterable, setup, run, budget: int) -> Dict:
+        """Assert run(state) issues the same number of queries for every setup(size).
+
+        ``setup(size)`` grows the dataset to ``size`` and returns the state
+        ``run`` needs. The first run warms per-process caches and is not counted.
+        """
+        counts = {}
+        for size in sizes:
+            state = setup(size)
+            self.measure(lambda: run(state))
+            count, ms, _ = self.measure(lambda: run(state))
+            counts[size] = count
+            self.record(name, size, ms)
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'{name}: query count grows with N {counts}',
+        )
+        self.assertLessEqual(max(counts.values()), budget, f'{name}: over budget of {budget} queries {counts}')
+        return counts
+
+    def get(self, url: str, **extra):
+        response = self.client.get(url, secure=True, **extra)
+        self.assertIn(response.status_code, (200, 304), f'GET {url} -> {response.status_code}')
+        return response
+
+    def sale_post_data(self, customer: Customer, cart: List[Tuple[int, int]]) -> Dict:
+        data = {
+            'customer': customer.id,
+            'items-TOTAL_FORMS': len(cart),
+            'items-INITIAL_FORMS': 0,
+            'items-MIN_NUM_FORMS': 0,
+            'items-MAX_NUM_FORMS': 1000,
+        }
+        for i, (pid, qty) in enumerate(cart):
+            data[f'items-{i}-product'] = pid
+            data[f'items-{i}-quantity'] = qty
+        return data
+
+
+class ListViewQueryTests(PerfTestCase):
+
+    def test_dashboard(self):
+        customers = self.seed_customers(5)
+
+        def setup(size):
+            products = self.seed_products(size - Product.objects.count())
+            self.seed_sales(size // 10, 3, products, customers)
+
+        self.assertConstantQueries('dashboard', (20, 200), setup, lambda _: self.get(reverse('dashboard')), budget=6)
+
+    def test_product_list(self):
+        url = reverse('product_list')
+        self.assertConstantQueries(
+            'product_list', (30, 300), lambda size: self.seed_products(size - Product.objects.count()),
+            lambda _: self.get(url), budget=4,
+        )
+
+    def test_product_list_filtered(self):
+        url = reverse('product_list') + '?q=Brake&low_stock=1'
+
+        def run(_):
+            response = self.get(url)
+            self.assertTrue(response.context['products'].items, 'filtered listing rendered no rows')
+            return response
+
+        self.assertConstantQueries(
+            'product_list_filtered', (30, 300), lambda size: self.seed_products(size - Product.objects.count()),
+            run, budget=4,
+        )
+
+    def test_prefix_search_ignores_case(self):
+        self.seed_products(3)
+        self.seed_customers(2)
+        Product.objects.create(sku='abc-1', name='brake fluid', cost_price=Decimal('2.00'),
+                               selling_price=Decimal('4.00'), quantity=10)
+        self.assertEqual(len(product_page({'q': 'BRAKE'}).items), 4)
+        self.assertEqual([p.sku for p in product_page({'sku': 'ABC'}).items], ['abc-1'])
+        self.assertEqual(len(customer_page({'q': 'garage'}).items), 2)
+        # A prefix must match from the start, and LIKE wildcards are taken literally
+        self.assertEqual(product_page({'q': 'pad'}).items, [])
+        self.assertEqual(product_page({'q': '%'}).items, [])
+
+        repo = MemoryRepository.from_orm()
+        self.assertEqual(len(repo.product_page({'q': 'BRAKE'}).items), 4)
+        self.assertEqual(len(repo.customer_page({'q': 'garage'}).items), 2)
+
+    def test_customer_list(self):
+        url = reverse('customer_list')
+        self.assertConstantQueries(
+            'customer_list', (30, 300), lambda size: self.seed_customers(size - Customer.objects.count()),
+            lambda _: self.get(url), budget=4,
+        )
+
+    def test_sales_report(self):
+        customers = self.seed_customers(10)
+        products = self.seed_products(40)
+        url = reverse('sales_report')
+        self.assertConstantQueries(
+            'sales_report', (10, 100),
+            lambda size: self.seed_sales(size - Sale.objects.count(), 4, products, customers),
+            lambda _: self.get(url), budget=8,
+        )
+
+
+class RollupTests(PerfTestCase):
+    """Daily sales rollups kept by post_sale and recomputed by rebuild_rollups."""
+
+    def setUp(self):
+        super().setUp()
+        self.customers = self.seed_customers(2)
+        self.products = self.seed_products(5, low_stock=False)
+
+    def rollups(self):
+        products = DailyProductSales.objects.order_by('day', 'product').values_list(
+            'day', 'product', 'units', 'revenue', 'cost')
+        customers = DailyCustomerSales.objects.order_by('day', 'customer').values_list(
+            'day', 'customer', 'sales_count', 'units', 'revenue', 'cost')
+        return list(products), list(customers)
+
+    def test_posted_sales_add_up_after_commit(self):
+        product = self.products[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            post_sale(Sale(customer=self.customers[0]), [(product.id, 2)])
+            # Nothing is written while the sale transaction holds its product locks
+            self.assertFalse(DailyCustomerSales.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.seed_sales(3, 2, self.products, self.customers)
+
+        products, customers = self.rollups()
+        units = {row[1]: row[2] for row in products}
+        self.assertEqual(units[product.id], 2 + 1)  # seed_sales puts one of each product in a line
+        self.assertEqual(sum(units.values()), 2 + 3 * 2)
+        self.assertEqual({row[1]: row[2] for row in customers}, {self.customers[0].id: 3, self.customers[1].id: 1})
+        self.assertEqual(sum(row[4] for row in customers), sum(sale.total_amount for sale in Sale.objects.all()))
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        self.seed_sales(6, 3, self.products, self.customers)
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+
+class InvoiceNumberTests(PerfTestCase):
+    """Invoice numbers handed out from blocks reserved on the invoice counter."""
+
+    def setUp(self):
+        super().setUp()
+        reset_invoice_pool()
+        self.addCleanup(reset_invoice_pool)
+        patcher = mock.patch.dict(os.environ, {'INVOICE_BLOCK_SIZE': '5'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counter(self) -> int:
+        return InvoiceCounter.objects.get(name=COUNTER_NAME).value
+
+    def allocate(self) -> int:
+        with self.captureOnCommitCallbacks(execute=True):
+            return next_invoice_sequence()
+
+    def test_a_block_is_reserved_once_and_handed_out_locally(self):
+        start = InvoiceCounter.objects.filter(name=COUNTER_NAME).values_list('value', flat=True).first() or 0
+        with CaptureQueriesContext(connection) as queries:
+            numbers = [self.allocate() for _ in range(5)]
+        self.assertEqual(numbers, list(range(start + 1, start + 6)))
+        self.assertEqual(self.counter(), start + 5)
+        # Savepoint, bump, read back, release: only the first number touches the database
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(self.allocate(), start + 6)
+        self.assertEqual(self.counter(), start + 10)
+
+    def test_unused_numbers_are_released_on_commit_only(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            first = next_invoice_sequence()
+            # Until the counter bump commits, the rest of the block is not handed out
+            self.assertEqual(next_invoice_sequence(), first + 5)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.allocate(), first + 1)
+
+    def test_numbers_never_repeat(self):
+        customer = self.seed_customers(1)[0]
+        products = self.seed_products(3, quantity=100, low_stock=False)
+        numbers = [self.allocate() for _ in range(12)]
+        sales = self.seed_sales(8, 1, products, [customer])
+        numbers += [int(sale.invoice_number[11:]) for sale in sales]
+        self.assertEqual(len(numbers), len(set(numbers)))
+
+    def test_migration_seeds_the_counter_above_existing_sales(self):
+        customer = self.seed_customers(1)[0]
+        sales = self.seed_sales(3, 1, self.seed_products(3, low_stock=False), [customer])
+        InvoiceCounter.objects.all().delete()
+        migration = importlib.import_module('inventory.migrations.0002_invoicecounter')
+        migration.seed_invoice_sequence(django_apps, connection.schema_editor())
+        self.assertEqual(self.counter(), sales[-1].id)
+        reset_invoice_pool()  # as after the deploy that runs the migration
+        self.assertGreater(self.allocate(), sales[-1].id)
+
+
+class SaleViewQueryTests(PerfTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customers = self.seed_customers(3)
+
+    def test_sale_form_get(self):
+        url = reverse('create_sale')
+        self.assertConstantQueries(
+            'create_sale_get', (20, 200), lambda size: self.seed_products(size - Product.objects.count()),
+            lambda _: self.get(url), budget=6,
+        )
+
+    def test_create_sale_post_by_cart_size(self):
+        products = self.seed_products(40, quantity=1000, low_stock=False)
+        url = reverse('create_sale')
+
+        def run(size):
+            cart = [(p.id, 1) for p in products[:size]]
+            response = self.client.post(url, self.sale_post_data(self.customers[0], cart), secure=True)
+            self.assertEqual(response.status_code, 302, response.content[:500])
+            return response
+
+        # Includes the stats and rollup updates and stored receipt run after
+        # commit, and the savepoints TestCase turns every transaction into
+        self.assertConstantQueries('create_sale_post', (1, 5, 15), lambda size: size, run, budget=27)
+
+    def test_create_sale_post_by_catalog_size(self):
+        url = reverse('create_sale')
+
+        def setup(size):
+            products = self.seed_products(size - Product.objects.count(), quantity=1000, low_stock=False)
+            return [(p.id, 1) for p in Product.objects.order_by('id')[:3]] or [(products[0].id, 1)]
+
+        def run(cart):
+            response = self.client.post(url, self.sale_post_data(self.customers[0], cart), secure=True)
+            self.assertEqual(response.status_code, 302)
+
+        self.assertConstantQueries('create_sale_post_catalog', (20, 200), setup, run, budget=27)
+
+    def test_create_sale_rejects_oversell_without_writes(self):
+        product = self.seed_products(1, quantity=2, low_stock=False)[0]
+        data = self.sale_post_data(self.customers[0], [(product.id, 2), (product.id, 1)])
+        response = self.client.post(reverse('create_sale'), data, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'units available')
+        self.assertEqual(Sale.objects.count(), 0)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 2)
+
+    def test_post_sale_decrements_the_stored_quantity(self):
+        product = self.seed_products(1, quantity=5, low_stock=False)[0]
+        # Another worker sells 3 after this one loaded the product
+        post_sale(Sale(customer=self.customers[0]), [(product.id, 3)])
+        self.assertEqual(product.quantity, 5)
+        with self.assertRaisesMessage(ValueError, 'Only 2 units available'):
+            post_sale(Sale(customer=self.customers[1]), [(product.id, 3)])
+        self.assertEqual(Sale.objects.count(), 1)
+
+        sale = post_sale(Sale(customer=self.customers[1]), [(product.id, 1), (product.id, 1)])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(sale.total_amount, 2 * product.selling_price)
+        self.assertEqual(sorted(sale.items.values_list('quantity', flat=True)), [1, 1])
+
+    def test_receipt(self):
+        products = self.seed_products(30)
+
+        def setup(lines):
+            sale = self.seed_sales(1, lines, products, self.customers)[0]
+            return reverse('sale_receipt', args=[sale.pk])
+
+        counts = self.assertConstantQueries('sale_receipt_stored', (1, 10, 25), setup,
+                                            lambda url: self.get(url), budget=1)
+        self.assertEqual(set(counts.values()), {0}, 'stored receipts are served from cache')
+
+    def test_receipt_rendered_on_first_request(self):
+        products = self.seed_products(30)
+
+        def setup(lines):
+            sale = self.seed_sales(1, lines, products, self.customers)[0]
+            Receipt.objects.filter(sale=sale).delete()
+            caches['default'].clear()
+            return sale
+
+        def run(sale):
+            Receipt.objects.filter(sale=sale).delete()
+            caches['default'].clear()
+            response = self.get(reverse('sale_receipt', args=[sale.pk]), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertIn(b'Total', gzip.decompress(response.content))
+
+        # Receipt lookup, sale with customer, items with products, savepoint + insert
+        self.assertConstantQueries('sale_receipt_render', (1, 10, 25), setup, run, budget=8)
+
+    def test_receipt_revalidation_is_free(self):
+        products = self.seed_products(5)
+        sale = self.seed_sales(1, 3, products, self.customers)[0]
+        url = reverse('sale_receipt', args=[sale.pk])
+        count, ms, response = self.measure(lambda: self.get(url, HTTP_IF_NONE_MATCH=receipt_etag(sale.pk)))
+        self.record('sale_receipt_304', 1, ms)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(count, 0)
+
+
+class ApiQueryTests(PerfTestCase):
+
+    def test_products_batch(self):
+        url = reverse('api_products_batch')
+
+        def setup(size):
+            self.seed_products(size - Product.objects.count())
+            ids = Product.objects.order_by('id').values_list('id', flat=True)[:size]
+            return url + '?ids=' + ','.join(str(i) for i in ids)
+
+        self.assertConstantQueries('api_products_batch', (5, 50, 200), setup, lambda u: self.get(u), budget=1)
+
+    def test_catalog_snapshot(self):
+        url = reverse('api_catalog_snapshot')
+        self.assertConstantQueries(
+            'api_catalog', (20, 500), lambda size: self.seed_products(size - Product.objects.count()),
+            lambda _: self.get(url), budget=2,
+        )
+        etag = self.get(url)['ETag']
+        count, ms, response = self.measure(lambda: self.get(url, HTTP_IF_NONE_MATCH=etag))
+        self.record('api_catalog_304', 500, ms)
+        self.assertEqual(response.status_code, 304)
+        self.assertLessEqual(count, 1)
+
+    def test_product_search(self):
+        url = reverse('api_product_search') + '?q=brake pad'
+        self.assertConstantQueries(
+            'api_product_search', (20, 500), lambda size: self.seed_products(size - Product.objects.count()),
+            lambda _: self.get(url), budget=2,
+        )
+        self.assertTrue(self.get(url).json()['results'])
+
+    def test_search_triggers_are_restored_after_a_table_rebuild(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        self.assertFalse(repair_search_triggers())
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER inventory_product_fts_ai')  # as a rebuilt table would have lost it
+        product = self.seed_products(1)[0]
+        self.assertTrue(repair_search_triggers())
+        self.assertEqual(search_product_ids(product.sku), [product.id])
+
+
+class FirestoreQueryTests(PerfTestCase):
+    """Mirroring and system-of-record paths against the in-process fake Firestore."""
+
+    def setUp(self):
+        super().setUp()
+        self.customers = self.seed_customers(3)
+        self.products = self.seed_products(40, quantity=1000, low_stock=False)
+
+    def test_write_sale_and_sync_products(self):
+        with fake_firestore.install() as db:
+            def run(sale_id):
+                db.calls.clear()
+                # One query for the sale, two for its customer and items with products
+                write_sale_and_sync_products(Sale.objects.get(pk=sale_id))
+                self.assertEqual(db.calls, {'commit': 1})
+
+            self.assertConstantQueries(
+                'write_sale_and_sync_products', (1, 10, 25),
+                lambda lines: self.seed_sales(1, lines, self.products, self.customers)[0].pk,
+                run, budget=3,
+            )
+
+    def test_receipt_in_system_of_record_mode_is_stored(self):
+        sale = self.seed_sales(1, 3, self.products, self.customers)[0]
+        with fake_firestore.install(sor=True) as db:
+            write_sale_and_sync_products(sale)
+            Receipt.objects.all().delete()
+            caches['default'].clear()
+            db.calls.clear()
+            self.get(reverse('sale_receipt', args=[sale.pk]))
+            # Rendered from the database row, so it is stored instead of re-rendered every time
+            self.assertEqual(db.calls, {})
+            self.assertTrue(Receipt.objects.filter(sale=sale).exists())
+
+    def test_outbox_flush(self):
+        with fake_firestore.install() as db:
+            counts = {}
+            for sales in (2, 20):
+                flush_all()
+                self.seed_sales(sales, 3, self.products, self.customers)
+                db.calls.clear()
+                counts[sales], ms, written = self.measure(flush_once)
+                self.record('outbox_flush', sales, ms)
+                self.assertTrue(written)
+                self.assertEqual(db.calls, {'commit': 1})
+            self.assertEqual(len(set(counts.values())), 1, f'outbox flush grows with N {counts}')
+            # Claim: savepoint, select, blocked-path check, lease, release; then savepoint, delete, release
+            self.assertLessEqual(counts[2], 8)
+
+    def test_outbox_calls_firestore_with_no_transaction_open(self):
+        product = self.products[0]
+        seen = []
+        with fake_firestore.install() as db:
+            flush_all()
+            enqueue_product(product)
+            depth = len(connection.savepoint_ids)
+            tick = db._tick
+
+            def commit(name):
+                due = FirestoreOutbox.objects.filter(next_attempt_at__lte=timezone.now()).count()
+                seen.append((len(connection.savepoint_ids), due))
+                tick(name)
+
+            with mock.patch.object(db, '_tick', commit):
+                self.assertEqual(flush_once(), 1)
+        # The row was leased, so another flusher would not pick it up meanwhile
+        self.assertEqual(seen, [(depth, 0)])
+        self.assertFalse(FirestoreOutbox.objects.exists())
+
+    def test_outbox_waits_for_writes_held_by_another_flusher(self):
+        first, second = self.products[0], self.products[1]
+        with fake_firestore.install():
+            flush_all()
+            for product in (first, first, second, first):
+                enqueue_product(product)
+            r1, r2, r3, r4 = FirestoreOutbox.objects.order_by('id')
+            # Rows another worker leased (or that back off) are missing from this fetch
+            self.assertEqual(_blocked_paths([r2, r3, r4]), {r1.path})
+            self.assertEqual(_blocked_paths([r1, r3, r4]), {r1.path})
+            self.assertEqual(_blocked_paths([r1, r2, r3]), set())
+            FirestoreOutbox.objects.filter(id=r1.id).update(dead=True)  # parked rows do not block
+            self.assertEqual(_blocked_paths([r2, r3, r4]), set())
+
+    def test_outbox_parks_a_rejected_document(self):
+        bad, good = self.products[0], self.products[1]
+        with fake_firestore.install() as db, mock.patch.dict(os.environ, {'FIREBASE_OUTBOX_MAX_ATTEMPTS': '2'}):
+            flush_all()
+            db.reject[f'products/{bad.id}'] = ValueError('invalid document')
+            enqueue_product(bad)
+            enqueue_product(good)
+            self.assertEqual(flush_once(), 1)  # the batch failed, then each document alone
+            self.assertIn(f'products/{good.id}', db._docs)
+            self.assertEqual(FirestoreOutbox.objects.get().attempts, 1)
+
+            FirestoreOutbox.objects.update(next_attempt_at=timezone.now())
+            with self.assertRaises(ValueError), self.assertLogs('inventory.outbox', 'ERROR'):
+                flush_once()
+            self.assertEqual((outbox_stats()['dead'], flush_all()), (1, 0))
+
+            # Parked rows neither block other documents nor get retried on their own
+            enqueue_product(good)
+            self.assertEqual(flush_all(), 1)
+            self.assertEqual(requeue_dead(), 1)
+            del db.reject[f'products/{bad.id}']
+            self.assertEqual(flush_all(), 1)
+            self.assertFalse(FirestoreOutbox.objects.exists())
+            self.assertEqual(db._docs[f'products/{bad.id}']['quantity'], bad.quantity)
+
+    def test_create_sale_system_of_record(self):
+        url = reverse('create_sale')
+        with fake_firestore.install(sor=True):
+            for product in self.products:
+                upsert_product(product)
+
+            def run(size):
+                cart = [(p.id, 1) for p in self.products[:size]]
+                response = self.client.post(url, self.sale_post_data(self.customers[0], cart), secure=True)
+                self.assertEqual(response.status_code, 302)
+
+            self.assertConstantQueries('create_sale_post_sor', (1, 5, 15), lambda size: size, run, budget=29)
+
+    def test_stock_reservation_reads(self):
+        with fake_firestore.install(sor=True) as db:
+            for product in self.products:
+                upsert_product(product)
+            reads = {}
+            for size in (1, 15):
+                db.calls.clear()
+                reserve_and_decrement_stock({p.id: 1 for p in self.products[:size]})
+                reads[size] = db.calls.get('get', 0) + db.calls.get('get_all', 0)
+            self.assertEqual(reads[1], reads[15], f'Firestore reads grow with cart size {reads}')
+
+    def test_listings_are_cached_until_a_write(self):
+        product, customer = self.products[0], self.customers[0]
+        with fake_firestore.install(sor=True) as db:
+            upsert_product(product)
+            upsert_customer(customer)
+            db.calls.clear()
+            before = cache_stats()
+            self.assertEqual(list_products(), list_products())
+            self.assertEqual(list_customers(), list_customers())
+            self.assertEqual(db.calls, {'query': 2})
+            after = cache_stats()
+            self.assertEqual(after['hits'] - before['hits'], 2)
+            self.assertEqual(after['misses'] - before['misses'], 2)
+
+            # Each write makes the next listing read Firestore again
+            reserve_and_decrement_stock({product.id: 4})
+            customer.name = 'Renamed garage'
+            upsert_customer(customer)
+            db.calls.clear()
+            self.assertEqual(list_products()[0]['quantity'], product.quantity - 4)
+            self.assertEqual(list_customers()[0]['name'], 'Renamed garage')
+            self.assertEqual(db.calls, {'query': 2})
+
+    def test_backfill_resumes_after_the_last_committed_batch(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'checkpoint.json')
+        options = {'checkpoint': path, 'batch_size': 10, 'workers': 1, 'stdout': io.StringIO()}
+        with fake_firestore.install() as db, mock.patch.object(backfill, 'RETRIES', 0):
+            db.reject[f'products/{self.products[24].id}'] = RuntimeError('unavailable')
+            with self.assertRaisesMessage(CommandError, f'failed after id {self.products[19].id}'):
+                call_command('backfill_firestore', **options)
+            with open(path) as fh:
+                self.assertEqual(json.load(fh), {'products': self.products[19].id})
+
+            db.reject.clear()
+            db.calls.clear()
+            call_command('backfill_firestore', resume=True, **options)
+            # Two product batches past the checkpoint, one of customers
+            self.assertEqual(db.calls, {'commit': 3})
+            self.assertEqual(sum(p.startswith('products/') for p in db._docs), len(self.products))
+            self.assertFalse(os.path.exists(path))
+
+    def test_dashboard_system_of_record(self):
+        with fake_firestore.install(sor=True):
+            flush_all()
+            self.assertConstantQueries(
+                'dashboard_sor', (40, 200),
+                lambda size: self.seed_products(size - Product.objects.count()),
+                lambda _: self.get(reverse('dashboard')), budget=3,
+            )
+
+
+class FirestoreEventTests(PerfTestCase):
+    """Event documents buffered per transaction and sent after it commits."""
+
+    def written(self, db):
+        return sorted(doc['n'] for path, doc in db._docs.items() if path.startswith('events/'))
+
+    def test_one_transaction_sends_one_batch(self):
+        with fake_firestore.install() as db:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for n in range(3):
+                        events.emit('events', {'n': n})
+                    self.assertEqual(db.calls, {})
+            self.assertEqual(db.calls, {'commit': 1})
+            self.assertEqual(self.written(db), [0, 1, 2])
+
+    def test_a_rolled_back_transaction_drops_its_events(self):
+        with fake_firestore.install() as db:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ValueError), transaction.atomic():
+                    events.emit('events', {'n': 0})
+                    raise ValueError('rolled back')
+                with transaction.atomic():
+                    events.emit('events', {'n': 1})
+                    with self.assertRaises(ValueError), transaction.atomic():
+                        events.emit('events', {'n': 2})
+                        raise ValueError('savepoint rolled back')
+            self.assertEqual(self.written(db), [1])
+
+
+class RepositoryQueryTests(PerfTestCase):
+    """Views served by the in-memory repository, optionally behind injected latency."""
+
+    def setUp(self):
+        super().setUp()
+        self.customers = self.seed_customers(3)
+        self.addCleanup(set_repository, None)
+
+    def test_memory_listings_skip_the_database(self):
+        def setup(size):
+            self.seed_products(size - Product.objects.count())
+            set_repository(MemoryRepository.from_orm())
+
+        for name, url in (('product_list_memory', reverse('product_list')),
+                          ('dashboard_memory', reverse('dashboard'))):
+            self.assertConstantQueries(name, (20, 200), setup, lambda _: self.get(url), budget=0)
+
+    def test_memory_reservation_rejects_oversell(self):
+        product = self.seed_products(1, quantity=2, low_stock=False)[0]
+        repo = MemoryRepository.from_orm()
+        set_repository(LatencyRepository(repo, delay_ms=1))
+        # The form checks the database; the repository's own count is the one that must hold
+        Product.objects.filter(pk=product.pk).update(quantity=10)
+        data = self.sale_post_data(self.customers[0], [(product.id, 2), (product.id, 1)])
+        response = self.client.post(reverse('create_sale'), data, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(repo.products[product.id].quantity, 2)
+
+        response = self.client.post(reverse('create_sale'), self.sale_post_data(self.customers[0], [(product.id, 2)]),
+                                    secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(repo.products[product.id].quantity, 0)
+        self.assertEqual(repo.get_sale(Sale.objects.get().pk).total_amount, Sale.objects.get().total_amount)
+
+    def test_memory_reservation_is_given_back_when_the_sale_is_not_saved(self):
+        product = self.seed_products(1, quantity=5, low_stock=False)[0]
+        repo = MemoryRepository.from_orm()
+        set_repository(repo)
+        data = self.sale_post_data(self.customers[0], [(product.id, 2)])
+        with mock.patch.object(views, 'post_sale', side_effect=ValueError('rejected')):
+            response = self.client.post(reverse('create_sale'), data, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(repo.products[product.id].quantity, 5)
+
+        with sale_transaction(repo, {product.id: 2}, repo.reserve_stock({product.id: 2})):
+            transaction.set_rollback(True)
+        self.assertEqual(repo.products[product.id].quantity, 5)
+
+
+class MetricsTests(PerfTestCase):
+    """Per-request instrumentation and the Prometheus endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.seed_products(10)
+        patcher = mock.patch.dict(os.environ, {'METRICS_TOKEN': 'metrics-token', 'METRICS_SLOW_REQUEST_MS': '0'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_metrics_endpoint(self):
+        self.get(reverse('product_list'))
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, secure=True).status_code, 403)
+        body = self.get(url, HTTP_AUTHORIZATION='Bearer metrics-token').content.decode()
+        self.assertIn('inventory_requests_total{view="product_list",method="GET",status="200"} 1', body)
+        self.assertIn('inventory_request_operations_total{view="product_list",kind="db"}', body)
+        self.assertIn('inventory_request_operation_seconds_total{view="product_list",kind="template"}', body)
+        self.assertIn('inventory_request_duration_seconds_bucket{view="product_list",le="+Inf"} 1', body)
+
+    def test_slow_request_breakdown(self):
+        with mock.patch.dict(os.environ, {'METRICS_SLOW_REQUEST_MS': '0.001', 'METRICS_SERVER_TIMING': 'true'}):
+            with self.assertLogs('inventory.metrics', 'WARNING') as logs:
+                response = self.get(reverse('dashboard'))
+        self.assertIn('(dashboard) 200', logs.output[0])
+        self.assertIn('db.select', logs.output[0])
+        self.assertIn('template.inventory/dashboard.html', logs.output[0])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+class FirestoreBreakerTests(PerfTestCase):
+    """System-of-record mode against a failing or slow Firestore."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(os.environ, {
+            'FIRESTORE_BREAKER_FAILURES': '2',
+            'FIRESTORE_BREAKER_RESET_SECONDS': '30',
+            'FIRESTORE_DEADLINE_SECONDS': '0.05',
+            'FIREBASE_STATUS_TOKEN': 'status-token',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.customers = self.seed_customers(1)
+        self.products = self.seed_products(5, quantity=10, low_stock=False)
+
+    def install(self):
+        db = self.enterContext(fake_firestore.install(sor=True))
+        for product in self.products:
+            upsert_product(product)
+        return db
+
+    def test_open_circuit_fails_fast_and_falls_back(self):
+        db = self.install()
+        db.fail = RuntimeError('backend unavailable')
+        with self.assertLogs('inventory.breaker', 'WARNING'):
+            for _ in range(2):
+                self.get(reverse('product_list'))
+        self.assertEqual(firestore_breaker().state, OPEN)
+
+        db.calls.clear()
+        self.get(reverse('product_list'))
+        product = self.products[0]
+        response = self.client.post(reverse('create_sale'), self.sale_post_data(self.customers[0], [(product.id, 3)]),
+                                    secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(db.calls, {}, 'an open circuit must not call Firestore')
+        # Stock was checked and decremented in the database instead
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 7)
+
+    def test_half_open_probe_closes_the_circuit(self):
+        db = self.install()
+        breaker = firestore_breaker()
+        now = [1000.0]
+        breaker.clock = lambda: now[0]
+        db.fail = RuntimeError('backend unavailable')
+        with self.assertLogs('inventory.breaker', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    get_products([self.products[0].id])
+        self.assertEqual(breaker.state, OPEN)
+
+        now[0] += 31
+        self.assertEqual(breaker.state, HALF_OPEN)
+        db.fail = None
+        self.assertEqual(set(get_products([self.products[0].id])), {self.products[0].id})
+        status = self.get(reverse('firebase_status') + '?token=status-token').json()['breaker']
+        self.assertEqual(status['state'], CLOSED)
+        self.assertEqual([t['to'] for t in status['transitions']], [OPEN, HALF_OPEN, CLOSED])
+
+    def test_slow_reads_hit_the_deadline(self):
+        db = self.install()
+        db.delay = 0.3
+        started = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            get_products([self.products[0].id])
+        self.assertLess(time.perf_counter() - started, 0.25)
+
+    def test_reads_carry_the_deadline_as_their_timeout(self):
+        db = self.install()
+        with mock.patch.object(db, 'get_all', wraps=db.get_all) as get_all:
+            get_products([self.products[0].id])
+        self.assertEqual(get_all.call_args.kwargs['timeout'], 0.05)
+
+
+class StockReservationTests(PerfTestCase):
+    """Group-committed Firestore reservations and sharded stock counters."""
+
+    def setUp(self):
+        super().setUp()
+        self.products = self.seed_products(3, quantity=5, low_stock=False)
+        self.db = self.enterContext(fake_firestore.install(sor=True))
+        for product in self.products:
+            upsert_product(product)
+
+    def quantity(self, path):
+        return self.db._docs[path]['quantity']
+
+    def test_concurrent_carts_share_transactions(self):
+        hot = self.products[0].id
+        self.db.delay = 0.01
+        outcomes = []
+
+        def checkout():
+            try:
+                outcomes.append(reserve_stock({hot: 1}))
+            except ValueError as exc:
+                outcomes.append(exc)
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(isinstance(o, dict) for o in outcomes), 5)
+        self.assertEqual(sum(isinstance(o, ValueError) for o in outcomes), 3)
+        self.assertEqual(self.quantity(f'products/{hot}'), 0)
+        counts = firestore_coordinator().counts
+        self.assertEqual(counts['requests'], 8)
+        self.assertLess(counts['batches'], 8, 'concurrent carts should commit together')
+        self.assertEqual(self.db.calls['commit'], counts['batches'])
+        self.assertIn(f"inventory_reservation_batches_total {counts['batches']}", metrics.render_prometheus())
+
+    def test_a_short_cart_fails_alone(self):
+        first, second = self.products[0].id, self.products[1].id
+        results = firestore_coordinator().commit([{first: 2}, {first: 2, second: 9}, {first: 3}])
+        self.assertEqual(results[0], {first: 3})
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], {first: 0})
+        self.assertEqual((self.quantity(f'products/{first}'), self.quantity(f'products/{second}')), (0, 5))
+
+    def test_oversized_cart_is_chunked_and_rolled_back(self):
+        self.enterContext(mock.patch.object(firestore_repo, 'MAX_TRANSACTION_WRITES', 2))
+        metrics.reset()
+        first, second, third = (p.id for p in self.products)
+        self.db.calls.clear()
+        self.assertEqual(reserve_stock({first: 1, second: 1, third: 1}), {first: 4, second: 4, third: 4})
+        self.assertEqual(self.db.calls['commit'], 2)
+
+        with self.assertRaises(ValueError):
+            reserve_stock({first: 2, second: 2, third: 5})
+        # The first chunk committed and was put back
+        self.assertEqual([self.quantity(f'products/{pid}') for pid in (first, second, third)], [4, 4, 4])
+        exposition = metrics.render_prometheus()
+        self.assertIn('inventory_reservation_chunked_total 2', exposition)
+        self.assertIn('inventory_reservation_rollbacks_total{result="ok"} 1', exposition)
+        self.assertIn('inventory_reservation_duration_seconds_count{outcome="insufficient"} 1', exposition)
+
+    def test_sharded_stock(self):
+        pid = self.products[0].id
+        self.assertEqual(shard_stock(pid, 4), 5)
+        shards = [f'products/{pid}/stock_shards/{n}' for n in range(4)]
+        self.assertEqual([self.quantity(path) for path in shards], [2, 1, 1, 1])
+
+        # One unit only needs the shard read with the product documents; four units need more
+        self.db.calls.clear()
+        reserve_and_decrement_stock({pid: 1})
+        self.assertEqual((self.db.calls.get('get', 0), self.db.calls['commit']), (0, 1))
+        reserve_and_decrement_stock({pid: 3})
+        with self.assertRaises(ValueError):
+            reserve_and_decrement_stock({pid: 2})
+        self.assertEqual(sum(self.quantity(path) for path in shards), 1)
+
+        self.assertTrue(adjust_sharded_stock(pid, 6))
+        self.assertFalse(adjust_sharded_stock(self.products[1].id, 6))
+        self.assertEqual(shard_stock(pid, 4), 7)
+        # A restock the shards missed, mirrored from the database
+        self.products[0].quantity = 9
+        upsert_product(self.products[0])
+        self.assertEqual(shard_stock(pid, 2, reset=True), 9)
+        self.assertEqual(shard_stock(pid, 0), 9)
+        self.assertEqual(self.quantity(f'products/{pid}'), 9)
+        self.assertFalse(any(path in self.db._docs for path in shards))
+
+
+    def test_reservation_follows_a_reshard_made_elsewhere(self):
+        pid = self.products[0].id
+        product, shards = f'products/{pid}', [f'products/{pid}/stock_shards/{n}' for n in range(2)]
+        self.assertEqual(stock_shard_counts(), {})
+        # Another instance shards the product; this one's cached counts do not know
+        self.db._docs.update({shards[0]: {'quantity': 3}, shards[1]: {'quantity': 2}})
+        self.db._docs[product]['stock_shards'] = 2
+        self.assertEqual(stock_shard_counts(), {})
+        reserve_and_decrement_stock({pid: 4})
+        self.assertEqual((self.quantity(product), sum(self.quantity(path) for path in shards)), (5, 1))
+        self.assertEqual(stock_shard_counts(), {pid: 2})
+
+        # ... and merges it back
+        for path in shards:
+            del self.db._docs[path]
+        self.db._docs[product].update(stock_shards=0, quantity=1)
+        reserve_and_decrement_stock({pid: 1})
+        self.assertEqual(self.quantity(product), 0)
+        self.assertFalse(adjust_sharded_stock(pid, 3))
+
+    def test_a_failed_checkout_gives_its_reservation_back(self):
+        first, second = self.products[0].id, self.products[1].id
+        shard_stock(second, 2)
+        shards = [f'products/{second}/stock_shards/{n}' for n in range(2)]
+        data = self.sale_post_data(self.seed_customers(1)[0], [(first, 2), (second, 3)])
+        for error in (ValueError('rejected'), DatabaseError('commit failed')):
+            with mock.patch.object(views, 'post_sale', side_effect=error):
+                try:
+                    response = self.client.post(reverse('create_sale'), data, secure=True)
+                except DatabaseError:
+                    pass
+                else:
+                    self.assertEqual(response.status_code, 302)
+            self.assertEqual(self.quantity(f'products/{first}'), 5)
+            self.assertEqual(sum(self.quantity(path) for path in shards), 5)
+        self.assertFalse(Sale.objects.exists())
+
+
+class ReconcileTests(PerfTestCase):
+    """Range-checksum reconciliation of Firestore with the database."""
+
+    def setUp(self):
+        super().setUp()
+        self.products = self.seed_products(300)
+        self.db = self.enterContext(fake_firestore.install(sor=True))
+
+    def reconcile(self, repair=False):
+        return reconcile_collection(self.db, 'products', ranges=8, fanout=4, leaf=16, repair=repair).as_dict()
+
+    def test_drift_is_found_by_range_and_repaired(self):
+        first = self.reconcile(repair=True)
+        self.assertEqual((first['drift']['missing'], first['repaired']), (300, 300))
+        clean = self.reconcile()
+        self.assertEqual((clean['documents_read'], clean['ranges_differing']), (0, 0))
+
+        docs = self.db._docs
+        stocked, renamed, unsigned = self.products[10], self.products[150], self.products[290]
+        docs[f'products/{stocked.id}']['quantity'] -= 2  # reserved in Firestore, ORM write lost
+        Product.objects.filter(id=renamed.id).update(name='Renamed, mirror lost')
+        del docs[f'products/{unsigned.id}']['checksum']
+        del docs[f'products/{self.products[200].id}']
+        docs['products/99999'] = {'id': 99999, 'name': 'Ghost', 'quantity': 1}
+
+        self.db.calls.clear()
+        report = self.reconcile(repair=True)
+        self.assertEqual(report['drift'], {'missing': 1, 'extra': 1, 'changed': 2, 'unsigned': 1, 'pending': 0})
+        self.assertLess(report['read_fraction'], 0.25, report)
+        self.assertEqual(self.db.calls['commit'], 1)
+        self.assertNotIn('products/99999', docs)
+        self.assertEqual(docs[f'products/{stocked.id}']['quantity'], stocked.quantity)
+        self.assertEqual(docs[f'products/{renamed.id}']['name'], 'Renamed, mirror lost')
+        self.assertEqual(self.reconcile()['ranges_differing'], 0)
+
+    def test_pending_outbox_writes_are_left_alone(self):
+        self.reconcile(repair=True)
+        product = self.products[0]
+        product.quantity -= 1
+        product.save()
+        with mock.patch.dict(os.environ, {'FIREBASE_ENABLED': 'true'}):
+            from .outbox import enqueue_product
+            enqueue_product(product)
+        report = self.reconcile(repair=True)
+        self.assertEqual((report['drift']['pending'], report['repaired']), (1, 0))
+
+
+class CatalogImportTests(PerfTestCase):
+
+    def test_repeated_sku_in_a_chunk_is_reported_as_skipped(self):
+        lines = [
+            'sku,name,cost_price,selling_price,quantity\n',
+            'DUP-1,First,1.00,2.00,5\n',
+            'ONE-1,Other,1.00,2.00,5\n',
+            'DUP-1,Second,1.00,2.00,7\n',
+        ]
+        result = import_products(lines)
+        self.assertEqual((result.created, result.skipped, result.failed, result.processed), (2, 1, 0, 3))
+        self.assertEqual(result.errors, [(2, 'Skipped: SKU DUP-1 appears again on line 4')])
+        self.assertEqual(Product.objects.get(sku='DUP-1').quantity, 7)
+
+    def test_updating_existing_skus_keeps_the_mirrored_created_at(self):
+        product = self.seed_products(1)[0]
+        Product.objects.filter(id=product.id).update(created_at=timezone.now() - timedelta(days=30))
+        product.refresh_from_db()
+        with fake_firestore.install():
+            result = import_products(['sku,name,cost_price,selling_price,quantity\n',
+                                      f'{product.sku},Renamed,1.00,2.00,9\n'])
+            self.assertEqual(result.updated, 1)
+            doc = FirestoreOutbox.objects.filter(path=f'products/{product.id}').latest('id').data
+        self.assertEqual(doc['created_at'], product.created_at.isoformat())
+        self.assertEqual(doc['name'], 'Renamed')
+        self.assertEqual(Product.objects.get(id=product.id).created_at, product.created_at)
+
+    def test_export_round_trips_through_import(self):
+        products = self.seed_products(3)
+        rows = list(csv.DictReader(export_rows()))
+        self.assertEqual([row['sku'] for row in rows], [p.sku for p in products])
+        self.assertEqual(rows[0]['selling_price'], str(products[0].selling_price))
+        self.assertEqual(int(rows[0]['quantity']), products[0].quantity)
+
+        result = import_products(export_rows())
+        self.assertEqual((result.created, result.updated, result.failed), (0, 3, 0))
+
+
+class BackupTests(PerfTestCase):
+    """Streaming jsonl.gz backups: full, then incremental from the manifest's watermarks."""
+
+    def setUp(self):
+        super().setUp()
+        self.products = self.seed_products(120)
+        self.storage = LocalStorage(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def backup(self, full=False):
+        return run_backup(self.storage, full=full, chunk_rows=50, workers=2, overlap=timedelta(0))
+
+    def first_product_chunk(self, manifest) -> str:
+        return manifest['models']['inventory.product']['chunks'][0]['name']
+
+    def test_incremental_backup_holds_only_changed_rows(self):
+        full = self.backup(full=True)
+        products = full['models']['inventory.product']
+        self.assertEqual((full['kind'], products['rows'], len(products['chunks'])), ('full', 120, 3))
+        self.assertNotIn('contenttypes.contenttype', full['models'])
+
+        edited = self.products[7]
+        edited.quantity += 5
+        edited.save()
+        time.sleep(0.01)
+        incremental = self.backup()
+        self.assertEqual((incremental['kind'], incremental['base']), ('incremental', full['id']))
+        self.assertEqual(incremental['models']['inventory.product']['rows'], 1)
+        self.assertEqual(incremental['chain'], [f"{full['id']}/manifest.json", f"{incremental['id']}/manifest.json"])
+        files = restore_files(self.storage)
+        self.assertEqual(len(files), len(set(files)))
+        self.assertLess(files.index(products['chunks'][-1]['name']),
+                        files.index(self.first_product_chunk(incremental)))
+
+        path = os.path.join(self.storage.root, self.first_product_chunk(incremental))
+        with gzip.open(path, 'rt') as fh:
+            self.assertEqual(json.loads(fh.readline())['pk'], edited.id)
+        Product.objects.filter(id=edited.id).update(quantity=0)
+        call_command('loaddata', path, verbosity=0)
+        self.assertEqual(Product.objects.get(id=edited.id).quantity, edited.quantity)
+
+    def test_rebuilt_rollups_restore_from_the_last_backup_only(self):
+        self.seed_sales(3, 2, self.products, self.seed_customers(2))
+        full = self.backup(full=True)
+        rebuild_rollups()  # same totals under new primary keys
+        incremental = self.backup()
+        files = restore_files(self.storage)
+        for label in ('inventory.dailyproductsales', 'inventory.dailycustomersales'):
+            self.assertIsNone(incremental['models'][label]['watermark_field'])
+            self.assertTrue(set(c['name'] for c in full['models'][label]['chunks']).isdisjoint(files))
+
+        expected = list(DailyProductSales.objects.order_by('day', 'product').values_list('product', 'units'))
+        DailyProductSales.objects.all().delete()
+        DailyCustomerSales.objects.all().delete()
+        call_command('loaddata', *(os.path.join(self.storage.root, name) for name in files), verbosity=0)
+        self.assertEqual(list(DailyProductSales.objects.order_by('day', 'product').values_list('product', 'units')),
+                         expected)
+
+    def test_chunks_are_uploaded_after_the_read_transaction(self):
+        steps = []
+        atomic, put = transaction.atomic, self.storage.put
+
+        @contextlib.contextmanager
+        def tracked_atomic(*args, **kwargs):
+            with atomic(*args, **kwargs):
+                yield
+            steps.append('commit')
+
+        def tracked_put(name, path):
+            steps.append('put')
+            return put(name, path)
+
+        with mock.patch.object(transaction, 'atomic', tracked_atomic), \
+                mock.patch.object(self.storage, 'put', tracked_put):
+            self.backup(full=True)
+        self.assertEqual(steps[0], 'commit')
+        self.assertEqual(steps.count('commit'), 1)
+
+
+class LoadTestHarnessTests(PerfTestCase):
+    """The load-test flows and stock check, driven on the test thread."""
+
+    def setUp(self):
+        super().setUp()
+        self.products = self.seed_products(3, quantity=2, low_stock=False)
+        self.customers = self.seed_customers(1)
+        self.runner = LoadTest(ClientTransport, parse_mix('checkout=1'), concurrency=1, requests=5, lines=1)
+        self.runner.prepare()
+        # Worker threads would use their own connections, which cannot see this test's rows
+        self.worker = Worker(0, self.runner)
+        self.transport = ClientTransport()
+
+    def test_flows_report_sales_and_rejections(self):
+        outcomes = [self.worker.checkout(self.transport) for _ in range(8)]
+        self.assertIn('ok', outcomes)
+        self.assertIn('rejected', outcomes, 'six units in stock cannot fill eight carts')
+        self.assertEqual(len(self.runner.results.sale_ids), outcomes.count('ok'))
+        for flow in ('browse', 'price', 'receipt'):
+            self.assertEqual(getattr(self.worker, flow)(self.transport), 'ok')
+
+        stock = self.runner.verify_stock()
+        self.assertEqual(stock['sales'], outcomes.count('ok'))
+        self.assertEqual((stock['oversold_products'], stock['mismatched_products']), (0, 0))
+        self.assertEqual([self.runner.take_ticket() for _ in range(6)], [True] * 5 + [False])
+
+    def test_stock_check_finds_oversells(self):
+        product = self.products[0]
+        post_sale(Sale(customer=self.customers[0]), [(product.id, 3)], check_stock=False)
+        stock = self.runner.verify_stock({product.id: 2})
+        self.assertEqual((stock['oversold_products'], stock['oversold_units']), (1, 1))
+        self.assertEqual(stock['remote_mismatched_products'], 1)
+        with self.assertRaisesMessage(ValueError, 'Unknown flow'):
+            parse_mix('browse=1,refund=1')
+
+
+class AsyncViewTests(PerfTestCase):
+    """ASYNC_VIEWS versions of the read views, called directly."""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(set_repository, None)
+        self.customers = self.seed_customers(2)
+        self.products = self.seed_products(20)
+        self.sale = self.seed_sales(1, 3, self.products, self.customers)[0]
+
+    async def test_async_views_serve_the_same_data(self):
+        factory = AsyncRequestFactory()
+        for view, args, text in (
+            (async_views.dashboard, (), self.sale.invoice_number),
+            (async_views.product_list, (), self.products[0].name),
+            (async_views.customer_list, (), self.customers[0].name),
+            (async_views.sale_receipt, (self.sale.pk,), self.sale.invoice_number),
+        ):
+            response = await view(factory.get('/'), *args)
+            self.assertEqual(response.status_code, 200, view.__name__)
+            self.assertIn(text, response.content.decode(), view.__name__)
+
+        product = self.products[0]
+        price = json.loads((await async_views.get_product_price(factory.get('/'), product.id)).content)
+        self.assertEqual(price['available_qty'], product.quantity)
+        batch = json.loads((await async_views.get_products_batch(factory.get('/', {'ids': f'{product.id},0'}))).content)
+        self.assertEqual(batch['missing'], [0])
+        snapshot = await async_views.catalog_snapshot(factory.get('/'))
+        self.assertEqual(len(json.loads(snapshot.content)['products']), 20)
+        revalidated = await async_views.catalog_snapshot(factory.get('/', headers={'If-None-Match': snapshot['ETag']}))
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_dashboard_reads_run_concurrently(self):
+        set_repository(LatencyRepository(MemoryRepository.from_orm(), delay_ms=200))
+        sync_ms = self.measure(lambda: views.dashboard(RequestFactory().get('/')))[1]
+        async_ms = self.measure(lambda: async_to_sync(async_views.dashboard)(AsyncRequestFactory().get('/')))[1]
+        self.record('dashboard_sync_200ms_backend', 1, sync_ms)
+        self.record('dashboard_async_200ms_backend', 1, async_ms)
+        self.assertGreaterEqual(sync_ms, 400)
+        self.assertLess(async_ms, 350, 'summary and recent sales should be read concurrently')
@@ -1,18 +1,33 @@
+from django.conf import settings
 from django.urls import path
 from . import views, api
 
+if settings.ASYNC_VIEWS:
+    # Read-heavy pages and the product API as async views (ASGI deployments)
+    from . import async_views
+    read_views = read_api = async_views
+else:
+    read_views, read_api = views, api
+
 urlpatterns = [
-    path('', views.dashboard, name='dashboard'),
+    path('', read_views.dashboard, name='dashboard'),
     path('health/db/', views.db_status, name='db_status'),
     path('health/firebase/', views.firebase_status, name='firebase_status'),
-    path('products/', views.product_list, name='product_list'),
+    path('health/metrics/', views.metrics, name='metrics'),
+    path('products/', read_views.product_list, name='product_list'),
     path('products/create/', views.product_create, name='product_create'),
     path('products/<int:pk>/edit/', views.product_edit, name='product_edit'),
-    path('customers/', views.customer_list, name='customer_list'),
+    path('products/import/', views.product_import, name='product_import'),
+    path('products/export/', views.product_export, name='product_export'),
+    path('customers/', read_views.customer_list, name='customer_list'),
     path('customers/create/', views.customer_create, name='customer_create'),
     path('sales/create/', views.create_sale, name='create_sale'),
-    path('sales/<int:pk>/receipt/', views.sale_receipt, name='sale_receipt'),
+    path('sales/<int:pk>/receipt/', read_views.sale_receipt, name='sale_receipt'),
+    path('reports/', views.sales_report, name='sales_report'),
     
     # API endpoints
-    path('api/products/<int:product_id>/', api.get_product_price, name='api_product_price'),
+    path('api/products/<int:product_id>/', read_api.get_product_price, name='api_product_price'),
+    path('api/products/batch/', read_api.get_products_batch, name='api_products_batch'),
+    path('api/products/search/', api.product_search, name='api_product_search'),
+    path('api/catalog/', read_api.catalog_snapshot, name='api_catalog_snapshot'),
 ]
\ No newline at end of file
@@ -1,37 +1,56 @@
+import gzip
+from datetime import date
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 from django.db import transaction
 from .models import Product, Customer, Sale, SaleItem
-from .forms import ProductForm, CustomerForm, SaleForm, SaleItemFormSet
-from .firestore_repo import (
-    upsert_product, upsert_customer, write_sale_and_sync_products,
-    get_sale_for_receipt, list_products, list_customers,
-    reserve_and_decrement_stock, list_recent_sales
-)
-from .firebase import firebase_sor_enabled
+from .forms import CatalogImportForm, ProductForm, CustomerForm, SaleForm, SaleItemFormSet
+from .catalog import decode_lines, export_rows, import_products
+from .sales import post_sale
+from .receipts import receipt_etag, render_receipt, schedule_receipt, store_receipt, stored_receipt
+from .rollups import sales_report as build_sales_report
+from .listings import listing_filters
+from .metrics import render_prometheus
+from .repositories import get_repository, sale_transaction
+from .outbox import enqueue_product, enqueue_customer, enqueue_sale
+
+RECEIPT_MAX_AGE = 60 * 60 * 24 * 365
+
+def _pager_urls(request, page) -> dict:
+    """Query strings for the first and next pages, keeping the active filters."""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    urls = {'first_page_url': '', 'next_page_url': ''}
+    if request.GET.get('cursor'):
+        urls['first_page_url'] = '?' + params.urlencode()
+    if page.has_next:
+        params['cursor'] = page.next_cursor
+        urls['next_page_url'] = '?' + params.urlencode()
+    return urls
+
 
 def product_list(request):
-    if firebase_sor_enabled():
-        try:
-            products = list_products()
-        except Exception:
-            products = Product.objects.all().order_by('name')
-    else:
-        products = Product.objects.all().order_by('name')
-    return render(request, 'inventory/product_list.html', {'products': products})
+    filters = listing_filters(request.GET)
+    cursor = request.GET.get('cursor')
+    page = get_repository().product_page(filters, cursor)
+    return render(request, 'inventory/product_list.html', {
+        'products': page,
+        'filters': filters,
+        **_pager_urls(request, page),
+    })
 
 def product_create(request):
     if request.method == 'POST':
         form = ProductForm(request.POST)
         if form.is_valid():
-            product = form.save()
-            # Mirror to Firestore (best-effort)
-            try:
-                upsert_product(product)
-            except Exception:
-                pass
+            # Mirror to Firestore via the outbox, committed with the product
+            with transaction.atomic():
+                product = form.save()
+                enqueue_product(product)
             messages.success(request, 'Product created successfully.')
             return redirect('product_list')
     else:
@@ -41,38 +60,60 @@ def product_create(request):
 def product_edit(request, pk):
     product = get_object_or_404(Product, pk=pk)
     if request.method == 'POST':
+        stocked = product.quantity
         form = ProductForm(request.POST, instance=product)
         if form.is_valid():
-            product = form.save()
-            try:
-                upsert_product(product)
-            except Exception:
-                pass
+            with transaction.atomic():
+                product = form.save()
+                enqueue_product(product)
+            if product.quantity != stocked:
+                # Backends that own stock (sharded Firestore counters, memory) apply the edit too
+                try:
+                    get_repository().adjust_stock(product.id, product.quantity - stocked)
+                except Exception:
+                    messages.warning(request, 'Stock was saved but could not be synced; run shard_stock --reset for this product.')
             messages.success(request, 'Product updated successfully.')
             return redirect('product_list')
     else:
         form = ProductForm(instance=product)
     return render(request, 'inventory/product_form.html', {'form': form})
 
-def customer_list(request):
-    if firebase_sor_enabled():
-        try:
-            customers = list_customers()
-        except Exception:
-            customers = Customer.objects.all().order_by('name')
+def product_import(request):
+    result = None
+    if request.method == 'POST':
+        form = CatalogImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            result = import_products(decode_lines(form.cleaned_data['file'].file))
+            if result.failed or result.skipped:
+                messages.warning(request, f'Imported with {result.failed} failed and {result.skipped} skipped rows.')
+            else:
+                messages.success(request, 'Catalog imported successfully.')
     else:
-        customers = Customer.objects.all().order_by('name')
-    return render(request, 'inventory/customer_list.html', {'customers': customers})
+        form = CatalogImportForm()
+    return render(request, 'inventory/product_import.html', {'form': form, 'result': result})
+
+def product_export(request):
+    response = StreamingHttpResponse(export_rows(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="products.csv"'
+    return response
+
+def customer_list(request):
+    filters = listing_filters(request.GET)
+    cursor = request.GET.get('cursor')
+    page = get_repository().customer_page(filters, cursor)
+    return render(request, 'inventory/customer_list.html', {
+        'customers': page,
+        'filters': filters,
+        **_pager_urls(request, page),
+    })
 
 def customer_create(request):
     if request.method == 'POST':
         form = CustomerForm(request.POST)
         if form.is_valid():
-            customer = form.save()
-            try:
-                upsert_customer(customer)
-            except Exception:
-                pass
+            with transaction.atomic():
+                customer = form.save()
+                enqueue_customer(customer)
             messages.success(request, 'Customer created successfully.')
             return redirect('customer_list')
     else:
@@ -82,21 +123,21 @@ def customer_create(request):
 from django.http import JsonResponse
 from django.db import connection
 import os
-from .firebase import get_firestore_client, firebase_enabled
+from .firebase import (
+    firebase_enabled, firestore_breaker, firestore_init_error, get_firestore_client, reset_firestore_client,
+)
+from .firestore_repo import cache_stats
 from django.utils import timezone
 
-@transaction.atomic
 def create_sale(request):
     if request.method == 'POST':
         # Handle quick-add customer
         if 'quick_add_customer' in request.POST:
             customer_form = CustomerForm(request.POST)
             if customer_form.is_valid():
-                customer = customer_form.save()
-                try:
-                    upsert_customer(customer)
-                except Exception:
-                    pass
+                with transaction.atomic():
+                    customer = customer_form.save()
+                    enqueue_customer(customer)
                 return JsonResponse({
                     'success': True,
                     'customer_id': customer.id,
@@ -111,58 +152,42 @@ def create_sale(request):
         # Handle normal sale creation
         sale_form = SaleForm(request.POST)
         item_formset = SaleItemFormSet(request.POST)
+        customer_form = CustomerForm()  # For quick-add modal when re-rendering
         
+        # Validation and re-rendering stay outside the transaction; only the
+        # writes below hold locks.
         if sale_form.is_valid() and item_formset.is_valid():
             # Aggregate requested quantities per product
+            lines = item_formset.lines()
             requested = {}
-            cleaned_items = []
-            for form in item_formset:
-                if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                    prod = form.cleaned_data['product']
-                    qty = int(form.cleaned_data['quantity'])
-                    requested[prod.id] = requested.get(prod.id, 0) + qty
-                    cleaned_items.append(form)
-
-            # If using Firestore as SoR, perform transactional stock check/decrement first
-            if firebase_sor_enabled():
-                try:
-                    _new_qty_map = reserve_and_decrement_stock(requested)
-                except ValueError as ve:
-                    messages.error(request, str(ve))
-                    transaction.set_rollback(True)
-                    return redirect('create_sale')
-                except Exception:
-                    messages.error(request, 'Stock check failed. Please try again.')
-                    transaction.set_rollback(True)
-                    return redirect('create_sale')
-
-            sale = sale_form.save(commit=False)
-            sale.total_amount = 0
-            sale.save()
-
-            total = 0
-            for form in cleaned_items:
-                item = form.save(commit=False)
-                item.sale = sale
-                item.unit_price = item.product.selling_price
-
-                # Validate stock when not using Firestore SoR
-                if not firebase_sor_enabled():
-                    if item.quantity > item.product.quantity:
-                        messages.error(request, f'Only {item.product.quantity} units available for {item.product.name}')
-                        transaction.set_rollback(True)
-                        return redirect('create_sale')
-
-                item.save()
-                total += item.total_price
-
-            sale.total_amount = total
-            sale.save()
-            # Write canonical sale and mirror product quantities in Firestore (best-effort)
+            for pid, qty in lines:
+                requested[pid] = requested.get(pid, 0) + qty
+
+            repo = get_repository()
+            # Backends that own stock (Firestore SoR, memory) check and decrement it first
             try:
-                write_sale_and_sync_products(sale)
+                reserved = repo.reserve_stock(requested)
+            except ValueError as ve:
+                messages.error(request, str(ve))
+                return redirect('create_sale')
             except Exception:
-                pass
+                messages.error(request, 'Stock check failed. Please try again.')
+                return redirect('create_sale')
+
+            try:
+                # The reservation is given back if the sale's transaction does not commit
+                with sale_transaction(repo, requested, reserved):
+                    # Lock, validate (when the backend did not reserve), decrement and insert in bulk
+                    sale = sale_form.save(commit=False)
+                    post_sale(sale, lines, check_stock=not reserved)
+                    repo.record_sale(sale)
+
+                    # Queue canonical sale and product quantity mirrors for Firestore
+                    enqueue_sale(sale)
+                    schedule_receipt(sale)
+            except ValueError as ve:
+                messages.error(request, str(ve))
+                return redirect('create_sale')
 
             messages.success(request, f'Sale #{sale.invoice_number} created successfully.')
             return redirect('sale_receipt', pk=sale.pk)
@@ -177,42 +202,72 @@ def create_sale(request):
         'customer_form': customer_form,  # Pass the customer form to template
     })
 
+def _receipt_html(pk):
+    """Stored receipt, or render and store it (sales predating stored receipts)."""
+    html_gz = stored_receipt(pk)
+    if html_gz is not None:
+        return html_gz
+    sale = get_repository().get_sale(pk)
+    if isinstance(sale, Sale):
+        return store_receipt(sale)
+    if sale:
+        return render_receipt(sale)
+    raise Http404('Sale not found')
+
 def sale_receipt(request, pk):
-    sale = None
-    if firebase_sor_enabled():
-        try:
-            sale = get_sale_for_receipt(pk)
-        except Exception:
-            sale = None
-    if not sale:
-        sale = get_object_or_404(Sale, pk=pk)
-    html = render_to_string('inventory/receipt.html', {'sale': sale})
-    return HttpResponse(html)
+    """Gzipped receipt for a sale, revalidated by ETag without touching any store.
 
-def dashboard(request):
-    if firebase_sor_enabled():
-        try:
-            products = list_products()
-            total_products = len(products)
-            low_stock_products = [p for p in products if int(p.get('quantity', 0)) <= 5]
-            recent = list_recent_sales(5)
-            context = {
-                'total_products': total_products,
-                'low_stock_products': low_stock_products,
-                'recent_sales': recent,
-            }
-        except Exception:
-            context = {
-                'total_products': Product.objects.count(),
-                'low_stock_products': Product.objects.filter(quantity__lte=5),
-                'recent_sales': Sale.objects.order_by('-created_at')[:5],
-            }
+    The ETag only depends on the sale id and template version, so a matching
+    If-None-Match gets a 304 even for an id that does not exist (or no longer
+    does). That is deliberate: sale ids are never reused and receipts are
+    immutable, so a client can only hold an ETag it was once given for that id
+    and its cached copy is still the right one. A sale deleted in the admin
+    keeps answering 304 to such clients until their copy expires
+    (RECEIPT_MAX_AGE); requests without a matching ETag get a 404.
+    """
+    etag = receipt_etag(pk)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        return _receipt_response(request, etag, None)
+    return _receipt_response(request, etag, _receipt_html(pk))
+
+def _receipt_response(request, etag, html_gz):
+    """Receipt response for gzipped HTML, or 304 Not Modified when ``html_gz`` is None."""
+    if html_gz is None:
+        response = HttpResponseNotModified()
     else:
-        context = {
-            'total_products': Product.objects.count(),
-            'low_stock_products': Product.objects.filter(quantity__lte=5),
-            'recent_sales': Sale.objects.order_by('-created_at')[:5],
-        }
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(html_gz)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(html_gz))
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=RECEIPT_MAX_AGE, immutable=True)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+def _report_date(value, default):
+    try:
+        return date.fromisoformat(value) if value else default
+    except ValueError:
+        return default
+
+def sales_report(request):
+    today = timezone.localdate()
+    start = _report_date(request.GET.get('start'), today.replace(day=1))
+    end = _report_date(request.GET.get('end'), today)
+    return render(request, 'inventory/reports.html', {
+        'start': start,
+        'end': end,
+        'month_start': today.replace(day=1),
+        'year_start': today.replace(month=1, day=1),
+        'today': today,
+        'report': build_sales_report(start, end),
+    })
+
+def dashboard(request):
+    repo = get_repository()
+    context = repo.inventory_summary()
+    context['recent_sales'] = repo.recent_sales(5)
     return render(request, 'inventory/dashboard.html', context)
 
 
@@ -259,11 +314,27 @@ def db_status(request):
     })
 
 
+def metrics(request):
+    """Request and operation totals of this worker in Prometheus text format.
+    Protected by token: query param `token` or an `Authorization: Bearer` header
+    must match METRICS_TOKEN (falls back to DB_STATUS_TOKEN if the former is not set).
+    """
+    expected = os.environ.get('METRICS_TOKEN') or os.environ.get('DB_STATUS_TOKEN')
+    supplied = request.GET.get('token')
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if auth.startswith('Bearer '):
+        supplied = auth[len('Bearer '):].strip()
+    if not expected or supplied != expected:
+        return HttpResponse('Forbidden', status=403)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def firebase_status(request):
     """Return JSON with Firebase/Firestore status, optional write test.
     Protected by token: query param `token` must match FIREBASE_STATUS_TOKEN
     (falls back to DB_STATUS_TOKEN if the former is not set).
-    Optional: provide write=1 to write a health document.
+    Optional: provide write=1 to write a health document, reset=1 to close the
+    circuit breaker and recreate the client.
     """
     expected = os.environ.get('FIREBASE_STATUS_TOKEN') or os.environ.get('DB_STATUS_TOKEN')
     supplied = request.GET.get('token')
@@ -271,6 +342,10 @@ def firebase_status(request):
         return HttpResponse('Forbidden', status=403)
 
     enabled = firebase_enabled()
+    breaker = firestore_breaker()
+    if request.GET.get('reset') in ('1', 'true', 'yes'):
+        breaker.reset()
+        reset_firestore_client()
     client = get_firestore_client()
     error = None
     ok = bool(client)
@@ -280,7 +355,7 @@ def firebase_status(request):
     if ok and request.GET.get('write') in ('1', 'true', 'yes'):
         write_attempted = True
         try:
-            client.collection('health_checks').add({
+            breaker.call(client.collection('health_checks').add, {
                 'source': 'inventory-app',
                 'timestamp': timezone.now().isoformat(),
             })
@@ -290,7 +365,7 @@ def firebase_status(request):
             write_ok = False
 
     if not ok and not error:
-        error = 'Firestore client not initialized (check env vars and library)'
+        error = firestore_init_error() or 'Firestore client not initialized (check env vars and library)'
 
     return JsonResponse({
         'enabled': enabled,
@@ -298,4 +373,6 @@ def firebase_status(request):
         'write_attempted': write_attempted,
         'write_ok': write_ok,
         'error': error,
+        'cache': cache_stats(),
+        'breaker': breaker.snapshot(),
     })
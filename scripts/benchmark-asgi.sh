@@ -0,0 +1,78 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Compare the sync gunicorn deployment with uvicorn workers + ASYNC_VIEWS under
+# the same read-heavy load (dashboard, listings, receipts, product API).
+#
+# Remote-store latency is simulated offline: the in-memory repository behind
+# INVENTORY_LATENCY_MS stands in for Firestore. Set BACKEND=firestore to
+# benchmark the real project instead (FIREBASE_* must be configured).
+# Checkouts are left out of the default mix: with the memory backend each
+# worker process holds its own copy of the stock.
+#
+#   bash scripts/benchmark-asgi.sh            # defaults below
+#   LATENCY_MS=100 CONCURRENCY=64 bash scripts/benchmark-asgi.sh
+
+WORKERS=${WORKERS:-2}
+CONCURRENCY=${CONCURRENCY:-32}
+DURATION=${DURATION:-20}
+LATENCY_MS=${LATENCY_MS:-50}
+BACKEND=${BACKEND:-memory}
+MIX=${MIX:-browse=50,price=35,receipt=15}
+OUT=${OUT:-benchmark-results}
+HOST=127.0.0.1
+PORT=${PORT:-8765}
+
+export INVENTORY_BACKEND="$BACKEND" INVENTORY_LATENCY_MS="$LATENCY_MS"
+# Plain HTTP on localhost: no SSL redirect, no slow-request log noise
+export DJANGO_DEBUG=true METRICS_SLOW_REQUEST_MS=0
+mkdir -p "$OUT"
+SERVER_PID=
+
+wait_for_server() {
+    # Any HTTP answer means a worker has booted (the master binds the port first)
+    python - "http://$HOST:$PORT/api/catalog/" <<'PY'
+import sys, time, urllib.error, urllib.request
+deadline = time.time() + 30
+while time.time() < deadline:
+    try:
+        urllib.request.urlopen(sys.argv[1], timeout=2)
+        sys.exit(0)
+    except urllib.error.HTTPError:
+        sys.exit(0)
+    except OSError:
+        time.sleep(0.2)
+sys.exit('server did not start')
+PY
+}
+
+stop_server() {
+    if [ -n "$SERVER_PID" ]; then
+        kill "$SERVER_PID" 2>/dev/null || true
+        wait "$SERVER_PID" 2>/dev/null || true
+        SERVER_PID=
+    fi
+}
+trap stop_server EXIT
+
+run() {
+    local name=$1; shift
+    echo "== $name: $*"
+    "$@" --bind "$HOST:$PORT" --workers "$WORKERS" --log-level warning &
+    SERVER_PID=$!
+    wait_for_server
+    python manage.py loadtest --url "http://$HOST:$PORT" --concurrency "$CONCURRENCY" \
+        --duration "$DURATION" --mix "$MIX" --json "$OUT/$name.json"
+    stop_server
+}
+
+ASYNC_VIEWS=false run sync gunicorn autoparts.wsgi:application
+ASYNC_VIEWS=true run async gunicorn autoparts.asgi:application -k uvicorn_worker.UvicornWorker
+
+python - "$OUT" <<'PY'
+import json, sys
+rows = {name: json.load(open(f'{sys.argv[1]}/{name}.json')) for name in ('sync', 'async')}
+print(f"\n{'':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+for name, s in rows.items():
+    print(f"{name:<8}{s['throughput']:>9.1f}{s['p50']:>9.1f}{s['p95']:>9.1f}{s['p99']:>9.1f}{s['errors']:>8}")
+PY